@@ -0,0 +1,402 @@
+"""
+Classificação de severidade dos alertas pelas palavras-chave (alerts.levels) e
+expressões regulares (alerts.patterns) do config.json
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger('wegnots.alert_classifier')
+
+DEFAULT_ALERTS_CONFIG = 'config.json'
+# Níveis do mais para o menos grave; níveis desconhecidos ficam abaixo destes
+SEVERITIES = ('critical', 'important', 'low')
+# Título do alerta por severidade (None: nenhuma palavra-chave encontrada)
+SEVERITY_LABELS = {
+    'critical': '🚨 ALERTA CRÍTICO',
+    'important': '⚠️ ALERTA IMPORTANTE',
+    'low': 'ℹ️ INFORMATIVO',
+    None: '📨 NOVO EMAIL',
+}
+
+# Trecho máximo de assunto + corpo examinado pelas expressões regulares
+MAX_PATTERN_SCAN = 64 * 1024
+# Tempo máximo de cada expressão com risco de backtracking por e-mail; as que estouram são desativadas até o config.json mudar
+PATTERN_TIMEOUT = 0.5
+# Espera pelo início do processo das expressões regulares
+WORKER_STARTUP_TIMEOUT = 10.0
+# Diretório que contém o pacote app, para o processo das expressões o importar
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Onde procurar um config.json relativo que não está no diretório atual: monitor/ e a raiz do projeto
+ALERTS_CONFIG_DIRS = (_PACKAGE_ROOT, os.path.dirname(_PACKAGE_ROOT))
+# Assinatura inicial do classificador, diferente de qualquer estado do arquivo (inclusive ausente)
+_NOT_LOADED = object()
+
+# Marcas combinantes (acentos) deixadas pela decomposição NFKD
+_COMBINING = re.compile('[\\u0300-\\u036f]')
+
+
+def fold(text) -> str:
+    """Normaliza para comparação: sem diferença de maiúsculas nem de acentos"""
+    return _COMBINING.sub('', unicodedata.normalize('NFKD', str(text or '').casefold()))
+
+
+def find_alerts_config(path: str = DEFAULT_ALERTS_CONFIG) -> str:
+    """
+    Caminho do arquivo de regras. Um caminho relativo que não existe no diretório
+    atual é procurado em monitor/ e na raiz do projeto, onde fica o config.json.
+    """
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    for directory in ALERTS_CONFIG_DIRS:
+        candidate = os.path.join(directory, path)
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def alert_type_for(severity: Optional[str]) -> str:
+    """Título exibido no alerta para a severidade"""
+    return SEVERITY_LABELS.get(severity, SEVERITY_LABELS[None])
+
+
+@dataclass
+class Classification:
+    """Severidade mais alta encontrada e as palavras-chave que a justificam"""
+    severity: Optional[str] = None
+    keywords: List[str] = field(default_factory=list)
+    rules: List[str] = field(default_factory=list)
+
+
+class KeywordAutomaton:
+    """
+    Autômato de Aho-Corasick com as palavras-chave de todos os níveis. Uma única
+    passada pelo texto encontra todas as ocorrências, independentemente de
+    quantas palavras-chave existam.
+    """
+
+    def __init__(self, levels: Dict[str, Iterable[str]]):
+        self.levels = _ordered_levels(levels)
+        self.rank = {level: index for index, level in enumerate(self.levels)}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Por estado: [(palavra-chave, nível)] de todos os padrões que terminam ali
+        self._out: List[List[Tuple[str, str]]] = [[]]
+        for level, keywords in levels.items():
+            for keyword in keywords or ():
+                self._add(fold(keyword).strip(), level, keyword)
+        self._build_failure_links()
+        self._best = [min((self.rank[level] for _, level in out), default=None) for out in self._out]
+
+    def _add(self, word: str, level: str, keyword: str):
+        if not word:
+            return
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((keyword, level))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    @property
+    def size(self) -> int:
+        """Número de estados do autômato"""
+        return len(self._goto)
+
+    def scan(self, text: str) -> Classification:
+        """Percorre o texto já normalizado; para cedo se encontrar o nível mais grave"""
+        goto, fail, best = self._goto, self._fail, self._best
+        top = None
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best[state] is not None and (top is None or best[state] < top):
+                top = best[state]
+                hit = state
+                if top == 0:
+                    break
+        if top is None:
+            return Classification()
+        severity = self.levels[top]
+        return Classification(severity, [keyword for keyword, level in self._out[hit] if level == severity])
+
+
+def _ordered_levels(levels: Iterable[str]) -> List[str]:
+    return list(SEVERITIES) + sorted(set(levels) - set(SEVERITIES))
+
+
+def _nested_repeat(items, inside: bool = False) -> bool:
+    """A expressão já analisada tem uma repetição dentro de outra (ex.: ``(a+)+``)"""
+    for op, arg in items:
+        name = op.name
+        if name in ('MAX_REPEAT', 'MIN_REPEAT'):
+            repeats = arg[1] > 1
+            if (inside and repeats) or _nested_repeat(arg[2], inside or repeats):
+                return True
+        elif name == 'SUBPATTERN' and _nested_repeat(arg[-1], inside):
+            return True
+        elif name == 'BRANCH' and any(_nested_repeat(branch, inside) for branch in arg[1]):
+            return True
+        elif name in ('ASSERT', 'ASSERT_NOT') and _nested_repeat(arg[1], inside):
+            return True
+        elif name == 'ATOMIC_GROUP' and _nested_repeat(arg, inside):
+            return True
+    return False
+
+
+def is_risky(pattern: str) -> bool:
+    """Expressão sujeita a backtracking catastrófico (repetições aninhadas)"""
+    try:
+        return _nested_repeat(sre_parse.parse(pattern, re.IGNORECASE))
+    except (re.error, AttributeError, IndexError, TypeError):
+        return True
+
+
+class PatternEngine:
+    """
+    Expressões de ``alerts.patterns`` compiladas uma vez, com um ``re.search`` por
+    regra em até ``max_chars`` caracteres do e-mail; todas as regras que casam são
+    informadas.
+
+    O ``re`` não solta o GIL nem pode ser interrompido, então uma expressão com
+    repetições aninhadas (``is_risky``) travaria o processo inteiro. Com ``isolate``
+    só essas rodam em um processo próprio (``app.core.pattern_worker``), com limite
+    de ``timeout``; a que estoura o tempo é desativada até o config.json mudar.
+    """
+
+    def __init__(self, patterns: Dict[str, Iterable[str]], max_chars: int = MAX_PATTERN_SCAN,
+                 timeout: float = PATTERN_TIMEOUT, isolate: bool = True):
+        self.patterns = patterns
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.isolate = isolate
+        self.disabled: Set[int] = set()
+        self.rules: List[Tuple[str, str]] = []
+        self._compiled: Dict[int, re.Pattern] = {}
+        self._safe: List[int] = []
+        self.risky: List[int] = []
+        for level in _ordered_levels(patterns):
+            for pattern in patterns.get(level) or ():
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    if isolate:
+                        logger.error(f"Expressão inválida em alerts.patterns.{level} ignorada: {pattern!r} ({e})")
+                    continue
+                index = len(self.rules)
+                self.rules.append((level, pattern))
+                self._compiled[index] = compiled
+                (self.risky if is_risky(pattern) else self._safe).append(index)
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+        self._replies: Optional[queue.Queue] = None
+        self.stats = {'scans': 0, 'chars': 0, 'timeouts': 0, 'restarts': 0}
+
+    def match(self, text: str) -> Dict[int, str]:
+        """Regras sem risco encontradas no texto: {índice da regra: trecho}"""
+        matched: Dict[int, str] = {}
+        for rule in self._safe:
+            matched.update(self.match_rule(text, rule))
+        return matched
+
+    def match_rule(self, text: str, rule: int) -> Dict[int, str]:
+        """Busca direta de uma única regra"""
+        compiled = self._compiled.get(rule)
+        found = compiled.search(text) if compiled else None
+        return {rule: found.group(0)} if found else {}
+
+    def scan(self, text: str) -> Dict[int, str]:
+        """Regras encontradas no texto (limitado a ``max_chars``): {índice da regra: trecho}"""
+        if not self._compiled:
+            return {}
+        text = text[:self.max_chars]
+        matched = self.match(text)
+        risky = [rule for rule in self.risky if rule not in self.disabled]
+        if not self.isolate:
+            for rule in risky:
+                matched.update(self.match_rule(text, rule))
+            return matched
+
+        with self._lock:
+            self.stats['scans'] += 1
+            self.stats['chars'] += len(text)
+            for rule in risky:
+                found = self._request({'text': text, 'rule': rule})
+                if found is None:
+                    self.stats['timeouts'] += 1
+                    self.disabled.add(rule)
+                    logger.error(f"Expressão de alerts.patterns desativada até o config.json mudar por exceder "
+                                 f"{self.timeout}s: {self.rules[rule][1]!r}")
+                else:
+                    matched.update(found)
+        return matched
+
+    def _request(self, message: Dict) -> Optional[Dict[int, str]]:
+        """Resposta do processo de busca; None se estourou o tempo (o processo é encerrado)"""
+        if self._process is None and not self._start():
+            return {}
+        try:
+            self._process.stdin.write(json.dumps(message) + '\n')
+            self._process.stdin.flush()
+            reply = self._replies.get(timeout=self.timeout)
+        except queue.Empty:
+            self._stop()
+            return None
+        except OSError as e:
+            reply = None
+            logger.error(f"Processo das expressões de alerts.patterns falhou: {e}")
+        if reply is None:
+            self._stop()
+            return {}
+        return {int(rule): excerpt for rule, excerpt in reply['matched'].items()}
+
+    def _start(self) -> bool:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [_PACKAGE_ROOT, env.get('PYTHONPATH')]))
+        try:
+            self._process = subprocess.Popen([sys.executable, '-m', 'app.core.pattern_worker'], env=env,
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             text=True, encoding='utf-8')
+        except OSError as e:
+            logger.error(f"Não foi possível iniciar o processo das expressões de alerts.patterns: {e}")
+            self._process = None
+            return False
+        self._replies = queue.Queue()
+        threading.Thread(target=_read_replies, args=(self._process.stdout, self._replies),
+                         name='alert-patterns-reader', daemon=True).start()
+        self.stats['restarts'] += 1
+        try:
+            self._process.stdin.write(json.dumps({'patterns': self.patterns}) + '\n')
+            self._process.stdin.flush()
+            if self._replies.get(timeout=WORKER_STARTUP_TIMEOUT):
+                return True
+        except (OSError, queue.Empty):
+            pass
+        logger.error("Processo das expressões de alerts.patterns não iniciou; e-mail classificado sem expressões")
+        self._stop()
+        return False
+
+    def _stop(self):
+        if self._process:
+            self._process.kill()
+            self._process.wait(1)
+            self._process.stdin.close()
+        self._process = self._replies = None
+
+    def close(self):
+        """Encerra o processo de busca, se houver"""
+        with self._lock:
+            self._stop()
+
+
+def _read_replies(stream, replies: queue.Queue):
+    """Repassa as respostas do processo de busca; None quando ele termina"""
+    for line in stream:
+        replies.put(json.loads(line))
+    replies.put(None)
+    stream.close()
+
+
+class AlertClassifier:
+    """
+    Atribui severidade aos e-mails a partir de ``alerts.levels`` (palavras-chave)
+    e ``alerts.patterns`` (expressões regulares) do config.json.
+
+    Autômato e expressões são compilados uma vez e reutilizados; a cada
+    classificação só o mtime/tamanho do arquivo é consultado, e tudo é recompilado
+    quando ele muda. Sem arquivo (ou sem regras) todo e-mail fica sem severidade.
+    """
+
+    def __init__(self, path: str = DEFAULT_ALERTS_CONFIG):
+        self.path = find_alerts_config(path)
+        self._lock = threading.Lock()
+        self._signature = _NOT_LOADED
+        self._compiled: Tuple[KeywordAutomaton, PatternEngine] = (KeywordAutomaton({}), PatternEngine({}))
+        self.rebuilds = 0
+
+    @staticmethod
+    def _lists(section) -> Dict[str, List[str]]:
+        return {level: [item for item in items if isinstance(item, str)]
+                for level, items in (section or {}).items() if isinstance(items, list)}
+
+    def _load(self) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            alerts = json.load(f).get('alerts', {})
+        return self._lists(alerts.get('levels')), self._lists(alerts.get('patterns'))
+
+    def compiled(self) -> Tuple[KeywordAutomaton, PatternEngine]:
+        """Autômato e expressões atuais, recompilados se o config.json mudou desde a última compilação"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return self._compiled
+
+        with self._lock:
+            if signature != self._signature:
+                if signature is None:
+                    logger.warning(f"Arquivo de regras de alerta {os.path.abspath(self.path)} não encontrado; "
+                                   f"e-mails ficarão sem severidade")
+                try:
+                    levels, patterns = self._load() if signature else ({}, {})
+                    previous = self._compiled
+                    self._compiled = (KeywordAutomaton(levels), PatternEngine(patterns))
+                    previous[1].close()
+                    self.rebuilds += 1
+                    logger.info(f"Classificador de alertas compilado de {self.path}: "
+                                f"{sum(map(len, levels.values()))} palavras-chave "
+                                f"({self._compiled[0].size} estados), {len(self._compiled[1].rules)} expressões")
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.error(f"Erro ao carregar alerts de {self.path}: {e}")
+                self._signature = signature
+            return self._compiled
+
+    def classify(self, subject, body) -> Classification:
+        """Severidade do e-mail pelo assunto e pelo corpo"""
+        automaton, patterns = self.compiled()
+        result = automaton.scan(fold(subject) + '\n' + fold(body))
+        matched = patterns.scan(f"{subject or ''}\n{body or ''}")
+        if not matched:
+            return result
+
+        rules = [patterns.rules[index] for index in sorted(matched)]
+        candidates = {level for level, _ in rules} | ({result.severity} if result.severity else set())
+        severity = next(level for level in _ordered_levels(candidates) if level in candidates)
+        return Classification(severity, result.keywords if result.severity == severity else [],
+                              [pattern for level, pattern in rules if level == severity])
@@ -0,0 +1,256 @@
+"""
+Cliente IMAP não bloqueante baseado em asyncio streams com TLS
+"""
+
+import re
+import ssl
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('wegnots.async_imap')
+
+DEFAULT_TIMEOUT = 30.0
+
+_LITERAL = re.compile(rb'\{(\d+)\}$')
+_UNTAGGED_NUMERIC = re.compile(rb'^(\d+) ([A-Za-z-]+)(?: (.*))?$', re.DOTALL)
+_UNTAGGED = re.compile(rb'^([A-Za-z-]+)(?: (.*))?$', re.DOTALL)
+_RESPONSE_CODE = re.compile(rb'^\[([A-Za-z-]+)(?: ([^\]]*))?\]')
+
+
+class AsyncIMAPError(Exception):
+    """Exceção para respostas NO/BAD ou falhas de protocolo do cliente assíncrono."""
+    pass
+
+
+class AsyncIMAPClient:
+    """
+    Cliente IMAP4rev1 mínimo (LOGIN, SELECT, STATUS, UID SEARCH/FETCH/STORE, STORE, IDLE).
+
+    Os métodos retornam ``(status, data)`` no mesmo formato do imaplib, de modo que
+    os parsers de ``imap_protocol`` funcionam com ambos os clientes. Literais de
+    respostas FETCH aparecem como tuplas ``(cabeçalho, conteúdo)``.
+    """
+
+    def __init__(self, host: str, port: int = 993, ssl_context: Optional[ssl.SSLContext] = None,
+                 timeout: float = DEFAULT_TIMEOUT, use_ssl: bool = True):
+        self.host = host
+        self.port = port
+        self.ssl_context = (ssl_context or ssl.create_default_context()) if use_ssl else None
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.capabilities = set()
+        self.untagged_responses: Dict[str, List] = {}
+        self._tag_counter = 0
+        # Um comando por vez por conexão; conexões diferentes rodam em paralelo
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        """Abre a conexão TLS e lê a saudação do servidor"""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl_context),
+            self.timeout
+        )
+        greeting = await asyncio.wait_for(self._read_response(), self.timeout)
+        first = greeting[0] if isinstance(greeting[0], bytes) else greeting[0][0]
+        if not first.upper().startswith((b'* OK', b'* PREAUTH')):
+            raise AsyncIMAPError(f"Saudação inesperada de {self.host}: {first!r}")
+        await self.capability()
+
+    async def capability(self) -> Tuple[str, List]:
+        """Atualiza as capacidades anunciadas pelo servidor"""
+        self.untagged_responses.pop('CAPABILITY', None)
+        status, _ = await self._command('CAPABILITY')
+        data = self.untagged_responses.pop('CAPABILITY', [])
+        if status == 'OK' and data:
+            self.capabilities = set(data[-1].decode(errors='replace').upper().split())
+        return status, data
+
+    async def login(self, username: str, password: str) -> Tuple[str, List]:
+        """Autentica com LOGIN (credenciais enviadas como strings entre aspas)"""
+        status, data = await self._command('LOGIN', _quote(username), _quote(password), check=True)
+        # Muitos servidores anunciam capacidades adicionais (ex.: IDLE) só após o login
+        await self.capability()
+        return status, data
+
+    async def select(self, mailbox: str = 'INBOX', readonly: bool = False) -> Tuple[str, List]:
+        """Seleciona uma caixa; retorna a quantidade de mensagens como o imaplib"""
+        self.untagged_responses = {}
+        status, _ = await self._command('EXAMINE' if readonly else 'SELECT', _quote(mailbox), check=True)
+        return status, self.untagged_responses.get('EXISTS', [None])[-1:]
+
+    async def unselect(self) -> Tuple[str, List]:
+        """Sai da caixa selecionada sem expurgar mensagens (RFC 3691)"""
+        return await self._command('UNSELECT', check=True)
+
+    async def status(self, mailbox: str, names: str) -> Tuple[str, List]:
+        """Consulta atributos de uma caixa não selecionada, ex.: names='(UIDNEXT UNSEEN)'"""
+        self.untagged_responses.pop('STATUS', None)
+        status, _ = await self._command('STATUS', _quote(mailbox), names, check=True)
+        return status, self.untagged_responses.pop('STATUS', [None])
+
+    async def uid(self, command: str, *args) -> Tuple[str, List]:
+        """Executa UID SEARCH, UID FETCH ou UID STORE"""
+        command = command.upper()
+        if command not in ('SEARCH', 'FETCH', 'STORE'):
+            raise AsyncIMAPError(f"Comando UID não suportado: {command}")
+        response_type = 'SEARCH' if command == 'SEARCH' else 'FETCH'
+        self.untagged_responses.pop(response_type, None)
+        status, _ = await self._command('UID', command, *[arg for arg in args if arg is not None], check=True)
+        return status, self.untagged_responses.pop(response_type, [None])
+
+    async def store(self, message_set: str, command: str, flags: str) -> Tuple[str, List]:
+        """Altera flags por número de sequência"""
+        self.untagged_responses.pop('FETCH', None)
+        status, _ = await self._command('STORE', message_set, command, flags, check=True)
+        return status, self.untagged_responses.pop('FETCH', [None])
+
+    async def idle(self, timeout: float) -> List[bytes]:
+        """
+        Entra em IDLE e aguarda até ``timeout`` segundos pela primeira resposta não
+        marcada (ex.: ``* 5 EXISTS``). Retorna as respostas recebidas após o DONE.
+        """
+        async with self._lock:
+            try:
+                return await self._idle(timeout)
+            except asyncio.TimeoutError:
+                self.close()
+                raise
+
+    async def _idle(self, timeout: float) -> List[bytes]:
+        tag = self._next_tag()
+        await self._send(tag + b' IDLE')
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise AsyncIMAPError(f"Conexão encerrada por {self.host} durante IDLE")
+            if line.startswith(b'+'):
+                break
+            if line.startswith(tag):
+                raise AsyncIMAPError(f"Servidor recusou IDLE: {line.strip()!r}")
+
+        events = []
+        try:
+            line = await asyncio.wait_for(self.reader.readline(), timeout)
+            if not line:
+                raise AsyncIMAPError(f"Conexão encerrada por {self.host} durante IDLE")
+            events.append(line.rstrip(b'\r\n'))
+        except asyncio.TimeoutError:
+            pass
+
+        await self._send(b'DONE')
+        while True:
+            response = await asyncio.wait_for(self._read_response(), self.timeout)
+            first = response[0] if isinstance(response[0], bytes) else response[0][0]
+            if first.startswith(tag):
+                status = first[len(tag):].strip().split(b' ', 1)[0].decode()
+                if status != 'OK':
+                    raise AsyncIMAPError(f"IDLE finalizado com {status}: {first!r}")
+                break
+            events.append(first)
+        return [event[2:] if event.startswith(b'* ') else event for event in events]
+
+    async def logout(self):
+        """Encerra a sessão e fecha o transporte"""
+        writer = self.writer
+        if not writer:
+            return
+        try:
+            await self._command('LOGOUT')
+        except Exception:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            self.reader = self.writer = None
+
+    def _next_tag(self) -> bytes:
+        self._tag_counter += 1
+        return f"W{self._tag_counter:04d}".encode()
+
+    async def _send(self, line: bytes):
+        self.writer.write(line + b'\r\n')
+        await self.writer.drain()
+
+    async def _command(self, name: str, *args, check: bool = False) -> Tuple[str, List]:
+        """Envia um comando e coleta as respostas até a resposta marcada"""
+        if not self.writer:
+            raise AsyncIMAPError(f"Não conectado a {self.host}")
+        async with self._lock:
+            tag = self._next_tag()
+            parts = [name] + [arg if isinstance(arg, str) else arg.decode() for arg in args]
+            await self._send(tag + b' ' + ' '.join(parts).encode())
+            try:
+                return await asyncio.wait_for(self._collect(tag, name, check), self.timeout)
+            except asyncio.TimeoutError:
+                # A resposta ficou pela metade no stream: a conexão não serve mais
+                self.close()
+                raise
+
+    def close(self):
+        """Fecha o transporte sem LOGOUT; o chamador precisa reconectar"""
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _collect(self, tag: bytes, name: str, check: bool) -> Tuple[str, List]:
+        while True:
+            response = await self._read_response()
+            first = response[0] if isinstance(response[0], bytes) else response[0][0]
+            if first.startswith(tag + b' '):
+                status, _, text = first[len(tag) + 1:].partition(b' ')
+                status = status.decode().upper()
+                if check and status != 'OK':
+                    raise AsyncIMAPError(f"{name} falhou em {self.host}: {status} {text.decode(errors='replace')}")
+                return status, [text]
+            if first.startswith(b'* '):
+                self._store_untagged(response)
+
+    async def _read_response(self) -> List:
+        """Lê uma resposta completa, incluindo literais, no formato do imaplib"""
+        parts = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise AsyncIMAPError(f"Conexão encerrada por {self.host}")
+            line = line.rstrip(b'\r\n')
+            match = _LITERAL.search(line)
+            if not match:
+                parts.append(line)
+                return parts
+            literal = await self.reader.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+
+    def _store_untagged(self, response: List):
+        """Guarda uma resposta não marcada em ``untagged_responses`` (mesmas chaves do imaplib)"""
+        first = response[0]
+        header = first[0] if isinstance(first, tuple) else first
+        body = header[2:]
+
+        match = _UNTAGGED_NUMERIC.match(body)
+        if match:
+            kind = match.group(2).decode().upper()
+            data = match.group(1) + (b' ' + match.group(3) if match.group(3) is not None else b'')
+            if kind in ('EXISTS', 'RECENT', 'EXPUNGE'):
+                data = match.group(1)
+        else:
+            match = _UNTAGGED.match(body)
+            if not match:
+                return
+            kind = match.group(1).decode().upper()
+            data = match.group(2) or b''
+            code = _RESPONSE_CODE.match(data)
+            if kind in ('OK', 'NO', 'BAD') and code:
+                self.untagged_responses.setdefault(code.group(1).decode().upper(), []).append(code.group(2))
+
+        head = (data, first[1]) if isinstance(first, tuple) else data
+        self.untagged_responses.setdefault(kind, []).extend([head] + response[1:])
+
+
+def _quote(value: str) -> str:
+    """Formata uma string IMAP entre aspas"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
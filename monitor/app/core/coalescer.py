@@ -0,0 +1,97 @@
+"""
+Agrupamento de rajadas de alertas por chat de destino
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List
+
+logger = logging.getLogger('wegnots.coalescer')
+
+# Janela em que alertas para o mesmo (token, chat_id) são retidos, em segundos
+DEFAULT_COALESCE_WINDOW = 5.0
+# A partir desta quantidade de alertas na janela, envia-se um único resumo
+DEFAULT_DIGEST_THRESHOLD = 5
+
+
+class AlertCoalescer:
+    """
+    Retém os alertas de cada destino por ``window`` segundos a partir do primeiro
+    e entrega o grupo inteiro a ``emit(destination, alerts)`` quando a janela
+    fecha. Cabe a ``emit`` decidir entre alertas individuais e um resumo.
+    """
+
+    def __init__(self, emit: Callable[[Hashable, List[Dict]], None], window: float = DEFAULT_COALESCE_WINDOW,
+                 threshold: int = DEFAULT_DIGEST_THRESHOLD, clock: Callable[[], float] = time.monotonic):
+        self.emit = emit
+        self.window = window
+        self.threshold = threshold
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._groups: Dict[Hashable, List[Dict]] = {}
+        self._due: Dict[Hashable, float] = {}
+        self._closed = False
+        self.stats = {'alerts': 0, 'groups': 0, 'digests': 0}
+        self._thread = threading.Thread(target=self._run, name='alert-coalescer', daemon=True)
+        self._thread.start()
+
+    def add(self, destination: Hashable, alert: Dict):
+        """Retém um alerta; a janela do destino começa no primeiro alerta retido"""
+        with self._cond:
+            if destination not in self._groups:
+                self._groups[destination] = []
+                self._due[destination] = self._clock() + self.window
+                self._cond.notify()
+            self._groups[destination].append(alert)
+            self.stats['alerts'] += 1
+
+    def _pop_due(self, flush_all: bool = False) -> List:
+        now = self._clock()
+        due = [destination for destination, at in self._due.items() if flush_all or at <= now]
+        groups = []
+        for destination in due:
+            del self._due[destination]
+            alerts = self._groups.pop(destination)
+            self.stats['groups'] += 1
+            if len(alerts) >= self.threshold:
+                self.stats['digests'] += 1
+            groups.append((destination, alerts))
+        return groups
+
+    def _emit(self, groups: List):
+        for destination, alerts in groups:
+            try:
+                self.emit(destination, alerts)
+            except Exception as e:
+                logger.error(f"Erro ao emitir {len(alerts)} alertas agrupados: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                groups = self._pop_due()
+                if not groups:
+                    timeout = min(self._due.values()) - self._clock() if self._due else None
+                    self._cond.wait(timeout)
+                    continue
+            self._emit(groups)
+
+    def flush(self):
+        """Emite imediatamente todos os grupos retidos"""
+        with self._cond:
+            groups = self._pop_due(flush_all=True)
+        self._emit(groups)
+
+    def close(self):
+        """Encerra a thread e emite o que ainda estiver retido"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return dict(self.stats, held=sum(len(alerts) for alerts in self._groups.values()))
@@ -0,0 +1,39 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Exceção para operações iniciadas após o fim do orçamento de tempo."""
+    pass
+
+
+class Deadline:
+    """
+    Orçamento de tempo de uma operação composta (ex.: a verificação de uma conta).
+
+    Cada comando recebe ``timeout_for(limite_do_comando)``: o menor valor entre o
+    limite próprio do comando e o tempo que ainda resta no orçamento.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget if budget is not None else None
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes (None para orçamento ilimitado)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Indica se o orçamento já se esgotou"""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout_for(self, command_timeout: Optional[float], operation: str = 'operação') -> Optional[float]:
+        """Timeout a aplicar ao próximo comando; levanta DeadlineExceeded se não resta tempo"""
+        remaining = self.remaining()
+        if remaining is None:
+            return command_timeout
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Prazo de {self.budget}s esgotado antes de {operation}")
+        return remaining if command_timeout is None else min(command_timeout, remaining)
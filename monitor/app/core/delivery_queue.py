@@ -0,0 +1,191 @@
+"""
+Fila de entrega de alertas: o polling IMAP enfileira e um pool de workers envia
+"""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger('wegnots.delivery_queue')
+
+DEFAULT_DELIVERY_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 1000
+# Com a fila cheia, o produtor fica bloqueado e registra um aviso a cada intervalo
+BACKPRESSURE_LOG_INTERVAL = 5.0
+
+_STOP = object()
+
+
+@dataclass
+class DeliveryJob:
+    """Alerta aguardando envio"""
+    payload: Dict
+    key: str = ''
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    # Estado do remetente entre tentativas (ex.: reserva de taxa já feita)
+    context: Dict = field(default_factory=dict)
+
+
+@dataclass
+class Retry:
+    """Resultado do handler pedindo nova tentativa após ``delay`` segundos"""
+    delay: float
+    reason: str = ''
+
+
+class DeliveryQueue:
+    """
+    Fila limitada com workers de entrega.
+
+    ``put`` bloqueia o produtor enquanto a fila está cheia (backpressure): o
+    polling desacelera em vez de descartar alertas. O handler retorna True/False
+    (entregue/falhou) ou ``Retry``, que reagenda o job sem ocupar um worker.
+    ``metrics`` informa a profundidade da fila e a idade do job mais antigo.
+    """
+
+    def __init__(self, handler: Callable[[DeliveryJob], Union[bool, Retry]], workers: int = DEFAULT_DELIVERY_WORKERS,
+                 maxsize: int = DEFAULT_QUEUE_SIZE, name: str = 'delivery'):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # id(job) -> instante de entrada, para a idade do job mais antigo
+        self._waiting: Dict[int, float] = {}
+        # Jobs reagendados: heap de (instante, sequência, job) movidos para a fila quando vencem
+        self._delayed: List[Tuple[float, int, DeliveryJob]] = []
+        self._delayed_changed = threading.Condition(self._lock)
+        self._sequence = itertools.count()
+        self._stats = {'enqueued': 0, 'delivered': 0, 'failed': 0, 'rescheduled': 0,
+                       'max_depth': 0, 'max_wait': 0.0}
+
+    def start(self):
+        """Inicia as threads de entrega"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._scheduler = threading.Thread(target=self._schedule_loop, name=f"{self.name}-scheduler", daemon=True)
+        self._scheduler.start()
+        logger.info(f"Fila de entrega '{self.name}' iniciada com {self.workers} workers")
+
+    def put(self, job: DeliveryJob, timeout: Optional[float] = None) -> bool:
+        """
+        Enfileira um job, bloqueando enquanto a fila estiver cheia.
+        Retorna False se a fila foi encerrada ou ``timeout`` se esgotou.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self._stop.is_set():
+            wait = BACKPRESSURE_LOG_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            try:
+                self._queue.put(job, timeout=wait)
+            except queue.Full:
+                logger.warning(f"Fila de entrega '{self.name}' cheia ({self._queue.maxsize} jobs); "
+                               f"aguardando workers liberarem espaço")
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                continue
+
+            with self._lock:
+                self._waiting[id(job)] = job.enqueued_at
+                self._stats['enqueued'] += 1
+                self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize())
+            return True
+        return False
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                with self._lock:
+                    self._waiting.pop(id(job), None)
+                    self._stats['max_wait'] = max(self._stats['max_wait'], time.monotonic() - job.enqueued_at)
+
+                job.attempts += 1
+                try:
+                    result = self.handler(job)
+                except Exception as e:
+                    logger.error(f"Erro ao entregar job {job.key}: {e}")
+                    result = False
+
+                if isinstance(result, Retry):
+                    self.schedule(job, result.delay)
+                    logger.debug(f"Job {job.key} reagendado em {result.delay:.1f}s ({result.reason})")
+                else:
+                    with self._lock:
+                        self._stats['delivered' if result else 'failed'] += 1
+            finally:
+                self._queue.task_done()
+
+    def schedule(self, job: DeliveryJob, delay: float):
+        """Devolve o job à fila após ``delay`` segundos, sem bloquear o chamador"""
+        with self._lock:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), job))
+            self._waiting[id(job)] = job.enqueued_at
+            self._stats['rescheduled'] += 1
+            self._delayed_changed.notify()
+
+    def _schedule_loop(self):
+        """Move para a fila os jobs reagendados cujo horário chegou"""
+        while not self._stop.is_set():
+            with self._lock:
+                now = time.monotonic()
+                due = []
+                while self._delayed and self._delayed[0][0] <= now:
+                    due.append(heapq.heappop(self._delayed)[2])
+                if not due:
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._delayed_changed.wait(timeout)
+                    continue
+            for job in due:
+                self._queue.put(job)
+
+    def drain(self, timeout: float) -> bool:
+        """Aguarda até ``timeout`` segundos pelo processamento dos jobs pendentes"""
+        deadline = time.monotonic() + timeout
+        while (self._queue.unfinished_tasks or self._delayed) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not (self._queue.unfinished_tasks or self._delayed)
+
+    def stop(self, drain_timeout: float = 10.0):
+        """Encerra os workers após tentar esvaziar a fila"""
+        if not self._threads:
+            return
+        if not self.drain(drain_timeout):
+            logger.warning(f"Fila de entrega '{self.name}' encerrada com {self._queue.qsize()} jobs pendentes "
+                           f"e {len(self._delayed)} reagendados")
+        self._stop.set()
+        with self._lock:
+            self._delayed_changed.notify_all()
+        self._scheduler.join(timeout=5)
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def metrics(self) -> Dict:
+        """Profundidade, idade do job mais antigo (s) e contadores de entrega"""
+        with self._lock:
+            oldest = min(self._waiting.values()) if self._waiting else None
+            metrics = dict(self._stats)
+            metrics['delayed'] = len(self._delayed)
+        metrics['depth'] = self._queue.qsize()
+        metrics['oldest_age'] = round(time.monotonic() - oldest, 3) if oldest is not None else 0.0
+        metrics['max_wait'] = round(metrics['max_wait'], 3)
+        return metrics
@@ -1,13 +1,92 @@
 import imaplib
 import email
+import json
 import logging
+import re
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from email.header import decode_header
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set
+from .alert_classifier import AlertClassifier, alert_type_for
+from .coalescer import DEFAULT_DIGEST_THRESHOLD, AlertCoalescer
+from .deadline import Deadline, DeadlineExceeded
+from .delivery_queue import DEFAULT_QUEUE_SIZE, DeliveryJob, DeliveryQueue, Retry
+from .formatting import to_plain_text
+from .imap_protocol import (build_message_set, chunked, decode_partial_body, find_text_part, parse_fetch_response,
+                            parse_status_response)
+from .outbox import Outbox
+from .rate_limiter import RateLimiter
+from .reconnect import ReconnectPolicy, ReconnectState
+from .retry_policy import PERMANENT, RetryPolicy
+from .uid_checkpoint import CheckpointStore
 
 logger = logging.getLogger('wegnots.email_handler')
 
+# O servidor pode encerrar sessões IDLE após 30 minutos (RFC 2177); renovamos antes disso
+IDLE_REFRESH_INTERVAL = 25 * 60
+# Intervalo máximo de leitura no socket durante IDLE (define a latência de parada da thread)
+IDLE_READ_TIMEOUT = 1.0
+# Tempo máximo para o servidor responder aos comandos IDLE/DONE
+IDLE_RESPONSE_TIMEOUT = 30.0
+
+# Prazo padrão para a verificação de cada conta (orçamento repartido entre os comandos)
+DEFAULT_POLL_TIMEOUT = 45.0
+# Folga para a espera do pool: contas dentro do prazo terminam sozinhas por timeout
+POLL_DEADLINE_GRACE = 1.0
+
+# Timeout de cada comando IMAP, em segundos; o prazo restante da verificação pode reduzi-lo
+DEFAULT_COMMAND_TIMEOUTS = {
+    'connect': 15.0,
+    'login': 15.0,
+    'select': 15.0,
+    'search': 20.0,
+    'fetch': 30.0,
+    'store': 15.0,
+    'status': 10.0,
+    'noop': 10.0,
+    'logout': 5.0,
+}
+
+# Envios simultâneos para os destinos de um alerta (modo sem fila de entrega)
+DEFAULT_FANOUT_WORKERS = 4
+
+# Tentativas de entrega pela fila para falhas que não são 429 (rede, 5xx) e espera inicial do backoff
+MAX_DELIVERY_ATTEMPTS = 5
+DELIVERY_RETRY_DELAY = 2.0
+
+# Quantidade máxima de mensagens por comando FETCH/STORE em lote
+FETCH_CHUNK_SIZE = 50
+# Fase 1: apenas os cabeçalhos exibidos no alerta, o tamanho e a estrutura MIME
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID)]'
+HEADER_FIELDS_KEY = 'BODY[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID)]'
+# Fase 2: bytes iniciais da parte de texto (o alerta exibe no máximo 1000 caracteres)
+BODY_PREVIEW_BYTES = 8192
+
+EXISTS_RESPONSE = re.compile(rb'^\* (\d+) EXISTS', re.IGNORECASE)
+
+
+class IMAPCommandTimeout(TimeoutError):
+    """Exceção para comandos IMAP que excederam o timeout (a sessão deve ser descartada)."""
+
+    def __init__(self, command, timeout):
+        super().__init__(f"Comando IMAP {command.upper()} excedeu {timeout:.1f}s")
+        self.command = command
+        self.timeout = timeout
+
+
+class IMAPAuthError(imaplib.IMAP4.error):
+    """Exceção para logins recusados pelo servidor (abre o circuit breaker da conta)."""
+    pass
+
+
 class IMAPConnection:
-    def __init__(self, server, port, username, password, is_active=True, telegram_chat_id=None, telegram_token=None):
+    def __init__(self, server, port, username, password, is_active=True, telegram_chat_id=None, telegram_token=None,
+                 checkpoint_store=None, command_timeouts: Optional[Dict[str, float]] = None,
+                 reconnect_policy: Optional[ReconnectPolicy] = None,
+                 notification_destinations: Optional[Dict[str, Dict]] = None):
         self.server = server
         self.port = port
         self.username = username
@@ -18,49 +97,545 @@ class IMAPConnection:
         # Informações do Telegram específicas para esta conexão
         self.telegram_chat_id = telegram_chat_id
         self.telegram_token = telegram_token
+        # Destinos adicionais: nome -> {chat_id, token} (campos vazios usam os da conta)
+        self.notification_destinations = notification_destinations or {}
+        self.capabilities = set()
+        self.checkpoint_store = checkpoint_store or CheckpointStore()
+        self.command_timeouts = {**DEFAULT_COMMAND_TIMEOUTS, **(command_timeouts or {})}
+        # Timeouts por comando (connect, login, select, search, fetch, store...)
+        self.timeout_counts: Dict[str, int] = {}
+        # Caixa selecionada na sessão principal e último STATUS observado por caixa
+        self.selected_mailbox = None
+        self.mailbox_status: Dict[str, Dict[str, int]] = {}
+        # QRESYNC/CONDSTORE (RFC 7162): HIGHESTMODSEQ aguardando a conclusão do ciclo
+        self.qresync_enabled = False
+        self._pending_modseq: Dict[str, int] = {}
+        # Backoff e circuit breaker compartilhados pelas conexões de polling e IDLE
+        self.reconnect_state = ReconnectState(reconnect_policy, name=f"{username} ({server})")
+        # Sessão IDLE usa uma conexão própria para não disputar o socket do polling
+        self.idle_imap = None
+        self._idle_thread = None
+        self._idle_stop = threading.Event()
+        self._idle_buffer = b''
+
+    def _command_timeout(self, command, deadline: Optional[Deadline] = None) -> Optional[float]:
+        """Timeout do comando, limitado pelo tempo restante do prazo (se houver)"""
+        timeout = self.command_timeouts.get(command)
+        return deadline.timeout_for(timeout, command.upper()) if deadline else timeout
+
+    @contextmanager
+    def _command(self, command, deadline: Optional[Deadline] = None, imap=None):
+        """
+        Aplica o timeout de ``command`` ao socket de ``imap`` durante o bloco.
+
+        Um timeout de socket deixa o imaplib em estado indefinido: a conexão é marcada
+        como 'timeout' para ser descartada (sem LOGOUT) na próxima reconexão.
+        """
+        try:
+            timeout = self._command_timeout(command, deadline)
+        except DeadlineExceeded:
+            self._record_timeout(command)
+            raise
+        if imap is not None:
+            imap.sock.settimeout(timeout)
+        try:
+            yield timeout
+        except socket.timeout as e:
+            self._record_timeout(command)
+            if imap is not None and imap is self.imap:
+                self.connection_status = 'timeout'
+            raise IMAPCommandTimeout(command, timeout) from e
+
+    def _record_timeout(self, command):
+        self.timeout_counts[command] = self.timeout_counts.get(command, 0) + 1
+        logger.warning(f"Timeout no comando {command.upper()} para {self.username} em {self.server}")
+
+    def _open_imap(self, deadline: Optional[Deadline] = None):
+        """Abre e autentica uma nova conexão IMAP"""
+        with self._command('connect', deadline) as timeout:
+            imap = imaplib.IMAP4_SSL(self.server, self.port, timeout=timeout)
+        try:
+            with self._command('login', deadline, imap):
+                imap.login(self.username, self.password)
+        except BaseException as e:
+            # Socket já aberto: qualquer falha no LOGIN (timeout, queda, recusa) o fecha
+            try:
+                imap.shutdown()
+            except Exception:
+                pass
+            if isinstance(e, imaplib.IMAP4.error) and not isinstance(e, imaplib.IMAP4.abort):
+                raise IMAPAuthError(f"Login recusado para {self.username}: {e}") from e
+            raise
+        return imap
+
+    def _close_imap(self):
+        """Fecha a conexão principal; sessões que sofreram timeout são fechadas sem LOGOUT"""
+        try:
+            if self.connection_status == 'timeout':
+                self.imap.shutdown()
+            else:
+                self.imap.sock.settimeout(self.command_timeouts['logout'])
+                self.imap.logout()
+        except Exception:
+            pass
+        self.imap = None
+
+    def discard_session(self):
+        """
+        Descarta a sessão atual sem LOGOUT (fecha o socket). Usado após um timeout
+        ou erro no meio de um comando, quando o fluxo do imaplib pode estar
+        dessincronizado: mesmo que a reconexão seja adiada pelo backoff, o próximo
+        ciclo não reaproveita a sessão.
+        """
+        if self.imap:
+            try:
+                self.imap.shutdown()
+            except Exception:
+                pass
+        self.imap = None
+        self.selected_mailbox = None
+        if self.connection_status != 'timeout':
+            self.connection_status = 'error'
+
+    def _refresh_capabilities(self):
+        """Atualiza as capacidades anunciadas pelo servidor após a autenticação"""
+        try:
+            status, data = self.imap.capability()
+            if status == 'OK' and data and data[-1]:
+                self.capabilities = set(data[-1].decode(errors='replace').upper().split())
+                return
+        except Exception as e:
+            logger.debug(f"Falha ao consultar CAPABILITY em {self.server}: {e}")
+        self.capabilities = {cap.upper() for cap in getattr(self.imap, 'capabilities', ())}
+
+    def supports_idle(self) -> bool:
+        """Indica se o servidor anuncia suporte a IDLE (RFC 2177)"""
+        return 'IDLE' in self.capabilities
+
+    def supports_unselect(self) -> bool:
+        """Indica se o servidor anuncia suporte a UNSELECT (RFC 3691)"""
+        return 'UNSELECT' in self.capabilities
+
+    def supports_condstore(self) -> bool:
+        """Indica se o servidor mantém MODSEQ por mensagem (CONDSTORE/QRESYNC, RFC 7162)"""
+        return 'CONDSTORE' in self.capabilities or 'QRESYNC' in self.capabilities
+
+    def _enable_qresync(self):
+        """Ativa QRESYNC na sessão, se anunciado, para ressincronizar a caixa em um único SELECT"""
+        self.qresync_enabled = False
+        if 'QRESYNC' not in self.capabilities or 'ENABLE' not in self.capabilities:
+            return
+        try:
+            status, _ = self.imap.xatom('ENABLE', 'QRESYNC')
+            self.qresync_enabled = status == 'OK'
+        except Exception as e:
+            logger.debug(f"Falha ao ativar QRESYNC em {self.server}: {e}")
         
-    def connect(self) -> bool:
-        """Estabelece conexão com servidor IMAP"""
+    def connect(self, deadline: Optional[Deadline] = None) -> bool:
+        """Estabelece conexão com servidor IMAP (o resultado alimenta o backoff da conta)"""
         if not self.is_active:
             return False
             
         try:
             if self.imap:
-                try:
-                    self.imap.logout()
-                except:
-                    pass
+                self._close_imap()
                     
-            self.imap = imaplib.IMAP4_SSL(self.server, self.port)
-            self.imap.login(self.username, self.password)
+            self.imap = self._open_imap(deadline)
+            self.selected_mailbox = None
+            self._refresh_capabilities()
+            self._enable_qresync()
             self.connection_status = 'connected'
+            self.reconnect_state.record_success()
             logger.info(f"Conectado ao servidor IMAP {self.server}")
             return True
             
         except Exception as e:
             self.connection_status = 'error'
-            logger.error(f"Erro ao conectar ao servidor {self.server}: {e}")
+            delay = self.reconnect_state.record_failure(auth_error=isinstance(e, IMAPAuthError))
+            logger.error(f"Erro ao conectar ao servidor {self.server}: {e} (nova tentativa em {delay:.0f}s)")
+            return False
+
+    def reconnect(self) -> bool:
+        """Reconecta se o backoff/circuit breaker da conta permitir uma nova tentativa"""
+        if not self.is_active:
             return False
+        wait = self.reconnect_state.wait_time()
+        if wait > 0:
+            logger.debug(f"Reconexão de {self.username} adiada por mais {wait:.0f}s "
+                         f"(estado: {self.reconnect_state.state})")
+            return False
+        return self.connect()
 
     def disconnect(self):
         """Desconecta do servidor IMAP"""
+        self.stop_idle()
         if self.imap:
-            try:
-                self.imap.logout()
-                logger.info(f"Desconectado do servidor IMAP {self.server}")
-            except:
-                pass
+            self._close_imap()
+            logger.info(f"Desconectado do servidor IMAP {self.server}")
         self.connection_status = 'disconnected'
 
     def check_connection(self) -> bool:
         """Verifica se a conexão está ativa e reconecta se necessário"""
         if not self.imap:
-            return self.connect()
+            return self.reconnect()
         try:
-            self.imap.noop()
+            with self._command('noop', imap=self.imap):
+                self.imap.noop()
             return True
         except:
-            return self.connect()
+            return self.reconnect()
+
+    def _selected_value(self, code) -> Optional[int]:
+        """Lê um código numérico (UIDVALIDITY, UIDNEXT...) informado pelo último SELECT"""
+        _, data = self.imap.response(code)
+        values = [value for value in (data or []) if value]
+        try:
+            return int(values[-1]) if values else None
+        except (TypeError, ValueError):
+            return None
+
+    def _highest_uid(self, deadline: Optional[Deadline] = None) -> int:
+        """Retorna o maior UID existente na caixa selecionada (0 se vazia)"""
+        with self._command('search', deadline, self.imap):
+            status, data = self.imap.uid('SEARCH', None, 'ALL')
+        if status != 'OK' or not data or not data[0]:
+            return 0
+        return max(int(uid) for uid in data[0].split())
+
+    def checkpoint_key(self, mailbox='INBOX') -> str:
+        """Chave do checkpoint de UID desta conta"""
+        return CheckpointStore.make_key(self.server, self.username, mailbox)
+
+    def mailbox_unchanged(self, mailbox, checkpoint: Dict, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Consulta STATUS da caixa e indica se não há mensagens além do checkpoint.
+
+        STATUS não deve ser usado na caixa selecionada (RFC 3501), por isso a sessão
+        sai da caixa com UNSELECT antes; sem suporte a UNSELECT retorna False.
+        """
+        if not self.supports_unselect():
+            return False
+
+        if self.selected_mailbox:
+            with self._command('select', deadline, self.imap):
+                self.imap.unselect()
+            self.selected_mailbox = None
+
+        items = 'UIDNEXT MESSAGES UNSEEN UIDVALIDITY'
+        if self.supports_condstore():
+            items += ' HIGHESTMODSEQ'
+        with self._command('status', deadline, self.imap):
+            status, data = self.imap.status(mailbox, f'({items})')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Falha no STATUS de {mailbox}: {status}")
+
+        current = parse_status_response(data)
+        previous = self.mailbox_status.get(mailbox)
+        self.mailbox_status[mailbox] = current
+        if previous is not None and current != previous:
+            logger.debug(f"STATUS de {mailbox} ({self.username}) mudou: {previous} -> {current}")
+
+        uidnext = current.get('UIDNEXT')
+        return (current.get('UIDVALIDITY') == checkpoint.get('uidvalidity')
+                and uidnext is not None and uidnext <= checkpoint.get('last_uid', 0) + 1)
+
+    def fetch_new_uids(self, mailbox='INBOX', deadline: Optional[Deadline] = None) -> List[int]:
+        """
+        Seleciona a caixa e retorna, em ordem crescente, os UIDs posteriores ao checkpoint.
+
+        Quando o STATUS mostra que nada chegou desde o checkpoint, a caixa não é
+        selecionada. Na primeira execução (ou se o UIDVALIDITY mudou) o checkpoint é
+        posicionado em UIDNEXT-1 e nada é retornado, evitando renotificar a caixa inteira.
+
+        Com QRESYNC, o SELECT informa o UIDVALIDITY/HIGHESTMODSEQ do checkpoint e o
+        servidor devolve no próprio SELECT as mensagens alteradas (incluindo as novas)
+        e as removidas (VANISHED). Com CONDSTORE, a listagem usa CHANGEDSINCE.
+
+        Escopo: QRESYNC e CONDSTORE servem apenas para achar as mensagens novas com
+        menos tráfego. Alterações de flags em mensagens antigas são descartadas e os
+        UIDs de VANISHED só vão para o log; alertas já enfileirados de mensagens
+        removidas continuam sendo enviados.
+        """
+        key = self.checkpoint_key(mailbox)
+        checkpoint = self.checkpoint_store.get(key)
+        if checkpoint and self.mailbox_unchanged(mailbox, checkpoint, deadline):
+            return []
+
+        modseq = checkpoint.get('highestmodseq') if checkpoint else None
+        qresync = bool(self.qresync_enabled and modseq and checkpoint.get('uidvalidity'))
+        select_arg = f"{mailbox} (QRESYNC ({checkpoint['uidvalidity']} {modseq}))" if qresync else mailbox
+
+        with self._command('select', deadline, self.imap):
+            status, _ = self.imap.select(select_arg)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Falha ao selecionar {mailbox}: {status}")
+        self.selected_mailbox = mailbox
+
+        uidvalidity = self._selected_value('UIDVALIDITY')
+        uidnext = self._selected_value('UIDNEXT')
+        highestmodseq = self._selected_value('HIGHESTMODSEQ')
+        _, vanished = self.imap.response('VANISHED')
+        _, changed = self.imap.response('FETCH')
+
+        if not checkpoint or checkpoint.get('uidvalidity') != uidvalidity:
+            if checkpoint:
+                logger.warning(f"UIDVALIDITY de {mailbox} mudou para {self.username} "
+                               f"({checkpoint.get('uidvalidity')} -> {uidvalidity}); reiniciando checkpoint")
+            last_uid = uidnext - 1 if uidnext else self._highest_uid(deadline)
+            fields = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+            if checkpoint or highestmodseq is not None:
+                fields['highestmodseq'] = highestmodseq
+            self.checkpoint_store.update(key, **fields)
+            logger.info(f"Checkpoint de {self.username} iniciado em UID {last_uid}")
+            return []
+
+        # O HIGHESTMODSEQ só é gravado após o ciclo processar todas as mensagens (commit_sync_state)
+        if highestmodseq is not None:
+            self._pending_modseq[mailbox] = highestmodseq
+
+        last_uid = checkpoint.get('last_uid', 0)
+        if uidnext is not None and uidnext <= last_uid + 1:
+            return []
+
+        if qresync:
+            if vanished and vanished[0] is not None:
+                # Apenas registrado: remoções não afetam alertas já enfileirados
+                logger.debug(f"QRESYNC: mensagens removidas em {mailbox} ({self.username}): {vanished}")
+            uids = {record['UID'] for record in parse_fetch_response(changed)
+                    if isinstance(record.get('UID'), int) and record['UID'] > last_uid}
+            # Se a maior novidade alcança UIDNEXT-1, o SELECT já trouxe todas as mensagens novas
+            if uids and uidnext is not None and max(uids) >= uidnext - 1:
+                return sorted(uids)
+
+        # "n:*" sempre inclui a última mensagem, mesmo que seu UID seja menor que n
+        fetch_args = [f"{last_uid + 1}:*", '(UID)']
+        if modseq and self.supports_condstore():
+            fetch_args.append(f'(CHANGEDSINCE {modseq})')
+        with self._command('search', deadline, self.imap):
+            status, data = self.imap.uid('FETCH', *fetch_args)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Falha ao listar novos UIDs em {mailbox}: {status}")
+
+        uids = {record['UID'] for record in parse_fetch_response(data)
+                if isinstance(record.get('UID'), int) and record['UID'] > last_uid}
+        return sorted(uids)
+
+    def fetch_previews(self, uids: List[int], deadline: Optional[Deadline] = None) -> Dict[int, Dict]:
+        """
+        Busca cabeçalhos e um trecho do corpo das mensagens sem baixar anexos.
+
+        Fase 1: FROM/SUBJECT/DATE/MESSAGE-ID, RFC822.SIZE e BODYSTRUCTURE em um único FETCH.
+        Fase 2: os primeiros BODY_PREVIEW_BYTES da parte de texto escolhida, em um FETCH
+        por número de parte. Nenhuma das fases altera a flag \\Seen.
+        Retorna {uid: {'subject', 'from', 'date', 'message_id', 'size', 'body'}}.
+        """
+        with self._command('fetch', deadline, self.imap):
+            status, data = self.imap.uid('FETCH', build_message_set(uids),
+                                         f'(UID RFC822.SIZE BODYSTRUCTURE {HEADER_FIELDS})')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"Falha ao buscar cabeçalhos em {self.server}: {status}")
+
+        previews = {}
+        text_parts = {}
+        for record in parse_fetch_response(data):
+            uid = record.get('UID')
+            headers = record.get(HEADER_FIELDS_KEY)
+            if not isinstance(uid, int) or uid not in uids or not isinstance(headers, bytes):
+                continue
+            message = email.message_from_bytes(headers)
+            previews[uid] = {
+                'subject': decode_email_header(message['subject']),
+                'from': decode_email_header(message['from']),
+                'date': message['date'],
+                'message_id': message['message-id'],
+                'size': record.get('RFC822.SIZE'),
+                'body': ''
+            }
+            text_part = find_text_part(record.get('BODYSTRUCTURE'))
+            if text_part:
+                text_parts[uid] = text_part
+
+        # Agrupa por número de parte para buscar vários trechos por comando
+        by_part: Dict[str, List[int]] = {}
+        for uid, text_part in text_parts.items():
+            by_part.setdefault(text_part['part'], []).append(uid)
+
+        for part, part_uids in by_part.items():
+            with self._command('fetch', deadline, self.imap):
+                status, data = self.imap.uid('FETCH', build_message_set(part_uids),
+                                             f'(UID BODY.PEEK[{part}]<0.{BODY_PREVIEW_BYTES}>)')
+            if status != 'OK':
+                logger.error(f"Falha ao buscar corpo parcial (parte {part}) em {self.server}: {status}")
+                continue
+            for record in parse_fetch_response(data):
+                uid = record.get('UID')
+                if uid not in text_parts:
+                    continue
+                raw = record.get(f'BODY[{part}]<0>')
+                text_part = text_parts[uid]
+                body = decode_partial_body(raw if isinstance(raw, bytes) else b'',
+                                           text_part['encoding'], text_part['charset'])
+                if text_part['subtype'] == 'html':
+                    body = html_to_text(body)
+                previews[uid]['body'] = clean_body_text(body)
+
+        return previews
+
+    def mark_seen(self, uids: List[int], deadline: Optional[Deadline] = None):
+        """Marca as mensagens como lidas em um único UID STORE"""
+        with self._command('store', deadline, self.imap):
+            status, _ = self.imap.uid('STORE', build_message_set(uids), '+FLAGS', '(\\Seen)')
+        if status != 'OK':
+            logger.error(f"Falha ao marcar mensagens como lidas em {self.server}: {status}")
+
+    def commit_uid(self, uid: int, mailbox='INBOX'):
+        """Avança o checkpoint persistido até o UID informado"""
+        key = self.checkpoint_key(mailbox)
+        checkpoint = self.checkpoint_store.get(key) or {}
+        if uid > checkpoint.get('last_uid', 0):
+            self.checkpoint_store.update(key, last_uid=uid)
+
+    def commit_sync_state(self, mailbox='INBOX'):
+        """Grava o HIGHESTMODSEQ do último SELECT depois que todas as mensagens novas foram processadas"""
+        modseq = self._pending_modseq.pop(mailbox, None)
+        if modseq is not None:
+            self.checkpoint_store.update(self.checkpoint_key(mailbox), highestmodseq=modseq)
+
+    def start_idle(self, on_exists: Callable[[str, Optional[int]], None]) -> bool:
+        """
+        Inicia uma sessão IDLE de longa duração em thread própria.
+
+        A cada resposta EXISTS do servidor, ``on_exists(username, total)`` é chamado.
+        Também é chamado com ``total=None`` sempre que a sessão é (re)estabelecida,
+        para que o handler recupere mensagens chegadas enquanto a sessão estava fora.
+        Retorna False se o servidor não suporta IDLE (a conta deve seguir em polling).
+        """
+        if not self.is_active or not self.supports_idle():
+            return False
+        if self.is_idling():
+            return True
+
+        self._idle_stop.clear()
+        self._idle_thread = threading.Thread(
+            target=self._idle_loop,
+            args=(on_exists,),
+            name=f"imap-idle-{self.username}",
+            daemon=True
+        )
+        self._idle_thread.start()
+        return True
+
+    def stop_idle(self):
+        """Encerra a sessão IDLE, se houver"""
+        self._idle_stop.set()
+        if self._idle_thread and self._idle_thread is not threading.current_thread():
+            self._idle_thread.join(timeout=IDLE_RESPONSE_TIMEOUT)
+        self._idle_thread = None
+
+    def is_idling(self) -> bool:
+        """Indica se há uma sessão IDLE ativa para esta conta"""
+        return self._idle_thread is not None and self._idle_thread.is_alive()
+
+    def _idle_loop(self, on_exists):
+        """Mantém a sessão IDLE, reconectando com backoff em caso de falha"""
+        while not self._idle_stop.is_set():
+            try:
+                if not self.idle_imap:
+                    wait = self.reconnect_state.wait_time()
+                    if wait > 0:
+                        self._idle_stop.wait(wait)
+                        continue
+                    self.idle_imap = self._open_imap()
+                    self._idle_buffer = b''
+                    status, _ = self.idle_imap.select('INBOX', readonly=True)
+                    if status != 'OK':
+                        raise imaplib.IMAP4.error(f"Falha ao selecionar INBOX: {status}")
+                    self.reconnect_state.record_success()
+                    logger.info(f"Sessão IDLE iniciada para {self.username} em {self.server}")
+                    on_exists(self.username, None)
+
+                self._idle_cycle(self.idle_imap, IDLE_REFRESH_INTERVAL, on_exists)
+
+            except Exception as e:
+                delay = self.reconnect_state.record_failure(auth_error=isinstance(e, IMAPAuthError))
+                logger.error(f"Erro na sessão IDLE de {self.username} em {self.server}: {e} "
+                             f"(nova tentativa em {delay:.0f}s)")
+                self._close_idle()
+
+        self._close_idle()
+        logger.info(f"Sessão IDLE encerrada para {self.username}")
+
+    def _idle_cycle(self, imap, duration, on_exists):
+        """Executa um ciclo IDLE ... DONE com duração máxima ``duration`` segundos"""
+        tag = imap._new_tag()
+        imap.send(tag + b' IDLE\r\n')
+
+        # Aguarda a continuação ("+ idling"); respostas não marcadas podem vir antes
+        while True:
+            line = self._idle_readline(imap, IDLE_RESPONSE_TIMEOUT)
+            if line is None:
+                raise imaplib.IMAP4.abort("Servidor não respondeu ao comando IDLE")
+            if line.startswith(b'+'):
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f"Servidor recusou IDLE: {line!r}")
+            self._dispatch_idle_line(line, on_exists)
+
+        deadline = time.monotonic() + duration
+        while not self._idle_stop.is_set() and time.monotonic() < deadline:
+            line = self._idle_readline(imap, IDLE_READ_TIMEOUT)
+            if line is not None:
+                self._dispatch_idle_line(line, on_exists)
+
+        imap.send(b'DONE\r\n')
+        while True:
+            line = self._idle_readline(imap, IDLE_RESPONSE_TIMEOUT)
+            if line is None:
+                raise imaplib.IMAP4.abort("Servidor não confirmou o fim do IDLE")
+            if line.startswith(tag):
+                if not line[len(tag):].strip().upper().startswith(b'OK'):
+                    raise imaplib.IMAP4.error(f"IDLE finalizado com erro: {line!r}")
+                return
+            self._dispatch_idle_line(line, on_exists)
+
+    def _dispatch_idle_line(self, line, on_exists):
+        """Repassa ao handler as respostas EXISTS recebidas durante o IDLE"""
+        match = EXISTS_RESPONSE.match(line)
+        if match:
+            total = int(match.group(1))
+            logger.debug(f"IDLE: {self.username} agora possui {total} mensagens")
+            on_exists(self.username, total)
+
+    def _idle_readline(self, imap, timeout) -> Optional[bytes]:
+        """
+        Lê uma linha do socket da sessão IDLE, retornando None se o tempo esgotar.
+
+        A leitura é feita diretamente no socket (e não via ``imap.readline``) porque
+        um timeout no arquivo bufferizado do imaplib invalida a conexão.
+        """
+        while b'\n' not in self._idle_buffer:
+            imap.sock.settimeout(timeout)
+            try:
+                chunk = imap.sock.recv(4096)
+            except socket.timeout:
+                return None
+            if not chunk:
+                raise imaplib.IMAP4.abort("Conexão encerrada pelo servidor durante IDLE")
+            self._idle_buffer += chunk
+
+        line, _, self._idle_buffer = self._idle_buffer.partition(b'\n')
+        return line.rstrip(b'\r')
+
+    def _close_idle(self):
+        """Fecha a conexão dedicada ao IDLE"""
+        if self.idle_imap:
+            try:
+                self.idle_imap.sock.settimeout(IDLE_RESPONSE_TIMEOUT)
+                self.idle_imap.logout()
+            except Exception:
+                pass
+        self.idle_imap = None
+        self._idle_buffer = b''
 
     def get_recent_emails(self, limit=10) -> List[Dict]:
         """Obtém os emails mais recentes da caixa de entrada"""
@@ -132,7 +707,7 @@ class IMAPConnection:
         
         try:
             # Testa conexão SSL
-            self.imap_conn = imaplib.IMAP4_SSL(self.server, self.port)
+            self.imap_conn = imaplib.IMAP4_SSL(self.server, self.port, timeout=self.command_timeouts['connect'])
             diagnosis['ssl_connection'] = True
             
             # Testa autenticação
@@ -181,10 +756,54 @@ class IMAPConnection:
         return diagnosis
 
 class EmailHandler:
-    def __init__(self, telegram_client):
+    def __init__(self, telegram_client, checkpoint_store: Optional[CheckpointStore] = None,
+                 max_workers: int = 1, poll_timeout: float = DEFAULT_POLL_TIMEOUT,
+                 command_timeouts: Optional[Dict[str, float]] = None,
+                 reconnect_policy: Optional[ReconnectPolicy] = None,
+                 delivery_workers: int = 0, delivery_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 rate_limiter: Optional[RateLimiter] = None, outbox: Optional[Outbox] = None,
+                 coalesce_window: float = 0.0, digest_threshold: int = DEFAULT_DIGEST_THRESHOLD,
+                 fanout_workers: int = DEFAULT_FANOUT_WORKERS, retry_policy: Optional[RetryPolicy] = None,
+                 classifier: Optional[AlertClassifier] = None):
         self.connections = {}
         self.telegram_client = telegram_client
-        self.processed_emails = {}  # Dictionary to store processed email IDs per account
+        # Com max_workers > 1 as contas são verificadas em paralelo, com prazo por conta
+        self.poll_timeout = poll_timeout
+        self.command_timeouts = command_timeouts
+        self.reconnect_policy = reconnect_policy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='imap-poll') \
+            if max_workers > 1 else None
+        self._inflight: Dict[str, Future] = {}
+        # Limites do Telegram por token, chat e grupo aplicados pelos workers de entrega
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Classificação das falhas de envio e backoff com jitter das novas tentativas da fila
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=MAX_DELIVERY_ATTEMPTS,
+                                                        base_delay=DELIVERY_RETRY_DELAY)
+        # Outbox durável: alertas gravados antes do STORE \Seen e removidos após a entrega
+        self.outbox = outbox
+        # Severidade pelas palavras-chave de alerts.levels (críticos não esperam a janela de rajadas)
+        self.classifier = classifier
+        # Com delivery_workers > 0 os alertas são enviados por workers, fora do ciclo de polling
+        self.delivery_queue = DeliveryQueue(self._deliver_job, delivery_workers, delivery_queue_size) \
+            if delivery_workers > 0 else None
+        if self.delivery_queue:
+            self.delivery_queue.start()
+        # Destinos pendentes de cada alerta distribuído: o outbox só é liberado quando todos recebem
+        self._fanout_pending: Dict[str, Dict] = {}
+        self._fanout_lock = threading.Lock()
+        self._fanout_executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix='telegram-fanout')
+        self.destination_metrics: Dict[str, Dict] = {}
+        # Com coalesce_window > 0 rajadas para o mesmo chat viram um único resumo
+        self.coalescer = AlertCoalescer(self._emit_group, coalesce_window, digest_threshold) \
+            if coalesce_window > 0 else None
+        self.poll_metrics: Dict[str, Dict] = {}
+        self._metrics_lock = threading.Lock()
+        # Checkpoints UIDVALIDITY/último UID por caixa, persistidos em disco
+        self.checkpoint_store = checkpoint_store or CheckpointStore()
+        # Contas notificadas via IDLE aguardando verificação
+        self.new_mail_event = threading.Event()
+        self._pending_accounts: Set[str] = set()
+        self._pending_lock = threading.Lock()
         
     def _get_email_key(self, server, username, email_id):
         """Generate a unique key for an email"""
@@ -201,123 +820,491 @@ class EmailHandler:
                     password=config['password'],
                     is_active=True,
                     telegram_chat_id=config.get('telegram_chat_id'),
-                    telegram_token=config.get('telegram_token')
+                    telegram_token=config.get('telegram_token'),
+                    checkpoint_store=self.checkpoint_store,
+                    command_timeouts=self.command_timeouts,
+                    reconnect_policy=self.reconnect_policy,
+                    notification_destinations=self._parse_destinations(section_name, config)
                 )
                 
                 # Adiciona a conexão ao dicionário, usando o username como chave
                 self.connections[config['username']] = connection
                 logger.info(f"Configurada conexão IMAP para {config['username']}")
         
+    @staticmethod
+    def _parse_destinations(section_name, config) -> Dict[str, Dict]:
+        """Lê o JSON de notification_destinations de uma seção IMAP_"""
+        try:
+            destinations = json.loads(config.get('notification_destinations') or '{}')
+        except json.JSONDecodeError:
+            logger.error(f"Erro ao analisar notification_destinations em {section_name}")
+            return {}
+        return {name: info for name, info in destinations.items() if isinstance(info, dict)}
+        
     def connect(self) -> bool:
         """Estabelece conexões com todos os servidores IMAP"""
+        connections = list(self.connections.values())
+        if self._executor:
+            return any(list(self._executor.map(lambda connection: connection.connect(), connections)))
+        
         success = False
         
-        for username, connection in self.connections.items():
+        for connection in connections:
             if connection.connect():
                 success = True
                 
         return success
+
+    def reconnect(self) -> int:
+        """Reconecta as contas sem sessão ativa, respeitando o backoff de cada uma"""
+        reconnected = 0
+        for connection in self.connections.values():
+            if connection.connection_status != 'connected' and connection.reconnect():
+                reconnected += 1
+        return reconnected
+
+    def start_idle(self) -> int:
+        """
+        Inicia sessões IDLE nas contas cujo servidor suporta.
+        Contas sem IDLE no CAPABILITY continuam sendo verificadas por polling.
+        """
+        started = 0
+        for username, connection in self.connections.items():
+            if connection.is_idling() or connection.start_idle(self._on_mailbox_event):
+                started += 1
+                logger.info(f"Modo IDLE ativo para {username}")
+            elif connection.imap:
+                logger.info(f"Servidor {connection.server} sem suporte a IDLE; {username} seguirá em polling")
+        return started
+
+    def _on_mailbox_event(self, username, total=None):
+        """Registra que a caixa de uma conta mudou (chamado pelas threads IDLE)"""
+        with self._pending_lock:
+            self._pending_accounts.add(username)
+        self.new_mail_event.set()
+
+    def wait_for_new_mail(self, timeout: float) -> Set[str]:
+        """Aguarda até ``timeout`` segundos por notificações IDLE e retorna as contas afetadas"""
+        if not self.new_mail_event.wait(timeout):
+            return set()
+        with self._pending_lock:
+            accounts = self._pending_accounts
+            self._pending_accounts = set()
+            self.new_mail_event.clear()
+        return accounts
+
+    def get_polling_accounts(self) -> List[str]:
+        """Retorna as contas que não estão cobertas por uma sessão IDLE"""
+        return [username for username, connection in self.connections.items() if not connection.is_idling()]
         
-    def check_new_emails(self) -> List[Dict]:
-        """Verifica novos e-mails em todos os servidores ativos"""
-        new_emails = []
+    def check_new_emails(self, usernames=None) -> List[Dict]:
+        """Verifica novos e-mails nos servidores ativos (ou apenas nas contas informadas)"""
+        accounts = []
         
         for username, connection in self.connections.items():
-            if not connection or not connection.is_active or not connection.imap:
-                logger.warning(f"Conexão inativa ou com problemas para {username}")
+            if usernames is not None and username not in usernames:
                 continue
-                
-            try:
-                logger.debug(f"Verificando emails para {username} em {connection.server}")
-                status, selected = connection.imap.select('INBOX')
-                if status != 'OK':
-                    logger.error(f"Falha ao selecionar INBOX para {username}: {status}")
-                    continue
-                    
-                # Initialize processed emails set for this account if it doesn't exist
-                if username not in self.processed_emails:
-                    self.processed_emails[username] = set()
-                
-                # Estratégia 1: Busca emails não lidos (UNSEEN)
-                status, messages = connection.imap.search(None, 'UNSEEN')
-                email_ids = messages[0].split() if status == 'OK' else []
-                
-                # Se não houver emails não lidos, não procuramos mais
-                # Removida a busca por emails das últimas 24h e emails recentes
-                # para evitar processamento duplicado
-                
-                for email_id in email_ids:
-                    try:
-                        email_key = self._get_email_key(connection.server, username, email_id.decode())
-                        
-                        # Skip if already processed
-                        if email_key in self.processed_emails[username]:
-                            logger.debug(f"Email {email_id} já processado para {username}")
-                            continue
-                            
-                        status, msg_data = connection.imap.fetch(email_id, '(RFC822)')
-                        if status != 'OK' or not msg_data or not msg_data[0]:
-                            logger.error(f"Falha ao buscar email ID {email_id} para {username}")
-                            continue
-                            
-                        email_body = msg_data[0][1]
-                        message = email.message_from_bytes(email_body)
-                        
-                        subject = decode_email_header(message['subject'])
-                        from_addr = decode_email_header(message['from'])
-                        body = get_email_body(message)
-                        
-                        logger.info(f"Novo email encontrado para {username}: Subject='{subject}', De='{from_addr}'")
-                        
-                        new_emails.append({
-                            'id': email_id.decode(),
-                            'server': connection.server,
-                            'username': username,
-                            'subject': subject,
-                            'from': from_addr,
-                            'body': body,
-                            'telegram_chat_id': connection.telegram_chat_id,
-                            'telegram_token': connection.telegram_token,
-                            'email_key': email_key
-                        })
-                        
-                        # Mark as read immediately after processing
-                        connection.imap.store(email_id, '+FLAGS', '\\Seen')
-                        # Add to processed set
-                        self.processed_emails[username].add(email_key)
-                        
-                        # Limit the size of processed emails set (keep last 1000 per account)
-                        if len(self.processed_emails[username]) > 1000:
-                            self.processed_emails[username] = set(list(self.processed_emails[username])[-1000:])
-                            
-                    except Exception as e:
-                        logger.error(f"Erro ao processar email ID {email_id} para {username}: {e}")
-                    
-            except Exception as e:
-                logger.error(f"Erro ao verificar e-mails em {connection.server} para {username}: {e}")
-                logger.info(f"Tentando reconectar para {username}")
-                connection.connect()
+
+            if not connection or not connection.is_active:
+                logger.warning(f"Conexão inativa para {username}")
+                continue
+            
+            if not connection.imap and not connection.reconnect_state.can_attempt():
+                logger.debug(f"Conta {username} aguardando backoff de reconexão "
+                             f"({connection.reconnect_state.wait_time():.0f}s)")
+                continue
+            
+            accounts.append((username, connection))
+        
+        if self._executor:
+            new_emails = self._poll_concurrently(accounts)
+        else:
+            new_emails = []
+            for username, connection in accounts:
+                new_emails.extend(self._poll_account(username, connection, Deadline(self.poll_timeout)))
                 
         if new_emails:
             logger.info(f"Total de novos emails encontrados: {len(new_emails)}")
         
         return new_emails
+
+    def _poll_concurrently(self, accounts) -> List[Dict]:
+        """
+        Verifica as contas em paralelo no pool de threads, aguardando no máximo
+        ``poll_timeout`` segundos. Os comandos IMAP de cada conta usam o tempo que
+        resta do ciclo; contas que ainda assim excedem o prazo continuam executando
+        e seus resultados são aproveitados no ciclo seguinte.
+        """
+        deadline = Deadline(self.poll_timeout)
+        new_emails = []
+        
+        # Resultados de verificações que excederam o prazo em ciclos anteriores
+        for username, future in list(self._inflight.items()):
+            if future.done():
+                del self._inflight[username]
+                new_emails.extend(future.result())
+        
+        futures = {}
+        for username, connection in accounts:
+            if username in self._inflight:
+                logger.warning(f"Verificação anterior de {username} ainda em andamento; conta ignorada neste ciclo")
+                continue
+            futures[self._executor.submit(self._poll_account, username, connection, deadline)] = username
+        
+        done, not_done = wait(futures, timeout=self.poll_timeout + POLL_DEADLINE_GRACE)
+        for future in futures:
+            username = futures[future]
+            if future in done:
+                new_emails.extend(future.result())
+            else:
+                self._inflight[username] = future
+                self._record_poll(username, self.poll_timeout, 'timeout')
+                logger.warning(f"Verificação de {username} excedeu o prazo de {self.poll_timeout}s")
+        
+        return new_emails
+
+    def _poll_account(self, username, connection, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """Verifica uma conta, registrando a duração; erros e timeouts disparam a reconexão da conta"""
+        new_emails = []
+        if not connection.imap and not connection.reconnect():
+            return new_emails
         
-    def process_emails(self):
-        """Processa emails não lidos e envia alertas"""
-        new_emails = self.check_new_emails()
+        started = time.monotonic()
+        status = 'ok'
+        try:
+            self._check_account(username, connection, new_emails, deadline)
+        except DeadlineExceeded as e:
+            # Nenhum comando ficou pendente: a sessão continua válida para o próximo ciclo
+            status = 'timeout'
+            logger.warning(f"Verificação de {username} interrompida: {e}")
+        except TimeoutError as e:
+            status = 'timeout'
+            logger.warning(f"Timeout ao verificar e-mails em {connection.server} para {username}: {e}")
+            logger.info(f"Reconectando {username} após timeout")
+            connection.discard_session()
+            connection.reconnect()
+        except Exception as e:
+            status = 'error'
+            logger.error(f"Erro ao verificar e-mails em {connection.server} para {username}: {e}")
+            logger.info(f"Tentando reconectar para {username}")
+            connection.discard_session()
+            connection.reconnect()
+        self._record_poll(username, time.monotonic() - started, status)
+        return new_emails
+
+    def _check_account(self, username, connection, new_emails: List[Dict], deadline: Optional[Deadline] = None):
+        """Busca as mensagens novas de uma conta, acrescentando-as a ``new_emails``"""
+        logger.debug(f"Verificando emails para {username} em {connection.server}")
+        
+        # Busca apenas mensagens com UID posterior ao checkpoint persistido
+        uids = connection.fetch_new_uids(deadline=deadline)
+        
+        # Busca as mensagens em blocos: cabeçalhos + trecho do corpo e um STORE por bloco
+        for chunk in chunked(uids, FETCH_CHUNK_SIZE):
+            previews = connection.fetch_previews(chunk, deadline)
+            fetched = []
+            chunk_emails = []
+            
+            for uid in chunk:
+                preview = previews.get(uid)
+                if not preview:
+                    # Mensagem removida entre a listagem e o FETCH
+                    logger.debug(f"Email UID {uid} não está mais disponível para {username}")
+                    continue
+                    
+                logger.info(f"Novo email encontrado para {username}: Subject='{preview['subject']}', "
+                            f"De='{preview['from']}', Tamanho={preview['size']}")
+                
+                email_data = {
+                    'id': str(uid),
+                    'uid': uid,
+                    'server': connection.server,
+                    'username': username,
+                    'subject': preview['subject'],
+                    'from': preview['from'],
+                    'body': preview['body'],
+                    'date': preview['date'],
+                    'message_id': preview['message_id'],
+                    'telegram_chat_id': connection.telegram_chat_id,
+                    'telegram_token': connection.telegram_token,
+                    'destinations': connection.notification_destinations,
+                    'email_key': self._get_email_key(connection.server, username, uid)
+                }
+                if self.classifier:
+                    classification = self.classifier.classify(preview['subject'], preview['body'])
+                    email_data.update(severity=classification.severity, keywords=classification.keywords,
+                                      rules=classification.rules,
+                                      critical=classification.severity == 'critical')
+                chunk_emails.append(email_data)
+                fetched.append(uid)
+            
+            # Os alertas precisam estar no outbox antes de a mensagem deixar de ser não lida
+            if self.outbox:
+                self.outbox.add_many(chunk_emails)
+            new_emails.extend(chunk_emails)
+            
+            # Mark as read immediately after processing
+            if fetched:
+                connection.mark_seen(fetched, deadline)
+            connection.commit_uid(chunk[-1])
+        
+        connection.commit_sync_state()
+
+    def _record_poll(self, username, duration: float, status: str):
+        """Atualiza as métricas de duração/resultado da verificação de uma conta"""
+        with self._metrics_lock:
+            metrics = self.poll_metrics.setdefault(username, {
+                'polls': 0, 'errors': 0, 'timeouts': 0,
+                'last_duration': None, 'max_duration': 0.0, 'last_status': None, 'last_poll': None
+            })
+            if status == 'timeout':
+                metrics['timeouts'] += 1
+            else:
+                metrics['polls'] += 1
+                if status == 'error':
+                    metrics['errors'] += 1
+                metrics['max_duration'] = max(metrics['max_duration'], duration)
+            metrics['last_duration'] = round(duration, 3)
+            metrics['last_status'] = status
+            metrics['last_poll'] = time.time()
+        logger.debug(f"Verificação de {username}: {status} em {duration:.2f}s")
+
+    def get_poll_metrics(self) -> Dict[str, Dict]:
+        """Retorna uma cópia das métricas de verificação por conta (inclui timeouts por comando)"""
+        with self._metrics_lock:
+            metrics = {username: dict(values) for username, values in self.poll_metrics.items()}
+        for username, values in metrics.items():
+            connection = self.connections.get(username)
+            if connection:
+                values['command_timeouts'] = dict(connection.timeout_counts)
+                values['reconnect'] = connection.reconnect_state.snapshot()
+        return metrics
+        
+    def process_emails(self, usernames=None):
+        """Processa emails não lidos e envia alertas (ou os enfileira, se houver fila de entrega)"""
+        new_emails = self.check_new_emails(usernames)
         
         if not new_emails:
             return
             
         for email_data in new_emails:
-            try:
-                # Usa telegram_token e chat_id específicos da conta, se disponíveis
-                token = email_data.get('telegram_token')
-                chat_id = email_data.get('telegram_chat_id')
-                
-                logger.info(f"Enviando alerta para {email_data['username']} usando token: {'personalizado' if token else 'padrão'}, chat_id: {chat_id or 'padrão'}")
-                
+            self._dispatch(email_data)
+
+    def replay_outbox(self) -> int:
+        """Reenvia os alertas do outbox que não foram entregues antes da última parada"""
+        if not self.outbox:
+            return 0
+        pending = self.outbox.pending()
+        if pending:
+            logger.info(f"Reenviando {len(pending)} alertas pendentes do outbox")
+        for email_data in pending:
+            self._dispatch(email_data)
+        return len(pending)
+
+    def _dispatch(self, email_data: Dict):
+        """Distribui o alerta aos destinos; alertas não críticos passam pelo agrupador de rajadas"""
+        copies = self._fan_out(email_data)
+        if self.coalescer and not email_data.get('critical'):
+            for copy in copies:
+                self.coalescer.add((copy['telegram_token'], copy['telegram_chat_id']), copy)
+        else:
+            self._submit_all(copies)
+
+    def _fan_out(self, email_data: Dict) -> List[Dict]:
+        """
+        Uma cópia do alerta para cada destino distinto da conta. Destinos que resolvem
+        para o mesmo par (token, chat_id) recebem uma única mensagem.
+        """
+        configured = email_data.get('destinations') or {}
+        candidates = [
+            (name, info.get('token') or email_data.get('telegram_token'),
+             info.get('chat_id') or email_data.get('telegram_chat_id'))
+            for name, info in configured.items()
+        ] or [('default', email_data.get('telegram_token'), email_data.get('telegram_chat_id'))]
+        
+        copies, seen = [], set()
+        for name, token, chat_id in candidates:
+            destination = self.telegram_client.resolve_destination(token, chat_id)
+            if destination in seen:
+                continue
+            seen.add(destination)
+            copies.append(dict(email_data, destination=name,
+                               telegram_token=destination[0], telegram_chat_id=destination[1]))
+        
+        if len(copies) > 1 and email_data.get('email_key'):
+            with self._fanout_lock:
+                self._fanout_pending[email_data['email_key']] = {'remaining': seen, 'failed': False}
+        return copies
+
+    def _submit_all(self, copies: List[Dict]):
+        """Envia as cópias de um alerta; sem fila de entrega, os destinos são atendidos em paralelo"""
+        if self.delivery_queue or len(copies) == 1:
+            for copy in copies:
+                self._submit(copy)
+            return
+        
+        def deliver(copy):
+            started = time.monotonic()
+            return copy['destination'], self.deliver_alert(copy), time.monotonic() - started
+        
+        report = list(self._fanout_executor.map(deliver, copies))
+        logger.info(f"Alerta {copies[0].get('email_key', '')} distribuído: " +
+                    ', '.join(f"{name} {'ok' if ok else 'falhou'} ({latency:.2f}s)" for name, ok, latency in report))
+
+    def _emit_group(self, destination, alerts: List[Dict]):
+        """Envia os alertas retidos de um destino: individualmente ou como resumo"""
+        if len(alerts) < self.coalescer.threshold:
+            for email_data in alerts:
+                self._submit(email_data)
+            return
+        token, chat_id = destination
+        parts = self.telegram_client.format_digest(alerts)
+        logger.info(f"Rajada de {len(alerts)} alertas para o chat {chat_id} enviada como resumo em {len(parts)} partes")
+        for message, part in parts:
+            self._submit({
+                'digest': True,
+                'username': ', '.join(sorted({alert['username'] for alert in part})),
+                'message': message,
+                'parse_mode': 'MarkdownV2',
+                'telegram_token': token,
+                'telegram_chat_id': chat_id,
+                'destination': part[0].get('destination', 'default'),
+                'email_keys': [alert.get('email_key') for alert in part],
+                'email_key': f"digest:{part[0].get('email_key', '')}+{len(part)}"
+            })
+
+    def _submit(self, email_data: Dict):
+        """Envia o alerta ou o enfileira, se houver fila de entrega"""
+        if self.delivery_queue:
+            # Bloqueia enquanto a fila estiver cheia (backpressure sobre o polling)
+            if not self.delivery_queue.put(DeliveryJob(email_data, key=email_data.get('email_key', ''))):
+                logger.error(f"Fila de entrega encerrada; alerta de {email_data['username']} não enfileirado")
+        else:
+            self.deliver_alert(email_data)
+
+    def _finished(self, email_data: Dict, ok: bool, latency: float, permanent: bool = False):
+        """
+        Registra o resultado do envio para um destino. O alerta (ou os alertas de um
+        resumo) sai do outbox quando todos os seus destinos o receberam; uma falha
+        ``permanent`` (bot bloqueado, chat inexistente) não o retém, pois o reenvio
+        falharia de novo.
+        """
+        label = f"{email_data.get('destination', 'default')} ({email_data.get('telegram_chat_id')})"
+        with self._metrics_lock:
+            metrics = self.destination_metrics.setdefault(label, {
+                'sent': 0, 'failed': 0, 'last_latency': None, 'max_latency': 0.0, 'total_latency': 0.0
+            })
+            metrics['sent' if ok else 'failed'] += 1
+            metrics['last_latency'] = round(latency, 3)
+            metrics['max_latency'] = max(metrics['max_latency'], round(latency, 3))
+            metrics['total_latency'] += latency
+        
+        destination = (email_data.get('telegram_token'), email_data.get('telegram_chat_id'))
+        keys = email_data['email_keys'] if email_data.get('digest') else [email_data.get('email_key')]
+        for key in filter(None, keys):
+            release = ok or permanent
+            with self._fanout_lock:
+                pending = self._fanout_pending.get(key)
+                if pending is not None:
+                    pending['remaining'].discard(destination)
+                    pending['failed'] = pending['failed'] or not release
+                    if pending['remaining']:
+                        continue
+                    del self._fanout_pending[key]
+                    release = not pending['failed']
+            if release and self.outbox:
+                self.outbox.ack(key)
+
+    def _render(self, email_data: Dict):
+        """Mensagens (partes) e parse_mode do alerta ou do resumo já montado"""
+        if email_data.get('digest'):
+            return [email_data['message']], email_data['parse_mode']
+        return self.telegram_client.format_alert_parts(
+            subject=email_data['subject'],
+            from_addr=email_data['from'],
+            body=email_data['body'],
+            alert_type=alert_type_for(email_data.get('severity'))
+        )
+
+    def _deliver_job(self, job: DeliveryJob):
+        """
+        Entrega um alerta da fila respeitando o limitador de taxa. Em vez de dormir,
+        retorna ``Retry`` para que a fila reagende o job e libere o worker.
+        """
+        email_data = job.payload
+        token, chat_id = self.telegram_client.resolve_destination(email_data.get('telegram_token'),
+                                                                  email_data.get('telegram_chat_id'))
+        if 'messages' not in job.context:
+            # Alertas longos podem ter várias partes; as já enviadas não são repetidas
+            job.context['messages'], job.context['parse_mode'] = self._render(email_data)
+            job.context['next_part'] = 0
+        messages = job.context['messages']
+
+        while True:
+            if not job.context.get('reserved'):
+                # A reserva é feita uma única vez por parte: ao ser reagendado o job já tem seu horário
+                job.context['reserved'] = True
+                wait = self.rate_limiter.reserve(token, chat_id)
+                if wait > 0:
+                    return Retry(wait, 'limite de taxa')
+            else:
+                blocked = self.rate_limiter.blocked_for(token, chat_id)
+                if blocked > 0:
+                    return Retry(blocked, 'retry_after')
+
+            started = time.monotonic()
+            result = self.telegram_client.send_message_once(messages[job.context['next_part']],
+                                                            job.context['parse_mode'], token, chat_id)
+            latency = time.monotonic() - started
+            if not result.ok:
+                break
+            job.context['next_part'] += 1
+            job.context.pop('reserved', None)
+            if job.context['next_part'] == len(messages):
+                logger.info(f"Alerta enviado com sucesso para {email_data['username']}")
+                self._finished(email_data, True, latency)
+                return True
+
+        job.context.pop('reserved', None)
+        decision = self.retry_policy.decide(result, job.attempts, plain_text=job.context['parse_mode'] is None)
+        if decision.plain_text:
+            # Partes ainda não enviadas seguem sem formatação
+            job.context['messages'] = [to_plain_text(message) for message in messages]
+            job.context['parse_mode'] = None
+        if result.retry_after is not None:
+            self.rate_limiter.block(token, chat_id, result.retry_after)
+        if decision.retry:
+            return Retry(decision.delay, decision.reason)
+        permanent = decision.error_class == PERMANENT
+        logger.error(f"Falha ao enviar alerta para {email_data['username']} após {job.attempts} tentativas"
+                     + (f" ({decision.reason}, permanente)" if permanent else
+                        "; mantido no outbox para a próxima inicialização" if self.outbox else ""))
+        self._finished(email_data, False, latency, permanent=permanent)
+        return False
+
+    def deliver_alert(self, email_data: Dict) -> bool:
+        """
+        Envia o alerta de um e-mail ao Telegram. Sem fila de entrega o envio roda no
+        ciclo de polling, então as esperas entre tentativas ficam dentro de ``poll_timeout``.
+        """
+        started = time.monotonic()
+        deadline = Deadline(self.poll_timeout)
+        try:
+            # Usa telegram_token e chat_id específicos da conta, se disponíveis
+            token = email_data.get('telegram_token')
+            chat_id = email_data.get('telegram_chat_id')
+            
+            logger.info(f"Enviando alerta para {email_data['username']} usando token: {'personalizado' if token else 'padrão'}, chat_id: {chat_id or 'padrão'}")
+            
+            if email_data.get('digest'):
+                result = self.telegram_client.send_text_message(
+                    message=email_data['message'],
+                    parse_mode=email_data['parse_mode'],
+                    token=token,
+                    chat_id=chat_id,
+                    deadline=deadline
+                )
+            else:
                 # Log detalhado dos detalhes do alerta a ser enviado
                 logger.debug(f"Detalhes do alerta: Subject='{email_data['subject']}', From='{email_data['from']}', Body Length={len(email_data['body']) if email_data['body'] else 0}")
                 
@@ -325,20 +1312,64 @@ class EmailHandler:
                     subject=email_data['subject'],
                     from_addr=email_data['from'],
                     body=email_data['body'],
+                    alert_type=alert_type_for(email_data.get('severity')),
                     token=token,
-                    chat_id=chat_id
+                    chat_id=chat_id,
+                    deadline=deadline
                 )
+            
+            if result:
+                logger.info(f"Alerta enviado com sucesso para {email_data['username']}")
+            else:
+                logger.error(f"Falha ao enviar alerta para {email_data['username']}")
+            self._finished(email_data, bool(result), time.monotonic() - started)
+            return bool(result)
                 
-                if result:
-                    logger.info(f"Alerta enviado com sucesso para {email_data['username']}")
-                else:
-                    logger.error(f"Falha ao enviar alerta para {email_data['username']}")
-                    
-            except Exception as e:
-                logger.error(f"Erro ao processar e-mail para {email_data.get('username', 'desconhecido')}: {e}")
+        except Exception as e:
+            logger.error(f"Erro ao processar e-mail para {email_data.get('username', 'desconhecido')}: {e}")
+            self._finished(email_data, False, time.monotonic() - started)
+            return False
+
+    def get_bot_tokens(self) -> List[str]:
+        """Tokens de bot configurados: o padrão, os das contas e os de notification_destinations"""
+        tokens = [self.telegram_client.default_token]
+        for connection in self.connections.values():
+            tokens.append(connection.telegram_token)
+            tokens.extend(info.get('token') for info in (connection.notification_destinations or {}).values())
+        return list(dict.fromkeys(token for token in tokens if token))
+
+    def get_destination_metrics(self) -> Dict[str, Dict]:
+        """Resultado e latência de envio (s) por destino"""
+        with self._metrics_lock:
+            metrics = {label: dict(values) for label, values in self.destination_metrics.items()}
+        for values in metrics.values():
+            total = values.pop('total_latency')
+            values['avg_latency'] = round(total / (values['sent'] + values['failed']), 3)
+        return metrics
+
+    def get_delivery_metrics(self) -> Optional[Dict]:
+        """Métricas da fila de entrega e do limitador de taxa (None no modo síncrono)"""
+        if not self.delivery_queue:
+            return None
+        metrics = dict(self.delivery_queue.metrics(), rate_limiter=self.rate_limiter.metrics(),
+                       retry=self.retry_policy.metrics())
+        if self.coalescer:
+            metrics['coalescer'] = self.coalescer.metrics()
+        if self.outbox:
+            metrics['outbox'] = self.outbox.metrics()
+        return metrics
                 
     def shutdown(self):
         """Encerra todas as conexões IMAP"""
+        if self.coalescer:
+            self.coalescer.close()
+        if self.delivery_queue:
+            self.delivery_queue.stop()
+        if self.outbox:
+            self.outbox.close()
+        self._fanout_executor.shutdown(wait=False)
+        if self._executor:
+            self._executor.shutdown(wait=False)
         for username, connection in self.connections.items():
             connection.disconnect()
 
@@ -398,11 +1429,7 @@ def get_email_body(message):
                 if ctype == 'text/html':
                     try:
                         html = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                        # Remove tags HTML de forma simples
-                        body = html.replace('<br>', '\n').replace('<br/>', '\n').replace('<p>', '\n').replace('</p>', '\n')
-                        import re
-                        body = re.sub('<[^<]+?>', '', body)
-                        body = body.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>')
+                        body = html_to_text(html)
                         break
                     except:
                         continue
@@ -413,6 +1440,14 @@ def get_email_body(message):
         except:
             body = str(message.get_payload())
 
-    # Limpa o texto
-    body = '\n'.join(line.strip() for line in body.splitlines() if line.strip())
-    return body
+    return clean_body_text(body)
+
+def html_to_text(html):
+    """Remove tags HTML de forma simples"""
+    body = html.replace('<br>', '\n').replace('<br/>', '\n').replace('<p>', '\n').replace('</p>', '\n')
+    body = re.sub('<[^<]+?>', '', body)
+    return body.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>')
+
+def clean_body_text(body):
+    """Remove linhas vazias e espaços nas bordas de cada linha"""
+    return '\n'.join(line.strip() for line in body.splitlines() if line.strip())
@@ -0,0 +1,250 @@
+"""
+Formatação de mensagens do Telegram em MarkdownV2: escape compartilhado e templates compilados
+"""
+
+import re
+from datetime import datetime
+from string import Formatter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Caracteres que o MarkdownV2 exige escapar fora de entidades (a barra invertida inclusive)
+MARKDOWN_V2_SPECIAL = '\\_*[]()~`>#+-=|{}.!'
+# Dentro de blocos ``` e `código` apenas a crase e a barra invertida são especiais
+MARKDOWN_V2_CODE_SPECIAL = '\\`'
+
+# Pares (caractere, escape) com a barra invertida primeiro. No CPython, str.translate com
+# substituições de vários caracteres é mais lento que str.replace (ver benchmark_formatting.py);
+# o teste ``in`` evita a cópia da string quando o caractere não aparece.
+_ESCAPES = tuple((char, '\\' + char) for char in MARKDOWN_V2_SPECIAL)
+_CODE_ESCAPES = tuple((char, '\\' + char) for char in MARKDOWN_V2_CODE_SPECIAL)
+
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Tamanho máximo do texto de uma mensagem do Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Trecho do corpo exibido quando o alerta não é dividido (caracteres já escapados)
+ALERT_BODY_LIMIT = 1000
+# Limite de remetente/assunto no alerta (caracteres já escapados)
+ALERT_FIELD_LIMIT = 300
+ELLIPSIS = '…'
+# Bloco de texto bruto escapado por vez ao consumir o orçamento
+_ESCAPE_CHUNK = 256
+
+
+def _escape(text, escapes) -> str:
+    if text is None:
+        return ""
+    text = str(text)
+    for char, escaped in escapes:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def escape_markdown(text) -> str:
+    """Escapa caracteres especiais do Markdown V2 do Telegram"""
+    return _escape(text, _ESCAPES)
+
+
+def escape_code(text) -> str:
+    """Escapa texto exibido dentro de um bloco de código (```)"""
+    return _escape(text, _CODE_ESCAPES)
+
+
+def _raw(text) -> str:
+    return "" if text is None else str(text)
+
+
+def escape_prefix(text, budget: int, escaper: Callable = escape_markdown, start: int = 0) -> Tuple[str, int]:
+    """
+    Escapa o maior trecho de ``text`` a partir de ``start`` cujo resultado cabe em
+    ``budget`` caracteres. Retorna (trecho escapado, posição final no texto bruto).
+
+    O texto é escapado em blocos, à medida que o orçamento é consumido: pouco além
+    do que cabe é escapado e uma sequência de escape nunca é cortada ao meio.
+    """
+    text = _raw(text)
+    out, used, pos, end = [], 0, start, len(text)
+    while pos < end and used < budget:
+        room = budget - used
+        chunk = text[pos:pos + min(_ESCAPE_CHUNK, room)]
+        escaped = escaper(chunk)
+        if len(escaped) > room:
+            if room < 2:
+                break
+            # Cada caractere escapado ocupa no máximo 2: metade do espaço restante sempre cabe
+            chunk = text[pos:pos + room // 2]
+            escaped = escaper(chunk)
+        out.append(escaped)
+        used += len(escaped)
+        pos += len(chunk)
+    return ''.join(out), pos
+
+
+def escape_truncated(text, budget: int, escaper: Callable = escape_markdown) -> str:
+    """Escapa ``text`` limitado a ``budget`` caracteres, terminando em reticências se cortado"""
+    text = _raw(text)
+    escaped, pos = escape_prefix(text, budget, escaper)
+    if pos >= len(text):
+        return escaped
+    escaped, _ = escape_prefix(text, budget - len(ELLIPSIS), escaper)
+    return escaped + ELLIPSIS
+
+
+def split_escaped(text, budgets: Iterable[int], escaper: Callable = escape_code) -> Tuple[List[str], bool]:
+    """
+    Divide ``text`` em trechos escapados, o i-ésimo com até ``budgets[i]`` caracteres,
+    preferindo quebrar em fim de linha. Retorna (trechos, truncado); o texto além do
+    último orçamento não chega a ser escapado.
+    """
+    text = _raw(text)
+    parts, pos, end = [], 0, len(text)
+    budgets = list(budgets)
+    for index, budget in enumerate(budgets):
+        if pos >= end:
+            break
+        last = index == len(budgets) - 1
+        escaped, stop = escape_prefix(text, budget - (len(ELLIPSIS) if last else 0), escaper, pos)
+        if stop < end and not last:
+            newline = text.rfind('\n', pos, stop)
+            # Só volta até a quebra de linha se ela não desperdiçar mais da metade do trecho
+            if newline >= pos + (stop - pos) // 2:
+                stop = newline + 1
+                escaped = escaper(text[pos:stop])
+        parts.append(escaped)
+        pos = stop
+    truncated = pos < end
+    if truncated and parts:
+        parts[-1] += ELLIPSIS
+    return parts, truncated
+
+
+# Escape (barra + caractere), bloco de código ou marcador de estilo fora de escape
+_MARKUP = re.compile(r'\\(.)|```|[*_~]', re.DOTALL)
+
+
+def to_plain_text(text) -> str:
+    """Remove escapes e marcadores do Markdown, para reenvio sem parse_mode"""
+    return _MARKUP.sub(lambda match: match.group(1) or '', _raw(text))
+
+
+def timestamp(now: Optional[datetime] = None) -> str:
+    """Data/hora no formato exibido nas mensagens"""
+    return (now or datetime.now()).strftime(TIMESTAMP_FORMAT)
+
+
+class MessageTemplate:
+    """
+    Template MarkdownV2 compilado uma única vez.
+
+    A fonte usa a sintaxe de ``str.format`` com campos nomeados; o texto fixo já
+    deve estar escrito em MarkdownV2. Na renderização os campos são escapados
+    (``code`` para campos dentro de blocos de código, ``raw`` para trechos já
+    formatados) e concatenados às partes estáticas pré-processadas. ``limits``
+    limita o tamanho escapado de campos, cortando o texto bruto antes do escape.
+    """
+
+    def __init__(self, source: str, code: Iterable[str] = (), raw: Iterable[str] = (),
+                 limits: Optional[Dict[str, int]] = None):
+        self.source = source
+        code, raw, limits = set(code), set(raw), limits or {}
+        self._parts: List[Tuple[str, Optional[str], Callable]] = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if spec or conversion:
+                raise ValueError(f"Template não suporta formatação no campo '{field}'")
+            escaper = _raw if field in raw else escape_code if field in code else escape_markdown
+            if field in limits:
+                escaper = self._limited(escaper, limits[field])
+            self._parts.append((literal, field, escaper))
+        self.fields = [field for _, field, _ in self._parts if field is not None]
+
+    @staticmethod
+    def _limited(escaper: Callable, limit: int) -> Callable:
+        return lambda value: escape_truncated(value, limit, escaper)
+
+    def render(self, **values) -> str:
+        """Renderiza o template escapando os valores dos campos"""
+        out = []
+        for literal, field, escaper in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(escaper(values[field]))
+        return ''.join(out)
+
+
+# O corpo chega já escapado (e dividido) por render_alert
+ALERT_TEMPLATE = MessageTemplate(
+    "*{alert_type}*\n\n"
+    "📧 *De:* {from_addr}\n"
+    "📝 *Assunto:* {subject}\n"
+    "⏰ *Data:* {date}\n\n"
+    "💬 *Conteúdo:*\n```\n{body}```",
+    raw=('body',),
+    limits={'alert_type': ALERT_FIELD_LIMIT, 'from_addr': ALERT_FIELD_LIMIT, 'subject': ALERT_FIELD_LIMIT}
+)
+ALERT_CONTINUATION = MessageTemplate("💬 *Conteúdo \\({index}/{total}\\):*\n```\n{body}```", raw=('body',))
+
+STARTUP_BANNER = MessageTemplate(
+    "🟢 *WegNots Monitor Iniciado*\n\n"
+    "⏰ {time}\n"
+    "✅ Sistema de monitoramento iniciado com sucesso\\.\n"
+    "✉️ Monitorando e\\-mails\\.\\.\\."
+)
+
+SHUTDOWN_BANNER = MessageTemplate(
+    "🔴 *WegNots Monitor Encerrado*\n\n"
+    "⏰ {time}\n"
+    "✅ Sistema encerrado de forma segura\\.\n"
+    "🔔 Monitoramento interrompido\\."
+)
+
+ACCOUNT_ITEM = MessageTemplate("\n   {index}\\. {account}")
+SHUTDOWN_SINGLE_ACCOUNT = MessageTemplate("\n\n📨 O monitoramento da conta {account} foi encerrado\\.")
+
+DIGEST_HEADER = MessageTemplate(
+    "*📬 {count} NOVOS EMAILS*{part}\n"
+    "👤 {accounts}\n"
+    "⏰ {time}\n\n",
+    raw=('part',)
+)
+DIGEST_ITEM = MessageTemplate("• *{from_addr}*\n  {subject}\n")
+
+
+def render_alert(alert_type, from_addr, subject, date, body, max_parts: int = 1,
+                 body_limit: int = ALERT_BODY_LIMIT, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Monta o alerta em uma ou mais mensagens de até ``limit`` caracteres. Com
+    ``max_parts`` = 1 o corpo é cortado em ``body_limit`` caracteres; com mais
+    partes ele continua nas mensagens seguintes. O corpo é cortado antes do
+    escape, e só o trecho exibido é escapado.
+    """
+    fields = dict(alert_type=alert_type, from_addr=from_addr, subject=subject, date=date)
+    first_budget = limit - len(ALERT_TEMPLATE.render(body='', **fields))
+    if max_parts <= 1:
+        budgets = [min(body_limit, first_budget)]
+    else:
+        continuation_budget = limit - len(ALERT_CONTINUATION.render(index=max_parts, total=max_parts, body=''))
+        budgets = [first_budget] + [continuation_budget] * (max_parts - 1)
+
+    chunks, _ = split_escaped(body, budgets, escape_code)
+    messages = [ALERT_TEMPLATE.render(body=chunks[0] if chunks else '', **fields)]
+    for index, chunk in enumerate(chunks[1:], 2):
+        messages.append(ALERT_CONTINUATION.render(index=index, total=len(chunks), body=chunk))
+    return messages
+
+
+def account_list(accounts: Iterable[str]) -> str:
+    """Lista numerada de contas, uma por linha"""
+    return ''.join(ACCOUNT_ITEM.render(index=i, account=account) for i, account in enumerate(accounts, 1))
+
+
+def monitored_accounts(accounts: List[str]) -> str:
+    """Trecho 'Contas monitoradas' das mensagens de inicialização"""
+    return f"\n\n📨 Contas monitoradas: {len(accounts)}" + account_list(accounts)
+
+
+def stopped_accounts(accounts: List[str]) -> str:
+    """Trecho com as contas cujo monitoramento foi encerrado"""
+    if len(accounts) > 1:
+        return "\n\n📨 O monitoramento das seguintes contas foi encerrado:" + account_list(accounts)
+    return SHUTDOWN_SINGLE_ACCOUNT.render(account=accounts[0])
@@ -0,0 +1,132 @@
+"""
+Transporte HTTP compartilhado com keep-alive e pool de conexões por token/host
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('wegnots.http_transport')
+
+# Hosts distintos mantidos por sessão (na prática apenas api.telegram.org)
+DEFAULT_POOL_CONNECTIONS = 2
+# Conexões keep-alive reaproveitáveis por host em cada sessão
+DEFAULT_POOL_MAXSIZE = 8
+
+
+class HTTPTransport:
+    """
+    Mantém uma ``requests.Session`` por chave (token do bot ou host), reaproveitando
+    conexões TCP+TLS entre mensagens. As sessões são seguras para uso concorrente:
+    cada requisição retira uma conexão livre do pool do urllib3.
+    """
+
+    def __init__(self, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        # Contadores dos pools já descartados (despejados pelo PoolManager ou fechados)
+        self._retired = {'requests': 0, 'handshakes': 0}
+
+    def session(self, key: str) -> requests.Session:
+        """Retorna (criando se necessário) a sessão associada à chave"""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                self._track(adapter)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[key] = session
+            return session
+
+    def _track(self, adapter: HTTPAdapter):
+        """Acumula os contadores de cada pool do adaptador antes que ele seja descartado"""
+        pools = adapter.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            with self._lock:
+                self._retired['requests'] += pool.num_requests
+                self._retired['handshakes'] += pool.num_connections
+            # urllib3 1.x fecha o pool aqui; o 2.x não define dispose_func
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = retire
+
+    def request(self, method: str, url: str, key: Optional[str] = None, **kwargs) -> requests.Response:
+        """Executa a requisição na sessão da chave (por padrão, o host da URL)"""
+        return self.session(key or urlsplit(url).netloc).request(method, url, **kwargs)
+
+    def get(self, url: str, key: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('GET', url, key=key, **kwargs)
+
+    def post(self, url: str, key: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('POST', url, key=key, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Contadores de conexões desde a criação do transporte: 'handshakes' (conexões
+        novas, cada uma com TCP+TLS) e 'reused' (requisições atendidas por uma conexão
+        já aberta), somando os pools ativos e os já descartados.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            requests_made, handshakes = self._retired['requests'], self._retired['handshakes']
+
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    handshakes += pool.num_connections
+                    requests_made += pool.num_requests
+        return {
+            'sessions': len(sessions),
+            'requests': requests_made,
+            'handshakes': handshakes,
+            'reused': max(0, requests_made - handshakes),
+        }
+
+    def close(self):
+        """Fecha todas as sessões e suas conexões"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+
+_transport: Optional[HTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Transporte compartilhado por todos os remetentes do processo"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HTTPTransport()
+        return _transport
+
+
+def configure_transport(pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                        pool_maxsize: int = DEFAULT_POOL_MAXSIZE) -> HTTPTransport:
+    """Substitui o transporte compartilhado, fechando o anterior"""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, HTTPTransport(pool_connections, pool_maxsize)
+    if previous:
+        previous.close()
+    logger.info(f"Transporte HTTP configurado (pool_connections={pool_connections}, pool_maxsize={pool_maxsize})")
+    return _transport
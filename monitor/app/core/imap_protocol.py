@@ -0,0 +1,250 @@
+"""
+Utilitários de protocolo IMAP: conjuntos de mensagens e parser de respostas FETCH
+"""
+
+import base64
+import binascii
+import logging
+import quopri
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger('wegnots.imap_protocol')
+
+_SPECIALS = b' ()\r\n'
+_INCOMPLETE_QP_ESCAPE = re.compile(rb'=[0-9A-Fa-f]?$')
+
+
+class IMAPParseError(Exception):
+    """Exceção para respostas IMAP malformadas."""
+    pass
+
+
+def build_message_set(ids: Iterable[int]) -> str:
+    """
+    Compacta IDs (sequência ou UID) em um conjunto IMAP, ex.: [1, 5, 7, 8, 9] -> "1,5,7:9"
+    """
+    ordered = sorted(set(int(i) for i in ids))
+    if not ordered:
+        raise ValueError("Conjunto de mensagens vazio")
+
+    ranges = []
+    start = prev = ordered[0]
+    for current in ordered[1:]:
+        if current == prev + 1:
+            prev = current
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = current
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ','.join(ranges)
+
+
+def chunked(items: List, size: int) -> Iterator[List]:
+    """Divide a lista em blocos de no máximo ``size`` elementos"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _tokenize(data) -> List:
+    """
+    Converte a resposta do imaplib (lista de bytes e tuplas (texto, literal))
+    em tokens: b'(' / b')', atoms (str), strings (bytes) e literais (bytes).
+    """
+    tokens = []
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            text, literal = item[0], item[1]
+        else:
+            text, literal = item, None
+
+        i = 0
+        length = len(text)
+        while i < length:
+            c = text[i:i + 1]
+            if c in b' \r\n':
+                i += 1
+            elif c in b'()':
+                tokens.append(c)
+                i += 1
+            elif c == b'"':
+                value = bytearray()
+                i += 1
+                while i < length and text[i:i + 1] != b'"':
+                    if text[i:i + 1] == b'\\':
+                        i += 1
+                    value += text[i:i + 1]
+                    i += 1
+                tokens.append(bytes(value))
+                i += 1
+            elif c == b'{':
+                end = text.find(b'}', i)
+                if end < 0 or literal is None:
+                    raise IMAPParseError(f"Literal sem conteúdo em {text!r}")
+                tokens.append(literal)
+                literal = None
+                i = end + 1
+            else:
+                # Atom; colchetes podem conter espaços e parênteses (ex.: BODY[HEADER.FIELDS (FROM)])
+                start = i
+                depth = 0
+                while i < length:
+                    c = text[i:i + 1]
+                    if c == b'[':
+                        depth += 1
+                    elif c == b']':
+                        depth -= 1
+                    elif depth == 0 and c in _SPECIALS:
+                        break
+                    i += 1
+                atom = text[start:i].decode('ascii', errors='replace')
+                tokens.append(int(atom) if atom.isdigit() else (None if atom.upper() == 'NIL' else atom))
+    return tokens
+
+
+def _parse_list(tokens: List, pos: int):
+    """Lê uma lista parentizada a partir de ``pos`` (logo após o '(')"""
+    values = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        if token == b'(':
+            value, pos = _parse_list(tokens, pos + 1)
+            values.append(value)
+        elif token == b')':
+            return values, pos + 1
+        else:
+            values.append(token)
+            pos += 1
+    raise IMAPParseError("Lista IMAP não terminada")
+
+
+def parse_fetch_response(data) -> List[Dict[str, Any]]:
+    """
+    Separa uma resposta FETCH de várias mensagens em um registro por mensagem.
+
+    Cada registro é um dicionário com 'SEQ' e os itens retornados pelo servidor,
+    com nomes em maiúsculas (ex.: 'UID', 'RFC822', 'BODY[1]<0>'). Respostas
+    repetidas para a mesma sequência (ex.: FLAGS não solicitados) são mescladas.
+    """
+    tokens = _tokenize(data)
+    records: Dict[int, Dict[str, Any]] = {}
+    pos = 0
+    while pos < len(tokens):
+        seq = tokens[pos]
+        if not isinstance(seq, int):
+            pos += 1
+            continue
+        if pos + 1 < len(tokens) and tokens[pos + 1] == 'FETCH':
+            pos += 1
+        if pos + 1 >= len(tokens) or tokens[pos + 1] != b'(':
+            pos += 1
+            continue
+
+        items, pos = _parse_list(tokens, pos + 2)
+        record = records.setdefault(seq, {'SEQ': seq})
+        for i in range(0, len(items) - 1, 2):
+            name = items[i]
+            if isinstance(name, str):
+                record[name.upper()] = items[i + 1]
+
+    return list(records.values())
+
+
+def parse_status_response(data) -> Dict[str, int]:
+    """
+    Converte a resposta de STATUS em um dicionário, ex.:
+    [b'"INBOX" (MESSAGES 3 UIDNEXT 9)'] -> {'MESSAGES': 3, 'UIDNEXT': 9}
+    """
+    tokens = _tokenize(data)
+    if b'(' not in tokens:
+        raise IMAPParseError(f"Resposta STATUS sem lista de atributos: {data!r}")
+    items, _ = _parse_list(tokens, tokens.index(b'(') + 1)
+    return {items[i].upper(): items[i + 1] for i in range(0, len(items) - 1, 2)
+            if isinstance(items[i], str) and isinstance(items[i + 1], int)}
+
+
+def _text(value) -> str:
+    """Normaliza um campo de BODYSTRUCTURE para str minúsculo"""
+    if isinstance(value, bytes):
+        return value.decode('ascii', errors='replace').lower()
+    if isinstance(value, str):
+        return value.lower()
+    return ''
+
+
+def _walk_structure(structure, part_id: str = ''):
+    """Percorre um BODYSTRUCTURE retornando (número da parte, parte simples)"""
+    if not isinstance(structure, list) or not structure:
+        return
+    if isinstance(structure[0], list):
+        # Multipart: as subpartes vêm antes do subtipo
+        index = 0
+        for sub in structure:
+            if not isinstance(sub, list):
+                break
+            index += 1
+            yield from _walk_structure(sub, f"{part_id}.{index}" if part_id else str(index))
+    else:
+        yield part_id or '1', structure
+
+
+def find_text_part(structure) -> Optional[Dict[str, str]]:
+    """
+    Escolhe a parte de texto a exibir no alerta a partir do BODYSTRUCTURE.
+
+    Prefere text/plain e usa text/html como alternativa, ignorando anexos.
+    Retorna {'part', 'subtype', 'encoding', 'charset'} ou None.
+    """
+    fallback = None
+    for part_id, part in _walk_structure(structure):
+        if len(part) < 7 or _text(part[0]) != 'text':
+            continue
+
+        # Em partes text/*, a disposição fica após linhas e MD5 (índice 9)
+        disposition = part[9] if len(part) > 9 and isinstance(part[9], list) else None
+        if disposition and _text(disposition[0]) == 'attachment':
+            continue
+
+        params = part[2] if isinstance(part[2], list) else []
+        charset = 'utf-8'
+        for i in range(0, len(params) - 1, 2):
+            if _text(params[i]) == 'charset':
+                charset = _text(params[i + 1]) or charset
+
+        info = {
+            'part': part_id,
+            'subtype': _text(part[1]),
+            'encoding': _text(part[5]) or '7bit',
+            'charset': charset,
+        }
+        if info['subtype'] == 'plain':
+            return info
+        if info['subtype'] == 'html' and fallback is None:
+            fallback = info
+    return fallback
+
+
+def decode_partial_body(data: bytes, encoding: str, charset: str) -> str:
+    """
+    Decodifica um trecho (possivelmente truncado) do corpo de uma parte MIME.
+    Sequências incompletas no fim do trecho são descartadas antes da decodificação.
+    """
+    if not data:
+        return ''
+    encoding = (encoding or '').lower()
+    try:
+        if encoding == 'base64':
+            compact = b''.join(data.split())
+            compact = compact[:len(compact) - len(compact) % 4]
+            data = base64.b64decode(compact)
+        elif encoding == 'quoted-printable':
+            data = quopri.decodestring(_INCOMPLETE_QP_ESCAPE.sub(b'', data))
+    except (binascii.Error, ValueError) as e:
+        logger.debug(f"Falha ao decodificar trecho {encoding}: {e}")
+
+    try:
+        return data.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return data.decode('utf-8', errors='replace')
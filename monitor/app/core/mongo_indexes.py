@@ -0,0 +1,143 @@
+"""
+Índices do MongoDB declarados como especificação e reconciliados com os existentes
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger('wegnots.mongo_indexes')
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Um índice desejado: nome, campos e as opções que o distinguem"""
+    name: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    partial_filter: Optional[Dict] = None
+    expire_after: Optional[int] = None
+
+    def same_keys(self, info: Dict) -> bool:
+        """O índice existente cobre os mesmos campos, na mesma ordem e direção"""
+        return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+                for field, direction in info.get('key', [])] == list(self.keys)
+
+    def matches(self, info: Dict) -> bool:
+        """O índice existente é exatamente este (campos e opções)"""
+        partial = info.get('partialFilterExpression')
+        return (self.same_keys(info)
+                and bool(info.get('unique', False)) == self.unique
+                and (dict(partial) if partial is not None else None) == self.partial_filter
+                and info.get('expireAfterSeconds') == self.expire_after)
+
+    def duplicates_pipeline(self) -> List[Dict]:
+        """Agregação que encontra um grupo de documentos que violaria a unicidade"""
+        stages = [{'$match': self.partial_filter}] if self.partial_filter is not None else []
+        return stages + [
+            {'$group': {'_id': {field.replace('.', '_'): f'${field}' for field, _ in self.keys}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+            {'$limit': 1},
+        ]
+
+    def model(self) -> IndexModel:
+        options = {'name': self.name}
+        if self.unique:
+            options['unique'] = True
+        if self.partial_filter is not None:
+            options['partialFilterExpression'] = self.partial_filter
+        if self.expire_after is not None:
+            options['expireAfterSeconds'] = self.expire_after
+        return IndexModel(list(self.keys), **options)
+
+
+def reconcile_indexes(collection: Collection, specs: List[IndexSpec],
+                      drop_unknown: bool = False) -> Dict[str, List[str]]:
+    """
+    Compara ``index_information()`` com a especificação e cria só o que falta. Um
+    índice existente com o mesmo nome ou os mesmos campos, mas opções diferentes,
+    é recriado (ver ``_rebuild``); índices fora da especificação só são removidos
+    com ``drop_unknown``. Com tudo em dia, custa uma consulta.
+
+    Retorna os nomes por resultado: created, rebuilt, unchanged, dropped, failed.
+    """
+    existing = collection.index_information()
+    result: Dict[str, List[str]] = {'created': [], 'rebuilt': [], 'unchanged': [], 'dropped': [], 'failed': []}
+    claimed = {'_id_'}
+    missing: List[IndexSpec] = []
+    for spec in specs:
+        name = spec.name if spec.name in existing else next(
+            (name for name, info in existing.items() if name not in claimed and spec.same_keys(info)), None)
+        if name is None:
+            missing.append(spec)
+            continue
+        claimed.add(name)
+        if spec.matches(existing[name]):
+            result['unchanged'].append(name)
+            continue
+        logger.warning(f"Índice {collection.name}.{name} difere da especificação; recriando como {spec.name}")
+        _rebuild(collection, name, existing[name], spec, result)
+
+    if missing:
+        _create(collection, missing, result)
+    for spec in missing:
+        if spec.name not in result['failed']:
+            result['created'].append(spec.name)
+
+    if drop_unknown:
+        for name in set(existing) - claimed:
+            collection.drop_index(name)
+            result['dropped'].append(name)
+    if result['created'] or result['rebuilt'] or result['dropped']:
+        logger.info(f"Índices de {collection.name} reconciliados: "
+                    + ", ".join(f"{outcome}={names}" for outcome, names in result.items() if names))
+    return result
+
+
+def _create(collection: Collection, specs: List[IndexSpec], result: Dict[str, List[str]]):
+    """Cria os índices em um único comando (uma varredura); se falhar, um a um para isolar o problema"""
+    try:
+        collection.create_indexes([spec.model() for spec in specs])
+        return
+    except OperationFailure as e:
+        if len(specs) == 1:
+            logger.error(f"Erro ao criar o índice {collection.name}.{specs[0].name}: {e}")
+            result['failed'].append(specs[0].name)
+            return
+    for spec in specs:
+        try:
+            collection.create_indexes([spec.model()])
+        except OperationFailure as e:
+            logger.error(f"Erro ao criar o índice {collection.name}.{spec.name}: {e}")
+            result['failed'].append(spec.name)
+
+
+def _rebuild(collection: Collection, name: str, info: Dict, spec: IndexSpec, result: Dict[str, List[str]]):
+    """
+    Substitui um índice divergente sem perder a unicidade que ele garante.
+
+    O MongoDB não renomeia índices nem aceita dois com os mesmos campos e opções
+    diferentes, então a troca é remover e criar. Antes, se o novo índice é único,
+    confere que não há duplicatas (senão o atual é mantido); se a criação ainda
+    assim falhar, o índice anterior é restaurado a partir de ``info``.
+    """
+    if spec.unique and list(collection.aggregate(spec.duplicates_pipeline())):
+        logger.error(f"Índice {collection.name}.{name} mantido: há documentos duplicados "
+                     f"para o índice único {spec.name}")
+        result['failed'].append(spec.name)
+        return
+
+    collection.drop_index(name)
+    try:
+        collection.create_indexes([spec.model()])
+    except OperationFailure as e:
+        logger.error(f"Erro ao recriar o índice {collection.name}.{spec.name}: {e}; restaurando {name}")
+        result['failed'].append(spec.name)
+        options = {key: value for key, value in info.items() if key not in ('key', 'v', 'ns')}
+        collection.create_indexes([IndexModel(list(info['key']), name=name, **options)])
+        return
+    result['rebuilt'].append(spec.name)
@@ -0,0 +1,181 @@
+"""
+Outbox durável de alertas: registrados antes do STORE \\Seen e removidos após a entrega
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('wegnots.outbox')
+
+DEFAULT_OUTBOX_PATH = os.path.join('data', 'alert_outbox.jsonl')
+# Janela em que o gravador acumula registros de vários produtores antes do fsync
+GROUP_COMMIT_INTERVAL = 0.005
+# Espera antes de repetir uma gravação que falhou (disco cheio, permissão)
+WRITE_RETRY_DELAY = 1.0
+# Confirmações acumuladas no arquivo antes de reescrevê-lo só com os pendentes
+COMPACT_THRESHOLD = 1000
+
+
+class Outbox:
+    """
+    Fila persistente de alertas com entrega at-least-once.
+
+    O arquivo é um log JSONL somente de acréscimo com registros ``add`` (alerta
+    completo) e ``done`` (chave entregue). Uma thread gravadora faz group commit:
+    registros de vários produtores são escritos juntos com um único fsync, e
+    ``add_many`` só retorna quando os seus estão no disco. Na inicialização o log
+    é relido e os alertas sem ``done`` voltam a ser entregues.
+    """
+
+    def __init__(self, path: str = DEFAULT_OUTBOX_PATH, commit_interval: float = GROUP_COMMIT_INTERVAL,
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.compact_threshold = compact_threshold
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Dict] = {}
+        self._buffer: List[str] = []
+        # Sequência de lotes enfileirados e a última já gravada com fsync
+        self._buffered_seq = 0
+        self._durable_seq = 0
+        self._acked_since_compact = 0
+        self._error: Optional[OSError] = None
+        self._closed = False
+        self.stats = {'added': 0, 'acked': 0, 'commits': 0, 'records': 0}
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._compact()
+        self._writer = threading.Thread(target=self._write_loop, name='outbox-writer', daemon=True)
+        self._writer.start()
+
+    def _load(self):
+        """Reconstrói os alertas pendentes a partir do log"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última linha truncada por uma queda durante a escrita
+                    logger.warning(f"Registro inválido ignorado em {self.path}:{line_number}")
+                    continue
+                if record.get('op') == 'add':
+                    self._pending[record['key']] = record['alert']
+                elif record.get('op') == 'done':
+                    self._pending.pop(record['key'], None)
+        if self._pending:
+            logger.info(f"Outbox {self.path}: {len(self._pending)} alertas pendentes de entrega")
+
+    def _compact(self):
+        """Reescreve o log de forma atômica apenas com os pendentes (chamado com o lock ou antes do gravador)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, alert in self._pending.items():
+                f.write(json.dumps({'op': 'add', 'key': key, 'alert': alert}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._acked_since_compact = 0
+
+    def add_many(self, alerts: List[Dict], key_field: str = 'email_key'):
+        """
+        Registra alertas e aguarda a gravação em disco (group commit).
+        Levanta OSError se o log não pôde ser gravado.
+        """
+        if not alerts:
+            return
+        with self._cond:
+            for alert in alerts:
+                key = alert[key_field]
+                self._pending[key] = alert
+                self._buffer.append(json.dumps({'op': 'add', 'key': key, 'alert': alert}, ensure_ascii=False) + '\n')
+            self._buffered_seq += 1
+            seq = self._buffered_seq
+            self.stats['added'] += len(alerts)
+            self._cond.notify_all()
+            while self._durable_seq < seq:
+                if self._error is not None:
+                    # O registro continua no buffer e será gravado quando o disco voltar
+                    raise self._error
+                if not self._writer.is_alive():
+                    raise OSError(f"Outbox {self.path} encerrado antes da gravação")
+                self._cond.wait(WRITE_RETRY_DELAY)
+
+    def ack(self, key: str):
+        """Marca o alerta como entregue; a gravação segue no próximo commit, sem esperar"""
+        with self._cond:
+            if self._pending.pop(key, None) is None:
+                return
+            self._buffer.append(json.dumps({'op': 'done', 'key': key}) + '\n')
+            self._buffered_seq += 1
+            self._acked_since_compact += 1
+            self.stats['acked'] += 1
+            self._cond.notify_all()
+
+    def pending(self) -> List[Dict]:
+        """Alertas ainda não entregues, na ordem em que foram registrados"""
+        with self._cond:
+            return list(self._pending.values())
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    self._cond.notify_all()
+                    return
+            if self.commit_interval:
+                # Dá tempo a outros produtores de entrarem no mesmo commit
+                time.sleep(self.commit_interval)
+            with self._cond:
+                lines, self._buffer = self._buffer, []
+                seq = self._buffered_seq
+            try:
+                self._file.write(''.join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.error(f"Erro ao gravar outbox em {self.path}: {e}")
+                with self._cond:
+                    self._error = e
+                    self._buffer[:0] = lines
+                    self._cond.notify_all()
+                    if self._closed:
+                        return
+                    self._cond.wait(WRITE_RETRY_DELAY)
+                continue
+            with self._cond:
+                self._error = None
+                self._durable_seq = seq
+                self.stats['commits'] += 1
+                self.stats['records'] += len(lines)
+                if self._acked_since_compact >= self.compact_threshold and not self._buffer:
+                    try:
+                        self._file.close()
+                        self._compact()
+                    except OSError as e:
+                        logger.error(f"Erro ao compactar outbox em {self.path}: {e}")
+                        self._file = open(self.path, 'a', encoding='utf-8')
+                self._cond.notify_all()
+
+    def close(self):
+        """Grava os registros pendentes e encerra o gravador"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+        self._file.close()
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return dict(self.stats, pending=len(self._pending))
@@ -0,0 +1,31 @@
+"""
+Processo das expressões de alerts.patterns, iniciado por PatternEngine com
+``python -m app.core.pattern_worker``.
+
+Recebe pela entrada padrão uma linha JSON com as regras e depois uma por pedido
+(texto e índice da regra), respondendo na saída padrão se a regra casou. Não
+importa o programa principal: nenhuma configuração de log ou arquivo é criada aqui.
+"""
+
+import json
+import sys
+
+from .alert_classifier import PatternEngine
+
+
+def reply(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    config = json.loads(sys.stdin.readline())
+    engine = PatternEngine(config['patterns'], isolate=False)
+    reply(True)
+    for line in sys.stdin:
+        request = json.loads(line)
+        reply({'matched': engine.match_rule(request['text'], request['rule'])})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Limitador de envio ao Telegram com token buckets hierárquicos
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger('wegnots.rate_limiter')
+
+# Limites documentados pelo Telegram para bots
+TOKEN_RATE = 30.0            # mensagens/s por bot
+CHAT_RATE = 1.0              # mensagens/s por chat
+GROUP_RATE = 20.0 / 60.0     # mensagens/s por grupo (20/min)
+GROUP_BURST = 20.0
+
+
+class TokenBucket:
+    """
+    Token bucket que aceita reservas antecipadas: o saldo pode ficar negativo e a
+    reserva informa quanto tempo falta até que o envio respeite a taxa.
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Espera até haver uma ficha disponível, sem consumi-la"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float):
+        """Consome uma ficha; saldo negativo empurra as próximas reservas para o futuro"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        """Esvazia o bucket para que a próxima ficha só exista após ``seconds``"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Agenda envios respeitando três níveis de limite: por token do bot, por chat
+    (token, chat_id) e, para grupos (chat_id negativo), por grupo. Respostas 429
+    bloqueiam o chat pelo ``retry_after`` informado pelo Telegram.
+    """
+
+    def __init__(self, token_rate: float = TOKEN_RATE, chat_rate: float = CHAT_RATE,
+                 group_rate: float = GROUP_RATE, group_burst: float = GROUP_BURST,
+                 clock: Callable[[], float] = time.monotonic):
+        self.token_rate = token_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple, TokenBucket] = {}
+        self._blocked_until: Dict[Tuple[str, str], float] = {}
+        self.stats = {'reserved': 0, 'throttled': 0, 'retry_after': 0}
+
+    def _bucket(self, key: Tuple, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity, now)
+        return bucket
+
+    def _buckets_for(self, token: str, chat_id: str, now: float):
+        buckets = [
+            self._bucket(('token', token), self.token_rate, self.token_rate, now),
+            self._bucket(('chat', token, chat_id), self.chat_rate, 1.0, now),
+        ]
+        if str(chat_id).startswith('-'):
+            buckets.append(self._bucket(('group', token, chat_id), self.group_rate, self.group_burst, now))
+        return buckets
+
+    def reserve(self, token: str, chat_id: str) -> float:
+        """
+        Reserva um envio e retorna quantos segundos esperar antes de fazê-lo
+        (0 para enviar imediatamente). Reservas sucessivas ficam em fila por chat.
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            now = self._clock()
+            buckets = self._buckets_for(token, chat_id, now)
+            wait = max([bucket.delay(now) for bucket in buckets] +
+                       [self._blocked_until.get((token, chat_id), 0.0) - now])
+            wait = max(0.0, wait)
+            for bucket in buckets:
+                bucket.reserve(now)
+            self.stats['reserved'] += 1
+            if wait > 0:
+                self.stats['throttled'] += 1
+            return wait
+
+    def blocked_for(self, token: str, chat_id: str) -> float:
+        """Segundos restantes de bloqueio por 429 para o chat"""
+        with self._lock:
+            return max(0.0, self._blocked_until.get((token, str(chat_id)), 0.0) - self._clock())
+
+    def block(self, token: str, chat_id: str, retry_after: float):
+        """Aplica o ``retry_after`` de uma resposta 429 ao chat"""
+        chat_id = str(chat_id)
+        with self._lock:
+            now = self._clock()
+            until = now + retry_after
+            key = (token, chat_id)
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), until)
+            for bucket in self._buckets_for(token, chat_id, now)[1:]:
+                bucket.block(now, retry_after)
+            self.stats['retry_after'] += 1
+        logger.warning(f"Telegram limitou o chat {chat_id} (token {token[:8]}...) por {retry_after:.0f}s")
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, buckets=len(self._buckets))
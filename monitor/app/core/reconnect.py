@@ -0,0 +1,113 @@
+"""
+Backoff exponencial com jitter e circuit breaker para reconexões IMAP
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('wegnots.reconnect')
+
+
+class ReconnectPolicy:
+    """
+    Parâmetros de reconexão (equivalentes a ``reconnect_*`` do MONITOR_CONFIG).
+
+    A n-ésima falha consecutiva aguarda ``delay * backoff_factor ** (n - 1)`` segundos
+    (limitado a ``max_delay`` e variando ±``jitter``). Após ``attempts`` falhas, ou
+    ``auth_failure_threshold`` logins recusados seguidos, o circuito abre e a conta só
+    é tentada novamente depois de ``breaker_cooldown`` segundos.
+    """
+
+    def __init__(self, attempts: int = 5, delay: float = 30.0, backoff_factor: float = 1.5,
+                 max_delay: float = 600.0, jitter: float = 0.2, breaker_cooldown: float = 1800.0,
+                 auth_failure_threshold: int = 2):
+        self.attempts = attempts
+        self.delay = delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.breaker_cooldown = breaker_cooldown
+        self.auth_failure_threshold = auth_failure_threshold
+
+    def delay_for(self, failures: int) -> float:
+        """Espera após ``failures`` falhas consecutivas, com jitter"""
+        base = min(self.max_delay, self.delay * self.backoff_factor ** max(0, failures - 1))
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class ReconnectState:
+    """
+    Máquina de estados de reconexão de uma conta: 'closed' (normal), 'backoff'
+    (aguardando a próxima tentativa) e 'open' (circuito aberto após falhas repetidas).
+    Compartilhada entre a thread de polling e a thread IDLE da mesma conta.
+    """
+
+    CLOSED = 'closed'
+    BACKOFF = 'backoff'
+    OPEN = 'open'
+
+    def __init__(self, policy: Optional[ReconnectPolicy] = None, name: str = '',
+                 clock: Callable[[], float] = time.monotonic):
+        self.policy = policy or ReconnectPolicy()
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.auth_failures = 0
+        self.trips = 0
+        self.next_attempt_at = 0.0
+
+    def wait_time(self) -> float:
+        """Segundos até a próxima tentativa permitida (0 se já pode tentar)"""
+        with self._lock:
+            return max(0.0, self.next_attempt_at - self._clock())
+
+    def can_attempt(self) -> bool:
+        """Indica se uma nova tentativa de conexão é permitida agora"""
+        return self.wait_time() == 0.0
+
+    def record_success(self):
+        """Conexão estabelecida: zera as falhas e fecha o circuito"""
+        with self._lock:
+            if self.state == self.OPEN:
+                logger.info(f"Circuito de {self.name} fechado após reconexão bem-sucedida")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.auth_failures = 0
+            self.next_attempt_at = 0.0
+
+    def record_failure(self, auth_error: bool = False) -> float:
+        """Registra uma tentativa falha e agenda a próxima; retorna a espera em segundos"""
+        with self._lock:
+            self.failures += 1
+            self.auth_failures = self.auth_failures + 1 if auth_error else 0
+
+            if self.failures >= self.policy.attempts or self.auth_failures >= self.policy.auth_failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    reason = 'login recusado' if auth_error else f'{self.failures} falhas consecutivas'
+                    logger.warning(f"Circuito de {self.name} aberto ({reason}); próxima tentativa "
+                                   f"em {self.policy.breaker_cooldown:.0f}s")
+                self.state = self.OPEN
+                delay = self.policy.breaker_cooldown
+            else:
+                self.state = self.BACKOFF
+                delay = self.policy.delay_for(self.failures)
+
+            self.next_attempt_at = self._clock() + delay
+            return delay
+
+    def snapshot(self) -> Dict:
+        """Estado atual para métricas"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'auth_failures': self.auth_failures,
+                'trips': self.trips,
+                'retry_in': round(max(0.0, self.next_attempt_at - self._clock()), 1),
+            }
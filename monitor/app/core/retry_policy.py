@@ -0,0 +1,102 @@
+"""
+Classificação de falhas de envio ao Telegram e política de novas tentativas com backoff
+"""
+
+import logging
+import random
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger('wegnots.retry_policy')
+
+# Classes de falha
+RETRY_AFTER = 'retry_after'  # 429: o Telegram informa quando tentar de novo
+TRANSIENT = 'transient'      # 5xx: falha do servidor, costuma passar
+NETWORK = 'network'          # sem resposta (timeout, conexão recusada, DNS)
+MARKUP = 'markup'            # 400 por entidades MarkdownV2 inválidas: reenviar como texto simples
+PERMANENT = 'permanent'      # demais 4xx (bot bloqueado, chat inexistente, token inválido)
+ERROR_CLASSES = (RETRY_AFTER, TRANSIENT, NETWORK, MARKUP, PERMANENT)
+
+# Trechos da descrição de um 400 que indicam erro de formatação, não de destino
+MARKUP_ERRORS = ("can't parse entities", "can't find end of the entity")
+
+
+@dataclass
+class RetryDecision:
+    """O que fazer após uma falha: tentar de novo (após ``delay``), em texto simples ou desistir"""
+    error_class: str
+    retry: bool
+    delay: float = 0.0
+    plain_text: bool = False
+    reason: str = ''
+
+
+class RetryPolicy:
+    """
+    Decide, a partir do resultado de um sendMessage, se e quando reenviar.
+
+    429 respeita o ``retry_after`` do Telegram; 5xx e falhas de rede esperam
+    ``base_delay * backoff_factor ** (n - 1)`` (limitado a ``max_delay``, variando
+    ±``jitter``) até ``max_attempts`` tentativas; erro de MarkdownV2 é reenviado uma
+    vez em texto simples; as demais falhas são permanentes e não se repetem. A
+    política só calcula a espera: quem agenda a nova tentativa é o chamador.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, backoff_factor: float = 2.0,
+                 max_delay: float = 60.0, jitter: float = 0.2):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {error_class: 0 for error_class in ERROR_CLASSES}
+        self.counters.update(retried=0, gave_up=0)
+
+    @staticmethod
+    def classify(status_code: Optional[int], description: str = '', retry_after: Optional[float] = None) -> str:
+        """Classe da falha de um envio"""
+        if status_code is None:
+            return NETWORK
+        if status_code == 429 or retry_after is not None:
+            return RETRY_AFTER
+        if status_code >= 500:
+            return TRANSIENT
+        if status_code == 400 and any(error in (description or '').lower() for error in MARKUP_ERRORS):
+            return MARKUP
+        return PERMANENT
+
+    def backoff(self, attempt: int) -> float:
+        """Espera antes da tentativa seguinte à ``attempt``-ésima, com jitter"""
+        base = min(self.max_delay, self.base_delay * self.backoff_factor ** max(0, attempt - 1))
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def decide(self, result, attempt: int, plain_text: bool = False) -> RetryDecision:
+        """
+        Decisão para um ``SendResult`` com falha na ``attempt``-ésima tentativa.
+        ``plain_text`` indica que a mensagem já foi reenviada sem formatação.
+        """
+        error_class = self.classify(result.status_code, result.description, result.retry_after)
+        if error_class == RETRY_AFTER:
+            decision = RetryDecision(error_class, True, float(result.retry_after or 0), reason='429')
+        elif error_class == MARKUP and not plain_text:
+            decision = RetryDecision(error_class, True, 0.0, plain_text=True, reason='MarkdownV2 inválido')
+        elif error_class in (TRANSIENT, NETWORK) and attempt < self.max_attempts:
+            reason = f"HTTP {result.status_code}" if error_class == TRANSIENT else 'erro de rede'
+            decision = RetryDecision(error_class, True, self.backoff(attempt), reason=reason)
+        else:
+            decision = RetryDecision(error_class, False, reason=f"HTTP {result.status_code}"
+                                     if result.status_code else 'erro de rede')
+
+        with self._lock:
+            self.counters[error_class] += 1
+            self.counters['retried' if decision.retry else 'gave_up'] += 1
+        if not decision.retry:
+            logger.warning(f"Envio abandonado ({error_class}, tentativa {attempt}): {result.description[:200]}")
+        return decision
+
+    def metrics(self) -> Dict[str, int]:
+        """Falhas por classe e quantas foram repetidas ou abandonadas"""
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,276 @@
+"""
+Índice em memória de roteamento dos alertas: remetente → usuários que devem recebê-los
+"""
+
+import itertools
+import logging
+import threading
+from typing import Dict, List, Optional, Set
+
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger('wegnots.routing_index')
+
+# Intervalo de recarga completa quando o servidor não oferece change streams (sem replica set)
+DEFAULT_POLL_INTERVAL = 30.0
+# Espera máxima de cada leitura do change stream, para poder verificar o pedido de parada
+WATCH_AWAIT_MS = 1000
+# Pausa antes de reabrir um change stream interrompido
+WATCH_RETRY_DELAY = 5.0
+# Códigos do MongoDB para "change streams não suportados" (servidor standalone)
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40415, 20)
+# Operações do change stream que invalidam o índice inteiro
+INVALIDATING_OPERATIONS = ('drop', 'dropDatabase', 'rename', 'invalidate')
+
+
+def sender_domain(email: str) -> Optional[str]:
+    """Domínio de um endereço, ou None se não houver"""
+    _, at, domain = (email or '').rpartition('@')
+    return domain if at and domain else None
+
+
+class RoutingIndex:
+    """
+    Remetentes → destinatários, montado a partir da coleção ``users`` com uma única
+    consulta e respondendo cada roteamento com buscas em dicionário, sem ida ao
+    MongoDB por alerta. Também guarda o servidor central.
+
+    As mesmas regras de ``UserModel.get_users_by_email``: o próprio usuário (campo
+    ``email``), regras com o remetente exato em ``notification_rules.sender`` e
+    regras ``*@domínio``, comparados exatamente como na consulta (inclusive maiúsculas
+    e minúsculas). O índice é mantido atualizado por um change stream da
+    coleção; se o servidor não os suporta, é recarregado a cada ``poll_interval``.
+    """
+
+    def __init__(self, collection: Collection, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._users: Dict = {}
+        # Ordem de carga de cada usuário, para respostas na mesma ordem da coleção
+        self._order: Dict = {}
+        self._sequence = itertools.count()
+        self._by_email: Dict[str, Set] = {}
+        self._by_sender: Dict[str, Set] = {}
+        self._by_domain: Dict[str, Set] = {}
+        self._central_id = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Ponto de retomada do change stream (último evento aplicado)
+        self._resume_token = None
+        self.mode: Optional[str] = None
+        self.stats = {'rebuilds': 0, 'changes': 0, 'lookups': 0}
+
+    @staticmethod
+    def _keys(user: Dict):
+        senders, domains = set(), set()
+        for rule in user.get('notification_rules') or ():
+            sender = rule.get('sender') if isinstance(rule, dict) else None
+            if not isinstance(sender, str):
+                continue
+            if sender.startswith('*@'):
+                domains.add(sender[2:])
+            else:
+                senders.add(sender)
+        return user.get('email'), senders, domains
+
+    def _add(self, user: Dict):
+        user_id = user['_id']
+        self._users[user_id] = user
+        if user_id not in self._order:
+            self._order[user_id] = next(self._sequence)
+        email, senders, domains = self._keys(user)
+        if email:
+            self._by_email.setdefault(email, set()).add(user_id)
+        for sender in senders:
+            self._by_sender.setdefault(sender, set()).add(user_id)
+        for domain in domains:
+            self._by_domain.setdefault(domain, set()).add(user_id)
+        if user.get('is_central_server') and self._central_id is None:
+            self._central_id = user_id
+
+    def _remove(self, user_id):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        email, senders, domains = self._keys(user)
+        for index, keys in ((self._by_email, [email] if email else []), (self._by_sender, senders),
+                            (self._by_domain, domains)):
+            for key in keys:
+                ids = index.get(key)
+                if ids:
+                    ids.discard(user_id)
+                    if not ids:
+                        del index[key]
+        if self._central_id == user_id:
+            self._central_id = next((other_id for other_id, other in self._users.items()
+                                     if other.get('is_central_server')), None)
+
+    def rebuild(self):
+        """Recarrega o índice inteiro com uma única consulta"""
+        users = list(self.collection.find({}))
+        with self._lock:
+            self._users, self._order, self._by_email, self._by_sender, self._by_domain = {}, {}, {}, {}, {}
+            self._central_id = None
+            for user in users:
+                self._add(user)
+            self.stats['rebuilds'] += 1
+        logger.debug(f"Índice de roteamento recarregado: {len(users)} usuários")
+
+    def upsert(self, user: Dict):
+        """Atualiza (ou inclui) um usuário no índice"""
+        with self._lock:
+            self._remove(user['_id'])
+            self._add(user)
+
+    def remove(self, user_id):
+        """Remove um usuário do índice"""
+        with self._lock:
+            self._remove(user_id)
+            self._order.pop(user_id, None)
+
+    def reload(self, query: Dict):
+        """Relê do MongoDB os usuários da consulta (após uma alteração feita por este processo)"""
+        found = {user['_id']: user for user in self.collection.find(query)}
+        with self._lock:
+            for user_id in [user_id for user_id, user in self._users.items()
+                            if user_id not in found and self._matches(user, query)]:
+                self._remove(user_id)
+            for user in found.values():
+                self._remove(user['_id'])
+                self._add(user)
+
+    @staticmethod
+    def _matches(user: Dict, query: Dict) -> bool:
+        return all(user.get(field) == value for field, value in query.items())
+
+    def apply(self, change: Dict):
+        """Aplica um evento do change stream"""
+        operation = change.get('operationType')
+        self.stats['changes'] += 1
+        if operation in INVALIDATING_OPERATIONS:
+            self.rebuild()
+        elif operation == 'delete':
+            self.remove(change['documentKey']['_id'])
+        elif operation in ('insert', 'update', 'replace'):
+            user = change.get('fullDocument')
+            if user is None:
+                # Documento removido antes da leitura: o delete chega a seguir
+                self.remove(change['documentKey']['_id'])
+            else:
+                self.upsert(user)
+
+    def lookup(self, email: str) -> List[Dict]:
+        """Usuários que devem receber alertas do remetente, com o servidor central ao final"""
+        with self._lock:
+            self.stats['lookups'] += 1
+            ids = set(self._by_email.get(email, ()))
+            ids.update(self._by_sender.get(email, ()))
+            domain = sender_domain(email)
+            if domain:
+                ids.update(self._by_domain.get(domain, ()))
+            users = [dict(self._users[user_id]) for user_id in sorted(ids, key=self._order.__getitem__)]
+            if self._central_id is not None and self._central_id not in ids:
+                users.append(dict(self._users[self._central_id]))
+            return users
+
+    def central_server(self) -> Optional[Dict]:
+        """Servidor central em cache"""
+        with self._lock:
+            user = self._users.get(self._central_id)
+            return dict(user) if user else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._users)
+
+    def start(self):
+        """
+        Monta o índice e passa a acompanhar a coleção em segundo plano. O change
+        stream é aberto antes da carga, para que nenhuma alteração feita durante
+        ela se perca.
+        """
+        self._stop.clear()
+        stream = self._open_stream(None)
+        try:
+            self.rebuild()
+        except Exception:
+            if stream is not None:
+                stream.close()
+            raise
+        self._thread = threading.Thread(target=self._run, args=(stream,), name='routing-index', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Interrompe a atualização em segundo plano"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _open_stream(self, resume_token):
+        """Change stream da coleção, ou None se o servidor não os suporta (passa a recarregar periodicamente)"""
+        try:
+            stream = self.collection.watch(full_document='updateLookup', resume_after=resume_token,
+                                           max_await_time_ms=WATCH_AWAIT_MS)
+        except OperationFailure as e:
+            if e.code not in CHANGE_STREAMS_UNSUPPORTED:
+                raise
+            logger.info(f"Change streams indisponíveis; índice de roteamento recarregado a cada {self.poll_interval}s")
+            self.mode = 'polling'
+            return None
+        self.mode = 'change_stream'
+        return stream
+
+    def _run(self, stream):
+        # O stream aberto por start() já foi seguido de uma carga completa
+        rebuild = False
+        while not self._stop.is_set():
+            if stream is None and self.mode == 'polling':
+                self._poll()
+                return
+            try:
+                if stream is None:
+                    stream = self._open_stream(self._resume_token)
+                    if stream is None:
+                        continue
+                self._follow(stream, rebuild)
+            except OperationFailure as e:
+                # Ex.: histórico do oplog já descartado; recomeça do zero
+                logger.warning(f"Change stream de usuários interrompido: {e}")
+                self._resume_token = None
+            except PyMongoError as e:
+                logger.warning(f"Change stream de usuários interrompido: {e}")
+            # Sem ponto de retomada, eventos podem ter se perdido: o próximo stream recarrega tudo
+            stream, rebuild = None, self._resume_token is None
+            if self._stop.wait(WATCH_RETRY_DELAY):
+                return
+
+    def _follow(self, stream, rebuild: bool):
+        """Aplica os eventos até a parada ou o fim do stream, guardando o ponto de retomada"""
+        with stream:
+            if rebuild:
+                self.rebuild()
+            while stream.alive and not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    self.apply(change)
+                    if change.get('operationType') == 'invalidate':
+                        # Coleção removida/renomeada: não há como retomar este stream
+                        self._resume_token = None
+                        return
+                self._resume_token = stream.resume_token
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.rebuild()
+            except PyMongoError as e:
+                logger.error(f"Erro ao recarregar o índice de roteamento: {e}")
+
+    def metrics(self) -> Dict:
+        """Tamanho do índice, modo de atualização e contadores"""
+        with self._lock:
+            return dict(self.stats, users=len(self._users), senders=len(self._by_sender),
+                        domains=len(self._by_domain), mode=self.mode)
@@ -3,9 +3,9 @@
 Módulo para gerenciar os comandos do bot Telegram do WegNots
 """
 
-import requests
 import logging
 from typing import Dict, Any, Optional
+from .http_transport import get_transport
 
 logger = logging.getLogger('wegnots.telegram.commands')
 
@@ -13,6 +13,7 @@ class TelegramCommands:
     def __init__(self, token: str):
         self.token = token
         self.base_url = f"https://api.telegram.org/bot{token}"
+        self.transport = get_transport()
         
     def set_bot_commands(self) -> bool:
         """Configura os comandos disponíveis no bot"""
@@ -24,7 +25,7 @@ class TelegramCommands:
         ]
         
         try:
-            response = requests.post(url, json={"commands": commands})
+            response = self.transport.post(url, key=self.token, json={"commands": commands})
             if response.status_code == 200:
                 logger.info("Comandos do bot configurados com sucesso")
                 return True
@@ -35,11 +36,14 @@ class TelegramCommands:
             logger.error(f"Exceção ao configurar comandos do bot: {e}")
             return False
     
-    def set_webhook(self, webhook_url: str) -> bool:
-        """Configura um webhook para o bot"""
+    def set_webhook(self, webhook_url: str, secret_token: Optional[str] = None) -> bool:
+        """Configura um webhook para o bot (secret_token volta no cabeçalho de cada update)"""
         url = f"{self.base_url}/setWebhook"
+        payload = {"url": webhook_url, "allowed_updates": ["message"]}
+        if secret_token:
+            payload["secret_token"] = secret_token
         try:
-            response = requests.post(url, json={"url": webhook_url})
+            response = self.transport.post(url, key=self.token, json=payload)
             if response.status_code == 200:
                 logger.info(f"Webhook configurado com sucesso: {webhook_url}")
                 return True
@@ -49,6 +53,21 @@ class TelegramCommands:
         except Exception as e:
             logger.error(f"Exceção ao configurar webhook: {e}")
             return False
+
+    def delete_webhook(self) -> bool:
+        """Remove o webhook do bot; com webhook ativo o getUpdates responde 409"""
+        url = f"{self.base_url}/deleteWebhook"
+        try:
+            response = self.transport.post(url, key=self.token, json={})
+            if response.status_code == 200:
+                logger.info("Webhook removido; comandos seguem por long polling")
+                return True
+            else:
+                logger.error(f"Erro ao remover webhook: {response.status_code} - {response.text}")
+                return False
+        except Exception as e:
+            logger.error(f"Exceção ao remover webhook: {e}")
+            return False
     
     def handle_start_command(self, chat_id: str) -> bool:
         """Lida com o comando /start enviando uma mensagem amigável em português"""
@@ -63,7 +82,7 @@ class TelegramCommands:
         )
         
         try:
-            response = requests.post(url, json={
+            response = self.transport.post(url, key=self.token, json={
                 "chat_id": chat_id,
                 "text": message,
                 "parse_mode": "Markdown",
@@ -94,7 +113,7 @@ class TelegramCommands:
         )
         
         try:
-            response = requests.post(url, json={
+            response = self.transport.post(url, key=self.token, json={
                 "chat_id": chat_id,
                 "text": message,
                 "parse_mode": "Markdown"
@@ -125,7 +144,7 @@ class TelegramCommands:
         )
         
         try:
-            response = requests.post(url, json={
+            response = self.transport.post(url, key=self.token, json={
                 "chat_id": chat_id,
                 "text": message,
                 "parse_mode": "Markdown"
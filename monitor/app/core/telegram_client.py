@@ -1,17 +1,50 @@
-import requests
 import logging
 import json
+import time
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
+from .deadline import Deadline
+from .formatting import (DIGEST_HEADER, DIGEST_ITEM, TELEGRAM_MESSAGE_LIMIT, escape_markdown, render_alert, timestamp,
+                         to_plain_text)
+from .http_transport import get_transport
+from .retry_policy import RetryPolicy
 from .telegram_bot_commands import TelegramCommands
 
 logger = logging.getLogger('wegnots.telegram_client')
 
+# Espera entre tentativas quando o Telegram não informa retry_after
+SEND_RETRY_DELAY = 2
+# Espaço reservado ao cabeçalho de cada parte do resumo
+DIGEST_HEADER_RESERVE = 200
+# Limite do assunto/remetente em cada linha do resumo (antes do escape)
+DIGEST_FIELD_LIMIT = 150
+
+
+@dataclass
+class SendResult:
+    """Resultado de uma única chamada a sendMessage"""
+    ok: bool
+    status_code: Optional[int] = None
+    retry_after: Optional[float] = None
+    description: str = ''
+
+
 class TelegramClient:
-    def __init__(self, token, chat_id):
+    # Mensagens por alerta: 1 corta o corpo; mais partes continuam o corpo nas mensagens seguintes
+    max_alert_parts = 1
+    _updates_offset = None
+
+    def __init__(self, token, chat_id, max_alert_parts=1, retry_policy=None):
         self.default_token = token
+        self.max_alert_parts = max(1, max_alert_parts)
+        # Classifica falhas: erros permanentes não são repetidos e MarkdownV2 inválido vira texto simples
+        self.retry_policy = retry_policy or RetryPolicy()
         self.default_chat_id = chat_id
         self.base_url = f"https://api.telegram.org/bot{token}"
         self.commands = TelegramCommands(token)
+        # Conexões keep-alive compartilhadas, uma sessão por token
+        self.transport = get_transport()
         
         # Mapping for specific token -> chat_id relationships
         self.token_chat_map = {
@@ -32,8 +65,8 @@ class TelegramClient:
         except Exception as e:
             logger.error(f"Erro ao configurar comandos do bot: {e}")
         
-    def send_text_message(self, message, parse_mode='Markdown', token=None, chat_id=None):
-        """Envia mensagem de texto para o Telegram usando token e chat_id específicos ou os padrões"""
+    def resolve_destination(self, token=None, chat_id=None):
+        """Retorna o par (token, chat_id) efetivo, aplicando padrões e mapeamentos"""
         # Usa os valores padrão se não for fornecido
         token = token or self.default_token
         
@@ -43,101 +76,162 @@ class TelegramClient:
             logger.info(f"Usando chat_id {chat_id} mapeado para o token {token[:8]}...")
         else:
             chat_id = chat_id or self.default_chat_id
-        
-        # Constrói a URL com o token correto
+        return token, chat_id
+
+    def send_message_once(self, message, parse_mode='Markdown', token=None, chat_id=None):
+        """
+        Faz uma única tentativa de envio, sem esperas. Em respostas 429 o
+        ``retry_after`` informado pelo Telegram vem no resultado para que o
+        chamador reagende o envio.
+        """
+        token, chat_id = self.resolve_destination(token, chat_id)
         url = f"https://api.telegram.org/bot{token}/sendMessage"
         
-        # Faz até 5 tentativas em caso de falha
-        max_retries = 5
-        for attempt in range(1, max_retries + 1):
-            try:
-                logger.debug(f"Tentativa {attempt}/{max_retries} de envio para {chat_id} usando token: {token[:8]}...")
-                
-                response = requests.post(url, json={
-                    'chat_id': chat_id,
-                    'text': message,
-                    'parse_mode': parse_mode
-                }, timeout=10)  # Adicionando timeout de 10 segundos
-                
-                if response.status_code == 200:
-                    logger.info(f"Mensagem enviada com sucesso para chat_id {chat_id} usando token: {token[:8]}...")
-                    
-                    # Se a mensagem foi enviada com sucesso para um token específico
-                    # e não havia mapeamento anterior, salva o mapeamento
-                    if token != self.default_token and token not in self.token_chat_map:
-                        self.token_chat_map[token] = chat_id
-                        logger.info(f"Mapeamento token->chat_id salvo: {token[:8]}... -> {chat_id}")
-                        
-                    return True
-                else:
-                    logger.error(f"Erro ao enviar mensagem para chat_id {chat_id} usando token {token[:8]}: {response.status_code} - {response.text}")
-                    if attempt < max_retries:
-                        # Aguarda um pouco antes de tentar novamente
-                        import time
-                        time.sleep(2)  
-                    else:
-                        return False
-                    
-            except Exception as e:
-                logger.error(f"Exceção ao enviar mensagem para chat_id {chat_id} usando token {token[:8]}: {e}")
-                if attempt < max_retries:
-                    # Aguarda um pouco antes de tentar novamente
-                    import time
-                    time.sleep(2)
-                else:
-                    return False
+        payload = {'chat_id': chat_id, 'text': message}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        try:
+            response = self.transport.post(url, key=token, json=payload, timeout=10)  # Adicionando timeout de 10 segundos
+        except Exception as e:
+            logger.error(f"Exceção ao enviar mensagem para chat_id {chat_id} usando token {token[:8]}: {e}")
+            return SendResult(False, description=str(e))
+        
+        if response.status_code == 200:
+            logger.info(f"Mensagem enviada com sucesso para chat_id {chat_id} usando token: {token[:8]}...")
+            
+            # Se a mensagem foi enviada com sucesso para um token específico
+            # e não havia mapeamento anterior, salva o mapeamento
+            if token != self.default_token and token not in self.token_chat_map:
+                self.token_chat_map[token] = chat_id
+                logger.info(f"Mapeamento token->chat_id salvo: {token[:8]}... -> {chat_id}")
+            return SendResult(True, response.status_code)
+        
+        retry_after = None
+        description = response.text
+        try:
+            data = response.json()
+            description = data.get('description', description)
+            if response.status_code == 429:
+                retry_after = float(data.get('parameters', {}).get('retry_after', SEND_RETRY_DELAY))
+        except (ValueError, AttributeError):
+            if response.status_code == 429:
+                retry_after = float(SEND_RETRY_DELAY)
+        
+        logger.error(f"Erro ao enviar mensagem para chat_id {chat_id} usando token {token[:8]}: {response.status_code} - {description}")
+        return SendResult(False, response.status_code, retry_after, description)
+
+    def send_text_message(self, message, parse_mode='Markdown', token=None, chat_id=None,
+                          deadline: Optional[Deadline] = None):
+        """
+        Envia mensagem de texto para o Telegram usando token e chat_id específicos ou os padrões.
+        Chamada síncrona: só espera entre tentativas em falhas que a política considera
+        passageiras, e desiste se a espera passaria do ``deadline``; alertas da fila de
+        entrega são reagendados sem bloquear (ver EmailHandler).
+        """
+        token, chat_id = self.resolve_destination(token, chat_id)
+        
+        max_retries = self.retry_policy.max_attempts
+        attempt = 0
+        while attempt < max_retries:
+            attempt += 1
+            logger.debug(f"Tentativa {attempt}/{max_retries} de envio para {chat_id} usando token: {token[:8]}...")
+            result = self.send_message_once(message, parse_mode, token, chat_id)
+            if result.ok:
+                return True
+            decision = self.retry_policy.decide(result, attempt, plain_text=parse_mode is None)
+            if decision.plain_text:
+                # O reenvio em texto simples é uma tentativa a mais, mesmo após a última
+                logger.warning(f"Formatação recusada pelo Telegram; reenviando como texto simples para {chat_id}")
+                message, parse_mode = to_plain_text(message), None
+                max_retries = max(max_retries, attempt + 1)
+                continue
+            if not decision.retry or attempt == max_retries:
+                break
+            remaining = deadline.remaining() if deadline else None
+            if remaining is not None and decision.delay >= remaining:
+                logger.warning(f"Espera de {decision.delay:.1f}s excede o prazo restante ({remaining:.1f}s); "
+                               f"desistindo do envio para {chat_id}")
+                break
+            # Respeita o retry_after do Telegram e o backoff das falhas passageiras
+            time.sleep(decision.delay)
         
         return False
 
     def escape_markdown(self, text):
         """Escapa caracteres especiais do Markdown V2"""
-        if not text:
-            return ""
-        special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-        escaped_text = text
-        for char in special_chars:
-            escaped_text = escaped_text.replace(char, f'\\{char}')
-        return escaped_text
+        return escape_markdown(text)
             
-    def send_alert(self, subject, from_addr, body, alert_type="📨 NOVO EMAIL", token=None, chat_id=None):
-        """Envia alerta formatado para o Telegram usando token e chat_id específicos"""
-        try:
-            # Escapa todos os textos para Markdown V2
-            safe_subject = self.escape_markdown(subject)
-            safe_from = self.escape_markdown(from_addr)
-            safe_body = self.escape_markdown(body)
-
-            # Cria mensagem formatada
-            message = (
-                f"*{alert_type}*\n\n"
-                f"📧 *De:* {safe_from}\n"
-                f"📝 *Assunto:* {safe_subject}\n"
-                f"⏰ *Data:* {self.escape_markdown(datetime.now().strftime('%d/%m/%Y %H:%M:%S'))}\n\n"
-                f"💬 *Conteúdo:*\n```\n{safe_body[:1000]}```"  # Limita o corpo a 1000 caracteres
-            )
+    def format_alert(self, subject, from_addr, body, alert_type="📨 NOVO EMAIL"):
+        """Monta o texto do alerta; retorna (mensagem, parse_mode)"""
+        messages, parse_mode = self.format_alert_parts(subject, from_addr, body, alert_type, max_parts=1)
+        return messages[0], parse_mode
 
-            # Envia usando configurações específicas ou padrão
-            return self.send_text_message(
-                message=message, 
-                parse_mode='MarkdownV2',
-                token=token, 
-                chat_id=chat_id
+    def format_alert_parts(self, subject, from_addr, body, alert_type="📨 NOVO EMAIL", max_parts=None):
+        """Monta o alerta em até max_parts mensagens dentro do limite do Telegram; retorna ([mensagens], parse_mode)"""
+        try:
+            # Corta o texto bruto antes do escape: só o trecho exibido é escapado
+            messages = render_alert(
+                alert_type=alert_type,
+                from_addr=from_addr,
+                subject=subject,
+                date=timestamp(),
+                body=body,
+                max_parts=max_parts or self.max_alert_parts
             )
+            return messages, 'MarkdownV2'
         except Exception as e:
-            logger.error(f"Erro ao formatar/enviar alerta: {e}")
-            # Tenta enviar uma versão simplificada em caso de erro
+            logger.error(f"Erro ao formatar alerta: {e}")
+            # Usa uma versão simplificada em caso de erro
             fallback_message = (
                 f"*{alert_type}*\n\n"
                 f"📧 De: {subject}\n"
                 f"📝 Assunto: {from_addr}\n"
                 f"⏰ Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
             )
-            return self.send_text_message(
-                message=fallback_message,
-                parse_mode='Markdown',  # Usa Markdown simples como fallback
-                token=token,
-                chat_id=chat_id
-            )
+            return [fallback_message], 'Markdown'  # Usa Markdown simples como fallback
+            
+    def format_digest(self, alerts):
+        """
+        Monta o resumo de uma rajada de alertas, dividido em partes que cabem no
+        limite do Telegram. Retorna [(mensagem, alertas_da_parte)] em MarkdownV2.
+        """
+        lines = []
+        for alert in alerts:
+            subject = (alert.get('subject') or '(sem assunto)')[:DIGEST_FIELD_LIMIT]
+            from_addr = (alert.get('from') or '')[:DIGEST_FIELD_LIMIT]
+            lines.append(DIGEST_ITEM.render(from_addr=from_addr, subject=subject))
+        
+        # Agrupa as linhas em partes sem ultrapassar o limite (descontado o cabeçalho)
+        budget = TELEGRAM_MESSAGE_LIMIT - DIGEST_HEADER_RESERVE
+        parts, current, size = [], [], 0
+        for alert, line in zip(alerts, lines):
+            if current and size + len(line) > budget:
+                parts.append(current)
+                current, size = [], 0
+            current.append((alert, line))
+            size += len(line)
+        if current:
+            parts.append(current)
+        
+        accounts = sorted({alert.get('username', '') for alert in alerts})
+        now = timestamp()
+        messages = []
+        for index, part in enumerate(parts, 1):
+            suffix = f" \\({index}/{len(parts)}\\)" if len(parts) > 1 else ""
+            header = DIGEST_HEADER.render(count=len(alerts), part=suffix, accounts=', '.join(accounts)[:100], time=now)
+            messages.append((header + ''.join(line for _, line in part), [alert for alert, _ in part]))
+        return messages
+            
+    def send_alert(self, subject, from_addr, body, alert_type="📨 NOVO EMAIL", token=None, chat_id=None,
+                   deadline: Optional[Deadline] = None):
+        """Envia alerta formatado para o Telegram usando token e chat_id específicos"""
+        messages, parse_mode = self.format_alert_parts(subject, from_addr, body, alert_type)
+        # Envia as partes em ordem, usando configurações específicas ou padrão
+        for message in messages:
+            if not self.send_text_message(message=message, parse_mode=parse_mode, token=token, chat_id=chat_id,
+                                          deadline=deadline):
+                return False
+        return True
         
     def process_webhook_update(self, update_json):
         """Processa atualizações recebidas via webhook"""
@@ -149,22 +243,23 @@ class TelegramClient:
             return False
             
     def check_for_updates(self):
-        """Verifica novas mensagens/comandos enviados para o bot"""
+        """
+        Verifica uma vez novas mensagens/comandos enviados para o bot (sem espera).
+        O monitor usa o UpdatePoller, que faz long polling com offset persistido.
+        """
         url = f"{self.base_url}/getUpdates"
         
         try:
-            response = requests.get(url)
+            # O offset do próximo getUpdates confirma os updates já processados
+            params = {'offset': self._updates_offset} if self._updates_offset else None
+            response = self.transport.get(url, key=self.default_token, params=params)
             if response.status_code == 200:
                 updates = response.json().get('result', [])
                 
                 for update in updates:
                     # Processa cada update
                     self.commands.process_update(update)
-                    
-                # Confirma processamento dos updates (opcional)
-                if updates:
-                    last_update_id = updates[-1]['update_id']
-                    requests.get(f"{url}?offset={last_update_id + 1}")
+                    self._updates_offset = update['update_id'] + 1
                     
                 return True
             else:
@@ -235,7 +330,7 @@ class TelegramClient:
                 url = f"https://api.telegram.org/bot{token}/getUpdates"
                 logger.info(f"Tentando descobrir chat_id para token {token[:8]}...")
                 
-                response = requests.get(url, timeout=10)
+                response = self.transport.get(url, key=token, timeout=10)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('ok') and data.get('result'):
@@ -260,7 +355,7 @@ class TelegramClient:
             
         try:
             url = f"https://api.telegram.org/bot{token}/getMe"
-            response = requests.get(url, timeout=5)
+            response = self.transport.get(url, key=token, timeout=5)
             
             if response.status_code == 200:
                 data = response.json()
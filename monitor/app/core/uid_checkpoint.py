@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger('wegnots.uid_checkpoint')
+
+DEFAULT_CHECKPOINT_PATH = os.path.join('data', 'imap_checkpoints.json')
+
+
+class CheckpointStore:
+    """
+    Armazena, por caixa de correio, o UIDVALIDITY e o último UID já processado.
+
+    Os checkpoints ficam em um arquivo JSON gravado de forma atômica (arquivo
+    temporário + rename), de modo que uma reinicialização retoma exatamente do
+    ponto em que o monitor parou, sem reprocessar nem renotificar mensagens.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, label: str = 'checkpoints IMAP'):
+        self.path = path
+        # Nome dos registros nas mensagens de log (o store também guarda offsets do Telegram)
+        self.label = label
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = self._load()
+
+    @staticmethod
+    def make_key(server: str, username: str, mailbox: str = 'INBOX') -> str:
+        """Gera a chave do checkpoint de uma caixa de correio"""
+        return f"{server}:{username}:{mailbox}"
+
+    def _load(self) -> Dict[str, Dict]:
+        """Carrega os checkpoints do disco"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            logger.info(f"Carregados {len(data)} {self.label} de {self.path}")
+            return data
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Erro ao carregar {self.label} de {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        """Grava os checkpoints no disco de forma atômica"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Retorna uma cópia do checkpoint da caixa, ou None se não existir"""
+        with self._lock:
+            checkpoint = self._data.get(key)
+            return dict(checkpoint) if checkpoint else None
+
+    def update(self, key: str, **fields) -> Dict:
+        """Atualiza campos do checkpoint e persiste imediatamente"""
+        with self._lock:
+            checkpoint = self._data.setdefault(key, {})
+            if all(checkpoint.get(name) == value for name, value in fields.items()):
+                return dict(checkpoint)
+            checkpoint.update(fields)
+            try:
+                self._save()
+            except OSError as e:
+                logger.error(f"Erro ao salvar {self.label} em {self.path}: {e}")
+            return dict(checkpoint)
@@ -0,0 +1,145 @@
+"""
+Long polling de getUpdates para os comandos dos bots, com offset persistido
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+from .http_transport import get_transport
+from .telegram_bot_commands import TelegramCommands
+from .uid_checkpoint import CheckpointStore
+
+logger = logging.getLogger('wegnots.update_poller')
+
+DEFAULT_OFFSETS_PATH = os.path.join('data', 'telegram_offsets.json')
+# Segundos que o Telegram mantém o getUpdates aberto quando não há updates
+LONG_POLL_TIMEOUT = 50
+# Folga do timeout de leitura HTTP sobre o long poll
+HTTP_TIMEOUT_MARGIN = 10
+DEFAULT_COMMAND_WORKERS = 4
+# Espera após erros (rede, 5xx, 409), dobrando até o máximo
+ERROR_BACKOFF = 1.0
+MAX_ERROR_BACKOFF = 60.0
+# Conflito do getUpdates: há um webhook registrado para o bot
+HTTP_CONFLICT = 409
+# Apenas mensagens interessam aos comandos; os demais tipos nem são enviados
+ALLOWED_UPDATES = json.dumps(['message'])
+
+
+class UpdatePollError(Exception):
+    """Resposta inválida do getUpdates"""
+
+
+class UpdatePoller:
+    """
+    Um long poll de getUpdates por token de bot, todos no mesmo poller.
+
+    Cada lote é processado em paralelo por ``TelegramCommands.process_update``
+    (pool compartilhado entre os bots) e o próximo offset é gravado em disco antes
+    do getUpdates seguinte, que por si só confirma o lote ao Telegram. Sem updates
+    o Telegram segura a requisição por ``timeout`` segundos: ocioso, cada bot faz
+    pouco mais de uma requisição por minuto e comandos são atendidos de imediato.
+    """
+
+    def __init__(self, tokens: Iterable[str], offsets_path: str = DEFAULT_OFFSETS_PATH,
+                 timeout: int = LONG_POLL_TIMEOUT, workers: int = DEFAULT_COMMAND_WORKERS,
+                 commands_factory: Callable[[str], TelegramCommands] = TelegramCommands, transport=None):
+        self.tokens = list(dict.fromkeys(token for token in tokens if token))
+        self.timeout = timeout
+        self.offsets = CheckpointStore(offsets_path, label='offsets do Telegram')
+        self.transport = transport or get_transport()
+        self._commands = {token: commands_factory(token) for token in self.tokens}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telegram-commands')
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Bots cujo webhook já foi removido após um 409
+        self._webhook_deleted = set()
+        self.stats = {'polls': 0, 'updates': 0, 'errors': 0, 'commands_failed': 0}
+
+    @staticmethod
+    def offset_key(token: str) -> str:
+        """Chave do offset no arquivo: o id do bot, sem a parte secreta do token"""
+        return f"bot{token.split(':', 1)[0]}"
+
+    def start(self):
+        """Inicia uma thread de long poll por token"""
+        for token in self.tokens:
+            thread = threading.Thread(target=self._run, args=(token,), daemon=True,
+                                      name=f"telegram-poll-{self.offset_key(token)}")
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Long polling de comandos iniciado para {len(self.tokens)} bot(s)")
+
+    def stop(self, timeout: float = 1.0):
+        """Interrompe o polling; requisições em andamento são abandonadas (threads daemon)"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _run(self, token: str):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self.poll_once(token)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                self._count('errors')
+                delay = min(MAX_ERROR_BACKOFF, ERROR_BACKOFF * 2 ** (failures - 1))
+                logger.warning(f"Erro no getUpdates de {self.offset_key(token)}: {e}; nova tentativa em {delay:.0f}s")
+                self._stop.wait(delay)
+
+    def poll_once(self, token: str) -> int:
+        """Executa um getUpdates, processa o lote e grava o próximo offset; retorna o número de updates"""
+        key = self.offset_key(token)
+        params = {'timeout': self.timeout, 'allowed_updates': ALLOWED_UPDATES}
+        checkpoint = self.offsets.get(key)
+        if checkpoint and 'offset' in checkpoint:
+            params['offset'] = checkpoint['offset']
+
+        response = self.transport.get(f"https://api.telegram.org/bot{token}/getUpdates", key=token,
+                                      params=params, timeout=self.timeout + HTTP_TIMEOUT_MARGIN)
+        if response.status_code == HTTP_CONFLICT and token not in self._webhook_deleted:
+            # Um webhook ativo bloqueia o getUpdates indefinidamente; remove-o uma vez por bot
+            self._webhook_deleted.add(token)
+            logger.warning(f"getUpdates de {key} em conflito com webhook ativo; removendo o webhook")
+            self._commands[token].delete_webhook()
+        if response.status_code != 200:
+            raise UpdatePollError(f"HTTP {response.status_code} - {response.text[:200]}")
+        data = response.json()
+        if not data.get('ok'):
+            raise UpdatePollError(data.get('description', 'resposta sem ok'))
+        self._count('polls')
+
+        updates = data.get('result', [])
+        if updates:
+            self.process(token, updates)
+            self.offsets.update(key, offset=max(update['update_id'] for update in updates) + 1)
+        return len(updates)
+
+    def process(self, token: str, updates: List[Dict]):
+        """Processa o lote em paralelo e aguarda o término antes de confirmar o offset"""
+        commands = self._commands[token]
+        futures = [self._executor.submit(commands.process_update, update) for update in updates]
+        for update, future in zip(updates, futures):
+            try:
+                future.result()
+            except Exception as e:
+                self._count('commands_failed')
+                logger.error(f"Erro ao processar update {update.get('update_id')}: {e}")
+        self._count('updates', len(updates))
+
+    def metrics(self) -> Dict:
+        """Contadores do polling"""
+        with self._lock:
+            return dict(self.stats, bots=len(self.tokens))
@@ -3,27 +3,86 @@ from typing import Dict, List, Optional
 from pymongo import MongoClient, ASCENDING
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import PyMongoError
 from datetime import datetime
 
+from .mongo_indexes import IndexSpec, reconcile_indexes
+from .routing_index import DEFAULT_POLL_INTERVAL, RoutingIndex
+
 logger = logging.getLogger('wegnots.user_model')
 
+# Índices da coleção users (nomes padrão do MongoDB nos que já existiam)
+USER_INDEXES = [
+    IndexSpec('email_1', (('email', ASCENDING),), unique=True),
+    IndexSpec('chat_id_1', (('chat_id', ASCENDING),), unique=True),
+    # Roteamento por remetente exato ou *@domínio
+    IndexSpec('notification_rules.sender_1', (('notification_rules.sender', ASCENDING),)),
+    # get_active_chat_ids: só usuários ativos, respondida pelo índice sem ler os documentos
+    IndexSpec('active_chat_ids', (('is_active', ASCENDING), ('chat_id', ASCENDING)),
+              partial_filter={'is_active': True}),
+    # Servidor central: índice de um único documento
+    IndexSpec('central_server', (('is_central_server', ASCENDING),), partial_filter={'is_central_server': True}),
+]
+# Histórico de e-mails processados expira em 7 dias
+PROCESSED_EMAILS_INDEXES = [
+    IndexSpec('processed_time_ttl', (('processed_time', ASCENDING),), expire_after=7 * 24 * 60 * 60),
+]
+
 class UserModel:
-    def __init__(self, mongo_client: MongoClient):
+    """
+    Usuários e regras de notificação na coleção ``users``.
+
+    O construtor carrega o índice de roteamento e inicia a thread (daemon) que o
+    mantém atualizado. Quem cria o modelo é dono desse ciclo de vida e deve chamar
+    ``close()`` ao terminar, ou usá-lo em um bloco ``with``.
+    """
+
+    def __init__(self, mongo_client: MongoClient, routing_poll_interval: float = DEFAULT_POLL_INTERVAL):
         self.db = mongo_client.wegnots
         self.collection: Collection = self.db['users']
         self._setup_indexes()
         self._ensure_central_server()
         self.processed_emails = set()
+        self.routing = self._start_routing(routing_poll_interval)
+
+    def _start_routing(self, poll_interval: float) -> Optional[RoutingIndex]:
+        """Índice de roteamento em memória; sem ele, cada roteamento consulta o MongoDB"""
+        routing = RoutingIndex(self.collection, poll_interval)
+        try:
+            routing.start()
+        except PyMongoError as e:
+            logger.error(f"Índice de roteamento indisponível, usando consultas diretas: {e}")
+            return None
+        logger.info(f"Índice de roteamento carregado: {len(routing)} usuários ({routing.mode})")
+        return routing
+
+    def _refresh_routing(self, query: Dict):
+        """Reflete no índice uma alteração feita por este processo, sem esperar o change stream"""
+        if self.routing is None:
+            return
+        try:
+            self.routing.reload(query)
+        except PyMongoError as e:
+            logger.error(f"Erro ao atualizar o índice de roteamento: {e}")
+
+    def close(self):
+        """Interrompe a atualização do índice de roteamento"""
+        if self.routing is not None:
+            self.routing.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def _setup_indexes(self):
-        """Configura índices necessários"""
-        # Garante índices únicos para email e chat_id
-        self.collection.drop_indexes()
-        self.collection.create_index([("email", ASCENDING)], unique=True)
-        self.collection.create_index([("chat_id", ASCENDING)], unique=True)
-        
-        # Índice para busca por remetente nas regras
-        self.collection.create_index([("notification_rules.sender", ASCENDING)])
+        """Cria apenas os índices que faltam (ou divergem) em relação a USER_INDEXES"""
+        try:
+            return reconcile_indexes(self.collection, USER_INDEXES)
+        except PyMongoError as e:
+            logger.error(f"Erro ao verificar índices de usuários: {e}")
+            return None
 
     def _ensure_central_server(self):
         """Garante que o servidor central exista"""
@@ -70,6 +129,8 @@ class UserModel:
         try:
             result = self.collection.insert_one(user)
             user['_id'] = result.inserted_id
+            if self.routing is not None:
+                self.routing.upsert(dict(user))
             logger.info(f"Usuário criado com sucesso: {name} ({email})")
             return user
         except Exception as e:
@@ -86,6 +147,9 @@ class UserModel:
 
     def get_users_by_email(self, email: str) -> List[Dict]:
         """Busca usuários que devem receber alertas do email informado"""
+        if self.routing is not None:
+            return self.routing.lookup(email)
+
         # Busca direta pelo email
         users = list(self.collection.find({
             '$or': [
@@ -104,7 +168,7 @@ class UserModel:
 
     def get_active_chat_ids(self) -> List[str]:
         """Retorna lista de chat_ids de usuários ativos"""
-        users = self.collection.find({"is_active": True}, {"chat_id": 1})
+        users = self.collection.find({"is_active": True}, {"chat_id": 1, "_id": 0})
         return [user['chat_id'] for user in users]
 
     def update_user(self, user_id, update_data: Dict) -> bool:
@@ -123,6 +187,7 @@ class UserModel:
                 {"_id": user_id},
                 {"$set": update_data}
             )
+            self._refresh_routing({"_id": user_id})
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Erro ao atualizar usuário {user_id}: {e}")
@@ -135,6 +200,7 @@ class UserModel:
                 {"chat_id": chat_id},
                 {"$set": {"is_active": False}}
             )
+            self._refresh_routing({"chat_id": chat_id})
             if result.modified_count > 0:
                 logger.info(f"Usuário desativado: {chat_id}")
                 return True
@@ -162,6 +228,7 @@ class UserModel:
                     }
                 }}
             )
+            self._refresh_routing({"_id": user_id})
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Erro ao atualizar configurações do usuário {user_id}: {e}")
@@ -174,6 +241,7 @@ class UserModel:
                 {'chat_id': chat_id},
                 {'$set': {'notification_rules': rules}}
             )
+            self._refresh_routing({'chat_id': chat_id})
             return True
         except Exception as e:
             logger.error(f'Erro ao atualizar regras: {e}')
@@ -181,6 +249,8 @@ class UserModel:
 
     def get_central_server(self) -> Optional[Dict]:
         """Retorna o usuário servidor central"""
+        if self.routing is not None:
+            return self.routing.central_server()
         return self.collection.find_one({'is_central_server': True})
 
     def set_user_active_status(self, chat_id: str, active: bool) -> bool:
@@ -190,6 +260,7 @@ class UserModel:
                 {'chat_id': chat_id},
                 {'$set': {'is_active': active}}
             )
+            self._refresh_routing({'chat_id': chat_id})
             return True
         except Exception as e:
             logger.error(f'Erro ao atualizar status: {e}')
@@ -212,14 +283,7 @@ class UserModel:
             
             # Cria índice de expiração se não existir
             try:
-                indexes = emails_collection.index_information()
-                if 'processed_time_ttl' not in indexes:
-                    emails_collection.create_index(
-                        [("processed_time", ASCENDING)], 
-                        expireAfterSeconds=7*24*60*60,  # 7 dias
-                        name="processed_time_ttl"
-                    )
-                    logger.info("Índice TTL criado para histórico de e-mails")
+                reconcile_indexes(emails_collection, PROCESSED_EMAILS_INDEXES)
             except Exception as e:
                 logger.error(f"Erro ao criar índice TTL: {e}")
             
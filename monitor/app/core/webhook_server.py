@@ -0,0 +1,163 @@
+"""
+Servidor de webhooks do Telegram: recebe os updates de todos os bots em um único servidor HTTP
+"""
+
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from .telegram_bot_commands import TelegramCommands
+
+logger = logging.getLogger('wegnots.webhook_server')
+
+WEBHOOK_PATH_PREFIX = '/telegram/'
+# Cabeçalho com o secret_token informado no setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+DEFAULT_WEBHOOK_PORT = 8443
+DEFAULT_WEBHOOK_WORKERS = 4
+# Tamanho máximo aceito para o corpo de um update
+MAX_UPDATE_SIZE = 1024 * 1024
+# update_ids recentes guardados por bot para descartar reenvios do Telegram
+RECENT_UPDATES = 1000
+
+
+def webhook_path(token: str) -> str:
+    """Caminho do webhook de um bot; o hash evita expor o token em URLs e logs"""
+    return WEBHOOK_PATH_PREFIX + hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+
+class WebhookRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Valida a requisição, confirma de imediato e entrega o update ao pool do servidor"""
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        route = webhook.routes.get(self.path)
+        if route is None:
+            return self._reply(404)
+        secret = self.headers.get(SECRET_TOKEN_HEADER, '')
+        if not hmac.compare_digest(secret.encode('utf-8'), webhook.secret.encode('utf-8')):
+            webhook.count('rejected')
+            return self._reply(403)
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            webhook.count('rejected')
+            return self._reply(400)
+        if length > MAX_UPDATE_SIZE:
+            webhook.count('rejected')
+            return self._reply(413)
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            webhook.count('rejected')
+            return self._reply(400)
+
+        # Confirma antes de processar: o Telegram não espera pela resposta ao comando
+        self._reply(200)
+        webhook.submit(self.path, update)
+
+    def do_GET(self):
+        self._reply(405)
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Usa o logger do módulo em vez do stderr"""
+        logger.debug(f"[WebhookRequestHandler] {format % args}")
+
+
+class WebhookServer:
+    """
+    Recebe, em um único ``ThreadingHTTPServer``, os webhooks de todos os bots
+    configurados. Cada bot tem o caminho ``/telegram/<hash do token>``, que leva à
+    sua instância de ``TelegramCommands``; requisições sem o ``secret_token``
+    correto são recusadas e os updates são processados em um pool de workers.
+    """
+
+    def __init__(self, tokens: Iterable[str], secret: str, host: str = '0.0.0.0',
+                 port: int = DEFAULT_WEBHOOK_PORT, workers: int = DEFAULT_WEBHOOK_WORKERS,
+                 commands_factory: Callable[[str], TelegramCommands] = TelegramCommands):
+        if not secret:
+            raise ValueError("WebhookServer exige um secret_token")
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.commands: Dict[str, TelegramCommands] = {}
+        self.routes: Dict[str, str] = {}
+        for token in tokens:
+            if token and token not in self.commands:
+                self.commands[token] = commands_factory(token)
+                self.routes[webhook_path(token)] = token
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telegram-webhook')
+        self._recent: Dict[str, OrderedDict] = {token: OrderedDict() for token in self.commands}
+        self._lock = threading.Lock()
+        self._httpd: Optional[http.server.ThreadingHTTPServer] = None
+        self.stats = {'received': 0, 'duplicates': 0, 'rejected': 0, 'processed': 0, 'failed': 0}
+
+    def start(self):
+        """Abre o servidor em uma thread daemon (porta 0 escolhe uma porta livre)"""
+        self._httpd = http.server.ThreadingHTTPServer((self.host, self.port), WebhookRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.webhook = self
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='telegram-webhook-server', daemon=True).start()
+        logger.info(f"Servidor de webhooks em {self.host}:{self.port} para {len(self.commands)} bot(s)")
+
+    def register(self, base_url: str) -> int:
+        """Registra no Telegram (setWebhook) a URL pública de cada bot; retorna quantos foram aceitos"""
+        registered = 0
+        for path, token in self.routes.items():
+            if self.commands[token].set_webhook(base_url.rstrip('/') + path, secret_token=self.secret):
+                registered += 1
+        return registered
+
+    def stop(self):
+        """Fecha o servidor; updates já aceitos terminam no pool"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        self._executor.shutdown(wait=False)
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def submit(self, path: str, update: Dict):
+        """Agenda o update no pool, descartando reenvios de um update_id já recebido"""
+        token = self.routes[path]
+        update_id = update.get('update_id')
+        with self._lock:
+            recent = self._recent[token]
+            if update_id is not None and update_id in recent:
+                self.stats['duplicates'] += 1
+                return
+            recent[update_id] = True
+            if len(recent) > RECENT_UPDATES:
+                recent.popitem(last=False)
+            self.stats['received'] += 1
+        self._executor.submit(self._process, token, update)
+
+    def _process(self, token: str, update: Dict):
+        try:
+            self.commands[token].process_update(update)
+            self.count('processed')
+        except Exception as e:
+            self.count('failed')
+            logger.error(f"Erro ao processar update {update.get('update_id')} do webhook: {e}")
+
+    def metrics(self) -> Dict:
+        """Contadores do servidor de webhooks"""
+        with self._lock:
+            return dict(self.stats, bots=len(self.commands))
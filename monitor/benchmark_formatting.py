@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark da formatação MarkdownV2: implementações anteriores (str.replace por
+caractere, f-strings montadas a cada envio) contra app.core.formatting, e a
+alternativa de escape em uma passada com str.translate.
+
+Uso: python benchmark_formatting.py [repetições]
+"""
+import sys
+import timeit
+from datetime import datetime
+
+from app.core.formatting import (MARKDOWN_V2_SPECIAL, STARTUP_BANNER, escape_markdown, monitored_accounts,
+                                 render_alert, timestamp)
+
+SUBJECT = "[ALERTA] Falha no backup (servidor-01.megasec.com.br) - status=CRITICAL! #1234"
+FROM_ADDR = "Zabbix Server <zabbix+alerts@megasec.com.br>"
+BODY = ("Problem started at 10:41:03 on 2025.03.14\nHost: servidor-01 (10.0.0.12)\n"
+        "Trigger: Disk usage > 95% on /var/lib/mongo {ITEM.VALUE}=97.2%\n") * 8
+# Corpo de um e-mail grande (relatório/log anexado no texto)
+HUGE_BODY = BODY * 2000
+ACCOUNTS = ['getconexoes@gmail.com', 'sooretama@megasec.com.br', 'sooretama1@megasec.com.br']
+
+
+def legacy_escape_markdown(text):
+    """Versão anterior de TelegramClient/config_manager: uma passada por caractere"""
+    if not text:
+        return ""
+    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+    for char in special_chars:
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+_TRANSLATE_TABLE = str.maketrans({char: '\\' + char for char in MARKDOWN_V2_SPECIAL})
+
+
+def translate_escape_markdown(text):
+    """Escape em uma única passada com str.translate (mantido para comparação)"""
+    return text.translate(_TRANSLATE_TABLE) if text else ""
+
+
+def legacy_format_alert(body=BODY):
+    safe_subject = legacy_escape_markdown(SUBJECT)
+    safe_from = legacy_escape_markdown(FROM_ADDR)
+    safe_body = legacy_escape_markdown(body)
+    return (
+        f"*📨 NOVO EMAIL*\n\n"
+        f"📧 *De:* {safe_from}\n"
+        f"📝 *Assunto:* {safe_subject}\n"
+        f"⏰ *Data:* {legacy_escape_markdown(datetime.now().strftime('%d/%m/%Y %H:%M:%S'))}\n\n"
+        f"💬 *Conteúdo:*\n```\n{safe_body[:1000]}```"
+    )
+
+
+def compiled_format_alert(body=BODY):
+    return render_alert("📨 NOVO EMAIL", FROM_ADDR, SUBJECT, timestamp(), body)
+
+
+def legacy_startup_banner():
+    message = (
+        "🟢 *WegNots Monitor Iniciado*\n\n"
+        f"⏰ {legacy_escape_markdown(datetime.now().strftime('%d/%m/%Y %H:%M:%S'))}\n"
+        "✅ Sistema de monitoramento iniciado com sucesso\\.\n"
+        "✉️ Monitorando e\\-mails\\.\\.\\."
+    )
+    message += f"\n\n📨 Contas monitoradas: {len(ACCOUNTS)}"
+    for i, account in enumerate(ACCOUNTS, 1):
+        message += f"\n   {i}\\. {legacy_escape_markdown(account)}"
+    return message
+
+
+def compiled_startup_banner():
+    return STARTUP_BANNER.render(time=timestamp()) + monitored_accounts(ACCOUNTS)
+
+
+# (nome, implementação anterior, nova, divisor de repetições para casos lentos)
+CASES = [
+    ('escape (assunto)', lambda: legacy_escape_markdown(SUBJECT), lambda: escape_markdown(SUBJECT), 1),
+    ('escape (corpo)', lambda: legacy_escape_markdown(BODY), lambda: escape_markdown(BODY), 1),
+    ('translate (corpo)', lambda: legacy_escape_markdown(BODY), lambda: translate_escape_markdown(BODY), 1),
+    ('alerta completo', legacy_format_alert, compiled_format_alert, 1),
+    ('alerta (corpo grande)', lambda: legacy_format_alert(HUGE_BODY), lambda: compiled_format_alert(HUGE_BODY), 100),
+    ('banner de início', legacy_startup_banner, compiled_startup_banner, 1),
+]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'caso':<22} {'anterior (µs)':>14} {'novo (µs)':>10} {'ganho':>7}")
+    for name, legacy, current, divisor in CASES:
+        runs = max(1, number // divisor)
+        legacy_time = min(timeit.repeat(legacy, number=runs, repeat=3)) / runs * 1e6
+        current_time = min(timeit.repeat(current, number=runs, repeat=3)) / runs * 1e6
+        print(f"{name:<22} {legacy_time:>14.2f} {current_time:>10.2f} {legacy_time / current_time:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
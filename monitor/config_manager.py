@@ -4,10 +4,14 @@ import json
 import imaplib
 import configparser
 import re
+import time
 import logging
-import requests
-from typing import Dict, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, List, Tuple
 from datetime import datetime
+from app.core.formatting import (SHUTDOWN_BANNER, STARTUP_BANNER, escape_markdown, monitored_accounts,
+                                 stopped_accounts, timestamp)
+from app.core.http_transport import get_transport
 
 # Configurar logging
 os.makedirs('logs', exist_ok=True)
@@ -146,15 +150,6 @@ MONITORED_EMAILS={json.dumps(email_configs)}
         f.write(env_content)
     logger.info("Arquivo .env atualizado com sucesso.")
 
-def escape_markdown(text: str) -> str:
-    """Escapa caracteres especiais do Markdown para formatação correta no Telegram"""
-    if not text:
-        return ""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, '\\' + char)
-    return text
-
 def send_telegram_notification(config: configparser.ConfigParser, message: str, chat_id: str = None, token: str = None) -> bool:
     """Envia notificação via Telegram usando as configurações fornecidas ou as padrões do arquivo config.ini"""
     if 'TELEGRAM' not in config:
@@ -173,7 +168,7 @@ def send_telegram_notification(config: configparser.ConfigParser, message: str,
     
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     try:
-        response = requests.post(url, json={
+        response = get_transport().post(url, key=token, json={
             'chat_id': chat_id,
             'text': message,
             'parse_mode': 'MarkdownV2',
@@ -190,44 +185,15 @@ def send_telegram_notification(config: configparser.ConfigParser, message: str,
         logger.error(f"Exceção ao enviar notificação: {e}")
         return False
 
-def send_system_startup_notification(config: configparser.ConfigParser) -> bool:
+# Máximo de notificações de sistema enviadas em paralelo
+NOTIFICATION_WORKERS = 8
+
+def collect_notification_destinations(config: configparser.ConfigParser, global_chat_id: str,
+                                      global_token: str) -> Dict[Tuple[str, str], List[str]]:
     """
-    Envia notificação de inicialização do sistema para todos os destinatários configurados.
-    Para o chat ID global, mostra todas as contas monitoradas.
-    Para chat IDs específicos (com tokens personalizados), mostra apenas as contas associadas a eles.
+    Agrupa as contas ativas por destino (chat_id, token). O mesmo par configurado
+    em várias contas ou com nomes diferentes resulta em uma única entrada.
     """
-    current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    base_message = (
-        "🟢 *WegNots Monitor Iniciado*\n\n"
-        f"⏰ {escape_markdown(current_time)}\n"
-        "✅ Sistema de monitoramento iniciado com sucesso\\.\n"
-        "✉️ Monitorando e\\-mails\\.\\.\\."
-    )
-    
-    # Configurações globais
-    global_token = config['TELEGRAM'].get('token', '')
-    global_chat_id = config['TELEGRAM'].get('chat_id', '')
-    
-    # Encontra todas as contas de email ativas
-    active_accounts = []
-    for section in config.sections():
-        if section.startswith('IMAP_') and config[section].getboolean('is_active', True):
-            if 'username' in config[section]:
-                active_accounts.append(config[section]['username'])
-    
-    # 1. Enviar notificação para o chat ID global com todas as contas
-    global_message = base_message
-    if active_accounts:
-        global_message += f"\n\n📨 Contas monitoradas: {len(active_accounts)}"
-        for i, account in enumerate(active_accounts, 1):
-            global_message += f"\n   {i}\\. {escape_markdown(account)}"
-    
-    global_success = False
-    if global_token and global_chat_id:
-        global_success = send_telegram_notification(config, global_message)
-    
-    # 2. Preparar mapeamento de email -> destinos
-    email_to_destinations = {}
     destination_to_emails = {}
     
     for section in config.sections():
@@ -260,162 +226,122 @@ def send_system_startup_notification(config: configparser.ConfigParser) -> bool:
         
         # Se não tem destinos específicos, usar o global
         if not destinations:
-            dest_key = ('global', global_chat_id, global_token)
-            if dest_key not in destination_to_emails:
-                destination_to_emails[dest_key] = []
-            destination_to_emails[dest_key].append(email)
-            continue
+            destinations['global'] = {}
             
-        # Processar cada destino específico
         for dest_name, dest_info in destinations.items():
-            chat_id = dest_info.get('chat_id', '')
-            token = dest_info.get('token', '')
-            
             # Completar com valores globais se necessário
-            chat_id_to_use = chat_id or global_chat_id
-            token_to_use = token or global_token
+            chat_id_to_use = dest_info.get('chat_id', '') or global_chat_id
+            token_to_use = dest_info.get('token', '') or global_token
             
             if not chat_id_to_use or not token_to_use:
                 continue
                 
-            dest_key = (dest_name, chat_id_to_use, token_to_use)
-            if dest_key not in destination_to_emails:
-                destination_to_emails[dest_key] = []
-            
-            destination_to_emails[dest_key].append(email)
+            emails = destination_to_emails.setdefault((chat_id_to_use, token_to_use), [])
+            if email not in emails:
+                emails.append(email)
+    
+    return destination_to_emails
+
+def send_notifications_concurrently(config: configparser.ConfigParser,
+                                    notifications: Dict[str, Tuple[str, Optional[str], Optional[str]]]) -> Dict[str, Dict]:
+    """
+    Envia notificações em paralelo. ``notifications`` mapeia um rótulo a
+    (mensagem, chat_id, token); retorna, por rótulo, o resultado e a latência.
+    """
+    if not notifications:
+        return {}
     
-    # 3. Enviar notificações personalizadas para cada destino
-    specific_success = False
+    def send(item):
+        label, (message, chat_id, token) = item
+        started = time.monotonic()
+        ok = send_telegram_notification(config, message, chat_id, token)
+        return label, {'ok': ok, 'latency': round(time.monotonic() - started, 3)}
     
-    for (dest_name, chat_id, token), emails in destination_to_emails.items():
-        # Pular destino global se já enviou
-        if dest_name == 'global' and chat_id == global_chat_id and token == global_token and global_success:
-            continue
-            
-        specific_message = base_message
-        specific_message += f"\n\n📨 Contas monitoradas: {len(emails)}"
-        for i, account in enumerate(emails, 1):
-            specific_message += f"\n   {i}\\. {escape_markdown(account)}"
-            
-        success = send_telegram_notification(config, specific_message, chat_id, token)
-        if success:
-            specific_success = True
+    with ThreadPoolExecutor(max_workers=min(NOTIFICATION_WORKERS, len(notifications))) as executor:
+        results = dict(executor.map(send, notifications.items()))
     
-    # Retorna True se pelo menos uma notificação foi enviada com sucesso
-    return global_success or specific_success
+    for label, result in results.items():
+        logger.info(f"Notificação para {label}: {'enviada' if result['ok'] else 'falhou'} em {result['latency']:.2f}s")
+    return results
 
-def send_system_shutdown_notification(config: configparser.ConfigParser) -> bool:
+def _notify_destinations(config: configparser.ConfigParser, global_message: str,
+                         destination_message: Callable[[List[str]], str]) -> bool:
     """
-    Envia notificação de encerramento do sistema para todos os destinatários configurados.
-    Para o chat ID global, mostra uma mensagem padrão de encerramento.
-    Para chat IDs específicos (com tokens personalizados), mostra uma mensagem personalizada 
-    indicando quais contas específicas estão sendo encerradas.
+    Envia a mensagem global e as mensagens por destino em paralelo. O destino igual
+    ao chat global só recebe a sua mensagem se a global falhar.
     """
-    current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    base_message = (
-        "🔴 *WegNots Monitor Encerrado*\n\n"
-        f"⏰ {escape_markdown(current_time)}\n"
-        "✅ Sistema encerrado de forma segura\\.\n"
-        "🔔 Monitoramento interrompido\\."
-    )
-    
-    # Configurações globais
     global_token = config['TELEGRAM'].get('token', '')
     global_chat_id = config['TELEGRAM'].get('chat_id', '')
+    global_key = (global_chat_id, global_token)
+    destination_to_emails = collect_notification_destinations(config, global_chat_id, global_token)
     
-    # 1. Enviar notificação para o chat ID global
-    global_success = False
+    notifications = {}
     if global_token and global_chat_id:
-        global_success = send_telegram_notification(config, base_message)
-    
-    # 2. Preparar mapeamento de email -> destinos
-    email_to_destinations = {}
-    destination_to_emails = {}
-    
-    for section in config.sections():
-        if not section.startswith('IMAP_') or not config[section].getboolean('is_active', True):
-            continue
-            
-        if 'username' not in config[section]:
-            continue
-            
-        email = config[section]['username']
-        
-        # Verificar se tem múltiplos destinos
-        destinations = {}
-        try:
-            if 'notification_destinations' in config[section]:
-                destinations = json.loads(config[section]['notification_destinations'])
-        except json.JSONDecodeError:
-            destinations = {}
-        
-        # Se não tem destinos no novo formato mas tem nos campos antigos
-        if not destinations and ('telegram_chat_id' in config[section] or 'telegram_token' in config[section]):
-            chat_id = config[section].get('telegram_chat_id', '')
-            token = config[section].get('telegram_token', '')
-            
-            if chat_id or token:
-                destinations['default'] = {
-                    'chat_id': chat_id,
-                    'token': token
-                }
-        
-        # Se não tem destinos específicos, usar o global
-        if not destinations:
-            dest_key = ('global', global_chat_id, global_token)
-            if dest_key not in destination_to_emails:
-                destination_to_emails[dest_key] = []
-            destination_to_emails[dest_key].append(email)
+        notifications['global'] = (global_message, None, None)
+    for (chat_id, token), emails in destination_to_emails.items():
+        if (chat_id, token) == global_key and 'global' in notifications:
             continue
-            
-        # Processar cada destino específico
-        for dest_name, dest_info in destinations.items():
-            chat_id = dest_info.get('chat_id', '')
-            token = dest_info.get('token', '')
-            
-            # Completar com valores globais se necessário
-            chat_id_to_use = chat_id or global_chat_id
-            token_to_use = token or global_token
-            
-            if not chat_id_to_use or not token_to_use:
-                continue
-                
-            dest_key = (dest_name, chat_id_to_use, token_to_use)
-            if dest_key not in destination_to_emails:
-                destination_to_emails[dest_key] = []
-            
-            destination_to_emails[dest_key].append(email)
+        notifications[f"chat {chat_id} (token {token[:8]}...)"] = (destination_message(emails), chat_id, token)
     
-    # 3. Enviar notificações personalizadas para cada destino
-    specific_success = False
+    results = send_notifications_concurrently(config, notifications)
+    global_success = results.pop('global', {}).get('ok', False)
+    specific_success = any(result['ok'] for result in results.values())
     
-    for (dest_name, chat_id, token), emails in destination_to_emails.items():
-        # Pular destino global se já enviou
-        if dest_name == 'global' and chat_id == global_chat_id and token == global_token and global_success:
-            continue
-            
-        specific_message = base_message
-        
-        # Adiciona informação sobre as contas que estavam sendo monitoradas
-        if len(emails) > 1:
-            specific_message += f"\n\n📨 O monitoramento das seguintes contas foi encerrado:"
-            for i, account in enumerate(emails, 1):
-                specific_message += f"\n   {i}\\. {escape_markdown(account)}"
-        else:
-            specific_message += f"\n\n📨 O monitoramento da conta {escape_markdown(emails[0])} foi encerrado\\."
-            
-        success = send_telegram_notification(config, specific_message, chat_id, token)
-        if success:
-            specific_success = True
+    # Sem a mensagem global, o chat global recebe a mensagem das suas contas
+    if not global_success and 'global' in notifications and global_key in destination_to_emails:
+        specific_success = send_telegram_notification(
+            config, destination_message(destination_to_emails[global_key]), global_chat_id, global_token
+        ) or specific_success
     
     # Retorna True se pelo menos uma notificação foi enviada com sucesso
     return global_success or specific_success
 
+def send_system_startup_notification(config: configparser.ConfigParser) -> bool:
+    """
+    Envia notificação de inicialização do sistema para todos os destinatários configurados.
+    Para o chat ID global, mostra todas as contas monitoradas.
+    Para chat IDs específicos (com tokens personalizados), mostra apenas as contas associadas a eles.
+    """
+    base_message = STARTUP_BANNER.render(time=timestamp())
+    
+    # Encontra todas as contas de email ativas
+    active_accounts = []
+    for section in config.sections():
+        if section.startswith('IMAP_') and config[section].getboolean('is_active', True):
+            if 'username' in config[section]:
+                active_accounts.append(config[section]['username'])
+    
+    # 1. Mensagem do chat ID global com todas as contas
+    global_message = base_message
+    if active_accounts:
+        global_message += monitored_accounts(active_accounts)
+    
+    # 2. Mensagens personalizadas com as contas de cada destino
+    def destination_message(emails):
+        return base_message + monitored_accounts(emails)
+    
+    return _notify_destinations(config, global_message, destination_message)
+
+def send_system_shutdown_notification(config: configparser.ConfigParser) -> bool:
+    """
+    Envia notificação de encerramento do sistema para todos os destinatários configurados.
+    Para o chat ID global, mostra uma mensagem padrão de encerramento.
+    Para chat IDs específicos (com tokens personalizados), mostra uma mensagem personalizada 
+    indicando quais contas específicas estão sendo encerradas.
+    """
+    base_message = SHUTDOWN_BANNER.render(time=timestamp())
+    
+    # Mensagens personalizadas indicando as contas de cada destino
+    def destination_message(emails):
+        return base_message + stopped_accounts(emails)
+    
+    return _notify_destinations(config, base_message, destination_message)
+
 def test_email_connection(server: str, port: int, username: str, password: str) -> Tuple[bool, str]:
     """Testa a conexão com o servidor IMAP, retornando sucesso e mensagem de erro detalhada"""
     try:
         print(f"Conectando a {server}:{port}...")
-        mail = imaplib.IMAP4_SSL(server, port)
+        mail = imaplib.IMAP4_SSL(server, port, timeout=15)
         print("Autenticando...")
         mail.login(username, password)
         print("✅ Conexão estabelecida!")
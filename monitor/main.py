@@ -10,9 +10,17 @@ import signal
 import threading
 import configparser
 import os
+import secrets
 from datetime import datetime
 from app.core.telegram_client import TelegramClient
-from app.core.email_handler import EmailHandler
+from app.core.email_handler import EmailHandler, DEFAULT_COMMAND_TIMEOUTS
+from app.core.reconnect import ReconnectPolicy
+from app.core.outbox import DEFAULT_OUTBOX_PATH, Outbox
+from app.core.coalescer import DEFAULT_COALESCE_WINDOW, DEFAULT_DIGEST_THRESHOLD
+from app.core.alert_classifier import DEFAULT_ALERTS_CONFIG, AlertClassifier
+from app.core.http_transport import configure_transport, get_transport
+from app.core.update_poller import DEFAULT_OFFSETS_PATH, UpdatePoller
+from app.core.webhook_server import DEFAULT_WEBHOOK_PORT, WebhookServer
 from config_manager import send_system_startup_notification, send_system_shutdown_notification
 from health_server import start_health_server  # Importa o servidor de health check
 
@@ -73,7 +81,10 @@ def load_config():
                     imap_config['telegram_chat_id'] = config[section]['telegram_chat_id']
                 if 'telegram_token' in config[section]:
                     imap_config['telegram_token'] = config[section]['telegram_token']
-                    
+                # Destinos adicionais (JSON), interpretados por EmailHandler.setup_connections
+                if 'notification_destinations' in config[section]:
+                    imap_config['notification_destinations'] = config[section]['notification_destinations']
+
                 # Adiciona à lista de configurações
                 imap_configs[section] = imap_config
                 logger.info(f"Carregada configuração para {section} ({imap_config['username']})")
@@ -117,10 +128,18 @@ def main():
             has_custom_telegram = 'telegram_chat_id' in config and 'telegram_token' in config
             logger.info(f"  - {username} (Token Telegram: {'Personalizado' if has_custom_telegram else 'Padrão'})")
             
+        # Pool de conexões keep-alive compartilhado por todos os envios ao Telegram
+        configure_transport(
+            pool_connections=config_parser.getint('TELEGRAM', 'http_pool_connections', fallback=2),
+            pool_maxsize=config_parser.getint('TELEGRAM', 'http_pool_maxsize', fallback=8)
+        )
+        
         # Inicializa cliente do Telegram com as configurações padrão 
         telegram_client = TelegramClient(
             token=telegram_config['token'],
-            chat_id=telegram_config['chat_id']
+            chat_id=telegram_config['chat_id'],
+            # Com mais de uma parte, corpos longos continuam em mensagens seguintes em vez de cortados
+            max_alert_parts=config_parser.getint('TELEGRAM', 'max_alert_parts', fallback=1)
         )
         
         # Inicializa mapeamentos de token -> chat_id para garantir entregas corretas
@@ -128,7 +147,36 @@ def main():
         telegram_client.initialize_chat_mappings(imap_configs)
         
         # Inicializa handler de e-mail e configura todas as conexões
-        email_handler = EmailHandler(telegram_client)
+        # (poll_workers > 1 verifica as contas em paralelo, com prazo de poll_timeout segundos por conta)
+        email_handler = EmailHandler(
+            telegram_client,
+            max_workers=config_parser.getint('MONITOR', 'poll_workers', fallback=4),
+            poll_timeout=config_parser.getfloat('MONITOR', 'poll_timeout', fallback=45.0),
+            # Timeout de cada comando IMAP (imap_timeout_connect, imap_timeout_fetch, ...)
+            command_timeouts={
+                command: config_parser.getfloat('MONITOR', f'imap_timeout_{command}', fallback=default)
+                for command, default in DEFAULT_COMMAND_TIMEOUTS.items()
+            },
+            # Backoff de reconexão (mesmas variáveis RECONNECT_* do MONITOR_CONFIG)
+            reconnect_policy=ReconnectPolicy(
+                attempts=config_parser.getint('MONITOR', 'reconnect_attempts',
+                                              fallback=int(os.getenv('RECONNECT_ATTEMPTS', 5))),
+                delay=config_parser.getfloat('MONITOR', 'reconnect_delay',
+                                             fallback=float(os.getenv('RECONNECT_DELAY', 30))),
+                backoff_factor=config_parser.getfloat('MONITOR', 'reconnect_backoff_factor',
+                                                      fallback=float(os.getenv('RECONNECT_BACKOFF_FACTOR', 1.5)))
+            ),
+            # Alertas enviados por workers dedicados, sem bloquear o polling
+            delivery_workers=config_parser.getint('TELEGRAM', 'delivery_workers', fallback=4),
+            delivery_queue_size=config_parser.getint('TELEGRAM', 'delivery_queue_size', fallback=1000),
+            # Alertas persistidos até a confirmação do Telegram (reenviados após uma queda)
+            outbox=Outbox(config_parser.get('TELEGRAM', 'outbox_path', fallback=DEFAULT_OUTBOX_PATH)),
+            # Rajadas para o mesmo chat dentro da janela viram um resumo (0 desativa)
+            coalesce_window=config_parser.getfloat('TELEGRAM', 'coalesce_window', fallback=DEFAULT_COALESCE_WINDOW),
+            digest_threshold=config_parser.getint('TELEGRAM', 'digest_threshold', fallback=DEFAULT_DIGEST_THRESHOLD),
+            # Severidade pelas palavras-chave de alerts.levels (recarregadas quando o arquivo muda)
+            classifier=AlertClassifier(config_parser.get('MONITOR', 'alerts_config', fallback=DEFAULT_ALERTS_CONFIG))
+        )
         email_handler.setup_connections(imap_configs)
         
         # Tenta conectar aos servidores IMAP
@@ -143,6 +191,38 @@ def main():
             )
             return 1
         
+        # Alertas que ficaram pendentes na execução anterior
+        email_handler.replay_outbox()
+        
+        # Comandos dos bots (/start, /status, /help): por webhook se houver URL pública,
+        # senão via long polling de getUpdates
+        update_poller = webhook_server = None
+        webhook_url = config_parser.get('TELEGRAM', 'webhook_url', fallback='')
+        if webhook_url:
+            webhook_server = WebhookServer(
+                email_handler.get_bot_tokens(),
+                # Sem segredo configurado, um novo é gerado e registrado a cada inicialização
+                secret=config_parser.get('TELEGRAM', 'webhook_secret', fallback='') or secrets.token_urlsafe(32),
+                host=config_parser.get('TELEGRAM', 'webhook_host', fallback='0.0.0.0'),
+                port=config_parser.getint('TELEGRAM', 'webhook_port', fallback=DEFAULT_WEBHOOK_PORT),
+                workers=config_parser.getint('TELEGRAM', 'command_workers', fallback=4)
+            )
+            webhook_server.start()
+            logger.info(f"Webhooks registrados: {webhook_server.register(webhook_url)}/{len(webhook_server.commands)}")
+        elif config_parser.getboolean('TELEGRAM', 'poll_updates', fallback=True):
+            update_poller = UpdatePoller(
+                email_handler.get_bot_tokens(),
+                offsets_path=config_parser.get('TELEGRAM', 'offsets_path', fallback=DEFAULT_OFFSETS_PATH),
+                workers=config_parser.getint('TELEGRAM', 'command_workers', fallback=4)
+            )
+            update_poller.start()
+        
+        # Modo IDLE: contas cujo servidor suporta recebem push; as demais seguem em polling
+        use_idle = config_parser.getboolean('MONITOR', 'use_idle', fallback=True)
+        if use_idle:
+            idle_accounts = email_handler.start_idle()
+            logger.info(f"Contas em modo IDLE: {idle_accounts}/{len(email_handler.connections)}")
+        
         # Loop principal com monitoramento aprimorado
         check_interval = 60  # 1 minuto
         last_check_time = 0
@@ -150,12 +230,19 @@ def main():
         max_failures = 3
         
         while running:
+            # Aguarda notificações IDLE (substitui o sleep de 1 segundo do loop)
+            accounts_to_check = email_handler.wait_for_new_mail(timeout=1)
             current_time = time.time()
             
             if current_time - last_check_time >= check_interval:
+                accounts_to_check.update(email_handler.get_polling_accounts())
+                last_check_time = current_time
+            
+            if accounts_to_check:
                 try:
                     logger.info("Verificando novos e-mails...")
-                    email_handler.process_emails()
+                    email_handler.process_emails(accounts_to_check)
+                    logger.debug(f"Fila de entrega: {email_handler.get_delivery_metrics()}")
                     consecutive_failures = 0
                 except Exception as e:
                     logger.error(f"Erro durante processamento de e-mails: {e}")
@@ -166,18 +253,21 @@ def main():
                         # Reset contador de falhas
                         consecutive_failures = 0
                         
-                        # Tenta reconectar automaticamente
+                        # Reconecta apenas as contas sem sessão ativa, respeitando o backoff de cada uma
                         logger.info("Tentando reconexão aos servidores IMAP...")
-                        email_handler.connect()
-                
-                last_check_time = current_time
-            
-            time.sleep(1)
+                        email_handler.reconnect()
+                        if use_idle:
+                            email_handler.start_idle()
         
         logger.info("Loop de monitoramento encerrado, realizando limpeza...")
         
         # Encerramento gracioso
+        if update_poller:
+            update_poller.stop()
+        if webhook_server:
+            webhook_server.stop()
         email_handler.shutdown()
+        logger.info(f"Conexões HTTP com o Telegram: {get_transport().stats()}")
         
         # Envia notificação de encerramento através do novo sistema
         shutdown_success = send_system_shutdown_notification(config_parser)
@@ -5,7 +5,6 @@ import time
 import imaplib
 import email
 import logging
-import requests
 import locale
 import asyncio
 import configparser
@@ -16,6 +15,11 @@ from email.header import decode_header
 from typing import List, Dict
 from dataclasses import dataclass
 from app.core.email_handler import EmailHandler
+from app.core.async_imap import AsyncIMAPClient
+from app.core.formatting import (SHUTDOWN_BANNER, STARTUP_BANNER, escape_markdown, monitored_accounts,
+                                 stopped_accounts, timestamp)
+from app.core.http_transport import get_transport
+from app.core.imap_protocol import build_message_set, parse_fetch_response, parse_status_response
 
 # Configurar locale para português
 os.environ['LANG'] = 'pt_BR.UTF-8'
@@ -85,22 +89,11 @@ def decode_email_header(header):
     
     return ' '.join(decoded_parts)
 
-def escape_markdown(text: str) -> str:
-    """Escapa caracteres especiais do Markdown V2 do Telegram."""
-    if not text:
-        return ""
-    # Escape backslash first
-    text = text.replace('\\', '\\\\')
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!', '@']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
-
 def send_telegram_notification(config: TelegramConfig, message: str) -> bool:
     """Envia uma notificação via Telegram de forma síncrona"""
     url = f"https://api.telegram.org/bot{config.token}/sendMessage"
     try:
-        response = requests.post(url, json={
+        response = get_transport().post(url, key=config.token, json={
             'chat_id': config.chat_id,
             'text': message,
             'parse_mode': 'MarkdownV2',
@@ -122,19 +115,11 @@ def send_system_startup_notification(config: TelegramConfig, active_accounts=Non
     Envia notificação de inicialização do sistema.
     Para o caso do simple_monitor que usa a classe TelegramConfig diretamente.
     """
-    current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    message = (
-        "🟢 *WegNots Monitor Iniciado*\n\n"
-        f"⏰ {escape_markdown(current_time)}\n"
-        "✅ Sistema de monitoramento iniciado com sucesso\\.\n"
-        "✉️ Monitorando e\\-mails\\.\\.\\."
-    )
+    message = STARTUP_BANNER.render(time=timestamp())
     
     # Adiciona informação sobre as contas monitoradas
     if active_accounts:
-        message += f"\n\n📨 Contas monitoradas: {len(active_accounts)}"
-        for i, account in enumerate(active_accounts, 1):
-            message += f"\n   {i}\\. {escape_markdown(account)}"
+        message += monitored_accounts(active_accounts)
     
     return send_telegram_notification(config, message)
 
@@ -143,40 +128,51 @@ def send_system_shutdown_notification(config: TelegramConfig) -> bool:
     Envia notificação de encerramento do sistema.
     Para o caso do simple_monitor que usa a classe TelegramConfig diretamente.
     """
-    current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    message = (
-        "🔴 *WegNots Monitor Encerrado*\n\n"
-        f"⏰ {escape_markdown(current_time)}\n"
-        "✅ Sistema encerrado de forma segura\\.\n"
-        "🔔 Monitoramento interrompido\\."
-    )
+    message = SHUTDOWN_BANNER.render(time=timestamp())
     
     return send_telegram_notification(config, message)
 
 class IMAPMonitor:
+    # Intervalo máximo em IDLE (ou de espera, sem IDLE) entre verificações
+    WAIT_INTERVAL = 60
+    HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]'
+
     def __init__(self, config: IMAPConfig):
         self.config = config
         self.imap = None
         self.connected = False
+        self.selected = False
+        # Último STATUS da INBOX já processado (caminho rápido para caixas sem mudanças)
+        self.last_status = None
+        self._pending_status = None
+        # Respostas do último IDLE (None: nenhum IDLE desde a conexão)
+        self.idle_events = None
         
     async def connect(self):
+        self.selected = False
+        self.idle_events = None
+        if self.imap:
+            # A conexão anterior (caída ou dessincronizada) não é mais usada
+            self.imap.close()
         try:
-            self.imap = imaplib.IMAP4_SSL(self.config.server, self.config.port)
-            self.imap.login(self.config.username, self.config.password)
+            self.imap = AsyncIMAPClient(self.config.server, self.config.port)
+            await self.imap.connect()
+            await self.imap.login(self.config.username, self.config.password)
             self.connected = True
             logging.info(f"Conectado ao servidor {self.config.server}")
             return True
         except Exception as e:
             logging.error(f"Erro ao conectar ao servidor {self.config.server}: {str(e)}")
+            # Sem isso cada nova tentativa (a cada 10s) deixaria um socket TLS aberto
+            self.imap.close()
             self.connected = False
             return False
     
-    def disconnect(self):
+    async def disconnect(self):
         """Desconecta do servidor IMAP de forma segura"""
         if self.imap and self.connected:
             try:
-                self.imap.close()
-                self.imap.logout()
+                await self.imap.logout()
                 logging.info(f"Desconectado do servidor {self.config.server}")
                 self.connected = False
                 return True
@@ -185,24 +181,55 @@ class IMAPMonitor:
                 return False
         return True
 
+    async def mailbox_changed(self) -> bool:
+        """
+        Compara o STATUS da INBOX com o último processado, evitando SELECT/SEARCH/FETCH
+        em caixas paradas. Só UIDNEXT, MESSAGES e UIDVALIDITY entram na comparação:
+        UNSEEN muda quando alguém lê uma mensagem, sem que nada tenha chegado.
+
+        Com IDLE a INBOX continua selecionada e o próprio servidor avisa mudanças,
+        então a caixa só é verificada se o último IDLE recebeu alguma resposta. Sem
+        UNSELECT não é possível sair da caixa selecionada e a verificação é sempre feita.
+        """
+        capabilities = self.imap.capabilities
+        if 'IDLE' in capabilities:
+            changed = self.idle_events is None or bool(self.idle_events)
+            self.idle_events = None
+            return changed
+        if 'UNSELECT' not in capabilities:
+            return True
+        if self.selected:
+            await self.imap.unselect()
+            self.selected = False
+        _, data = await self.imap.status('INBOX', '(UIDNEXT MESSAGES UIDVALIDITY)')
+        self._pending_status = parse_status_response(data)
+        return self._pending_status != self.last_status
+
     async def check_emails(self):
         if not self.connected:
             return []
         
         try:
-            self.imap.select('INBOX')
+            if not await self.mailbox_changed():
+                return []
+            await self.imap.select('INBOX')
+            self.selected = True
             # Buscar todos os emails e pegar os últimos 30
-            _, messages = self.imap.search(None, 'ALL')
-            email_ids = messages[0].split()
+            _, messages = await self.imap.uid('SEARCH', 'ALL')
+            uids = [int(uid) for uid in (messages[0] or b'').split()][-30:]
+            if not uids:
+                self.last_status = self._pending_status
+                return []
             
-            # Pegar os últimos 30 emails
-            last_30_emails = email_ids[-30:] if len(email_ids) > 30 else email_ids
+            message_set = build_message_set(uids)
+            _, data = await self.imap.uid('FETCH', message_set, f'(UID {self.HEADER_FIELDS})')
             
             new_emails = []
-            for num in last_30_emails:
-                _, msg = self.imap.fetch(num, '(RFC822)')
-                email_body = msg[0][1]
-                email_message = email.message_from_bytes(email_body)
+            for record in parse_fetch_response(data):
+                headers = record.get('BODY[HEADER.FIELDS (FROM SUBJECT DATE)]')
+                if not isinstance(headers, bytes):
+                    continue
+                email_message = email.message_from_bytes(headers)
                 
                 # Usar a nova função de decodificação
                 subject = decode_email_header(email_message['subject'])
@@ -219,10 +246,25 @@ class IMAPMonitor:
                     'username': self.config.username  # Adicionar o campo username para identificar a conta
                 })
             
+            self.last_status = self._pending_status
             return new_emails
         except Exception as e:
             logging.error(f"Erro ao verificar emails em {self.config.server}: {str(e)}")
+            self.connected = False
             return []
+
+    async def wait_for_changes(self, timeout: float = WAIT_INTERVAL):
+        """Aguarda novidades na caixa via IDLE (ou apenas espera, se o servidor não suporta)"""
+        if self.connected and 'IDLE' in self.imap.capabilities:
+            try:
+                self.idle_events = await self.imap.idle(timeout)
+                return self.idle_events
+            except Exception as e:
+                logging.error(f"Erro em IDLE no servidor {self.config.server}: {str(e)}")
+                self.connected = False
+                return []
+        await asyncio.sleep(timeout)
+        return []
             
 class TelegramNotifier:
     def __init__(self, config: TelegramConfig):
@@ -230,15 +272,6 @@ class TelegramNotifier:
         self._last_send_time = 0
         self._min_interval = 1  # seconds between messages
     
-    def escape_markdown(self, text: str) -> str:
-        """Escapa caracteres especiais do Markdown V2 do Telegram."""
-        # Escape backslash first
-        text = text.replace('\\', '\\\\')
-        special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!', '@']
-        for char in special_chars:
-            text = text.replace(char, f'\\{char}')
-        return text
-        
     async def send_notification(self, message: str):
         try:
             now = time.time()
@@ -252,12 +285,12 @@ class TelegramNotifier:
             for line in message.split('\n'):
                 if line.startswith('📨'):  # Linha do remetente
                     prefix, content = line.split(' de ', 1)
-                    lines.append(f"{prefix} de *{self.escape_markdown(content)}*")
+                    lines.append(f"{prefix} de *{escape_markdown(content)}*")
                 elif line.startswith('📝'):  # Linha do assunto
                     prefix, content = line.split(': ', 1)
-                    lines.append(f"{prefix}: _{self.escape_markdown(content)}_")
+                    lines.append(f"{prefix}: _{escape_markdown(content)}_")
                 else:  # Outras linhas
-                    lines.append(self.escape_markdown(line))
+                    lines.append(escape_markdown(line))
             
             formatted_message = '\n'.join(lines)
             
@@ -268,7 +301,8 @@ class TelegramNotifier:
                 "disable_web_page_preview": True
             }
             
-            response = requests.post(url, json=data)
+            # Executa o POST em thread para não bloquear o loop de eventos
+            response = await asyncio.to_thread(get_transport().post, url, key=self.config.token, json=data, timeout=10)
             response_json = response.json()
             self._last_send_time = time.time()
             if response.status_code != 200 or not response_json.get('ok'):
@@ -366,23 +400,26 @@ class EmailMonitoringService:
         # Mapeamento de chat_ids específicos para as contas que eles monitoram
         specific_targets = {}
         
-        for imap_config in self.config['imap']:
-            if imap_config.is_active:
-                monitor = IMAPMonitor(imap_config)
-                if await monitor.connect():
-                    self.monitors.append(monitor)
-                    active_accounts.append(imap_config.username)
-                    
-                    # Se essa conta tem configuração específica de Telegram, adiciona ao mapeamento
-                    if imap_config.telegram_chat_id and imap_config.telegram_token:
-                        key = (imap_config.telegram_chat_id, imap_config.telegram_token)
-                        if key not in specific_targets:
-                            specific_targets[key] = []
-                        specific_targets[key].append(imap_config.username)
-                    
-                    logging.info(f"Monitor para {imap_config.server} ({imap_config.username}) inicializado")
-                else:
-                    logging.error(f"Falha ao inicializar monitor para {imap_config.server} ({imap_config.username})")
+        # Conecta todas as contas em paralelo
+        candidates = [IMAPMonitor(imap_config) for imap_config in self.config['imap'] if imap_config.is_active]
+        results = await asyncio.gather(*(monitor.connect() for monitor in candidates))
+        
+        for monitor, connected in zip(candidates, results):
+            imap_config = monitor.config
+            if connected:
+                self.monitors.append(monitor)
+                active_accounts.append(imap_config.username)
+                
+                # Se essa conta tem configuração específica de Telegram, adiciona ao mapeamento
+                if imap_config.telegram_chat_id and imap_config.telegram_token:
+                    key = (imap_config.telegram_chat_id, imap_config.telegram_token)
+                    if key not in specific_targets:
+                        specific_targets[key] = []
+                    specific_targets[key].append(imap_config.username)
+                
+                logging.info(f"Monitor para {imap_config.server} ({imap_config.username}) inicializado")
+            else:
+                logging.error(f"Falha ao inicializar monitor para {imap_config.server} ({imap_config.username})")
         
         # Envia notificação global
         send_system_startup_notification(self.config['telegram'], active_accounts)
@@ -400,16 +437,16 @@ class EmailMonitoringService:
         Verifica se o serviço de monitoramento deve continuar executando.
         Esta função pode ser estendida com mais condições como verificar um arquivo
         de status ou indicadores de saúde do sistema.
+        Monitores desconectados se reconectam sozinhos em monitor_account.
         """
-        return self.active and running and any(monitor.connected for monitor in self.monitors)
+        return self.active and running and bool(self.monitors)
     
     async def shutdown(self):
         """Encerra todas as conexões IMAP de forma segura e envia notificação de encerramento"""
         logging.info("Iniciando procedimento de encerramento...")
         
         # Desconecta todos os monitores
-        for monitor in self.monitors:
-            monitor.disconnect()
+        await asyncio.gather(*(monitor.disconnect() for monitor in self.monitors))
         
         # Mapeamento de chat_ids específicos para as contas que eles monitoram
         specific_targets = {}
@@ -430,24 +467,8 @@ class EmailMonitoringService:
             if not accounts:
                 continue
                 
-            # Cria uma mensagem personalizada para este destinatário
-            current_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-            
-            # Mensagem base
-            message = (
-                "🔴 *WegNots Monitor Encerrado*\n\n"
-                f"⏰ {escape_markdown(current_time)}\n"
-                "✅ Sistema encerrado de forma segura\\.\n"
-                "🔔 Monitoramento interrompido\\."
-            )
-            
-            # Adiciona informação sobre as contas que estavam sendo monitoradas
-            if len(accounts) > 1:
-                message += f"\n\n📨 O monitoramento das seguintes contas foi encerrado:"
-                for i, account in enumerate(accounts, 1):
-                    message += f"\n   {i}\\. {escape_markdown(account)}"
-            else:
-                message += f"\n\n📨 O monitoramento da conta {escape_markdown(accounts[0])} foi encerrado\\."
+            # Cria uma mensagem personalizada para este destinatário, com as contas encerradas
+            message = SHUTDOWN_BANNER.render(time=timestamp()) + stopped_accounts(accounts)
                 
             # Envia a notificação personalizada
             config = TelegramConfig(token=token, chat_id=chat_id)
@@ -455,49 +476,54 @@ class EmailMonitoringService:
         
         logging.info("Sistema encerrado com sucesso")
     
-    async def monitor_emails(self):
-        """Monitora os emails e envia notificações via Telegram"""
+    async def notify(self, email_data: Dict):
+        """Envia a notificação de um email para o chat da conta (ou o global)"""
+        # Criar mensagem de notificação
+        message = (
+            f"📨 Novo email de {email_data['sender']}\n"
+            f"📝 Assunto: {email_data['subject']}\n"
+            f"🌐 Servidor: {email_data['server']}\n"
+            f"📅 Data: {email_data['date']}"
+        )
+        
+        # Obter a configuração associada a este email
+        username = email_data.get('username', '')
+        imap_config = self.imap_config_map.get(username)
+        
+        if imap_config and imap_config.telegram_chat_id:
+            # Se esta conta de email tem um chat_id específico, usar ele
+            specific_notifier = TelegramNotifier(TelegramConfig(
+                token=imap_config.telegram_token or self.config['telegram'].token,
+                chat_id=imap_config.telegram_chat_id
+            ))
+            await specific_notifier.send_notification(message)
+            logging.info(f"Notificação enviada para chat_id específico: {imap_config.telegram_chat_id} (email: {username})")
+        else:
+            # Caso contrário, usar o chat_id global
+            await self.notifier.send_notification(message)
+            logging.info(f"Notificação enviada para chat_id global: {self.config['telegram'].chat_id}")
+    
+    async def monitor_account(self, monitor: IMAPMonitor):
+        """Loop de uma conta: verifica, notifica e aguarda novidades (IDLE) ou o intervalo"""
         while self.should_continue():
             try:
-                # Coleta emails de todos os monitores
-                all_emails = []
-                for monitor in self.monitors:
-                    emails = await monitor.check_emails()
-                    all_emails.extend(emails)
+                if not monitor.connected and not await monitor.connect():
+                    await asyncio.sleep(10)
+                    continue
                 
-                # Processa todos os emails coletados
-                for email_data in all_emails:
-                    # Criar mensagem de notificação
-                    message = (
-                        f"📨 Novo email de {email_data['sender']}\n"
-                        f"📝 Assunto: {email_data['subject']}\n"
-                        f"🌐 Servidor: {email_data['server']}\n"
-                        f"📅 Data: {email_data['date']}"
-                    )
-                    
-                    # Obter a configuração associada a este email
-                    username = email_data.get('username', '')
-                    imap_config = self.imap_config_map.get(username)
-                    
-                    if imap_config and imap_config.telegram_chat_id:  # Fixed syntax error here (changed && to and)
-                        # Se esta conta de email tem um chat_id específico, usar ele
-                        specific_notifier = TelegramNotifier(TelegramConfig(
-                            token=imap_config.telegram_token or self.config['telegram'].token,
-                            chat_id=imap_config.telegram_chat_id
-                        ))
-                        await specific_notifier.send_notification(message)
-                        logging.info(f"Notificação enviada para chat_id específico: {imap_config.telegram_chat_id} (email: {username})")
-                    else:
-                        # Caso contrário, usar o chat_id global
-                        await self.notifier.send_notification(message)
-                        logging.info(f"Notificação enviada para chat_id global: {self.config['telegram'].chat_id}")
+                for email_data in await monitor.check_emails():
+                    await self.notify(email_data)
                 
-                # Aguarda antes de verificar novamente
-                await asyncio.sleep(60)  # Verifica a cada minuto
+                await monitor.wait_for_changes()
             except Exception as e:
-                logging.error(f"Erro no loop de monitoramento: {str(e)}")
+                logging.error(f"Erro no loop de monitoramento de {monitor.config.username}: {str(e)}")
                 # Se houver um erro, espera um pouco antes de tentar novamente
                 await asyncio.sleep(10)
+    
+    async def monitor_emails(self):
+        """Monitora os emails e envia notificações via Telegram"""
+        # Cada conta roda em sua própria tarefa; uma conta lenta não atrasa as demais
+        await asyncio.gather(*(self.monitor_account(monitor) for monitor in self.monitors))
         
         logging.info("Loop de monitoramento encerrado")
         # Executa processo de encerramento adequado
@@ -54,13 +54,6 @@ TELEGRAM_SPECIFIC_CHAT_ID = '8052351981'  # Chat ID específico para sooretama1@
 print(f"Token global usado: {TELEGRAM_TOKEN}")
 print(f"Token específico usado: {TELEGRAM_SPECIFIC_TOKEN}")
 
-def escape_markdown(text):
-    """Escapa caracteres especiais do Markdown"""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, '\\' + char)
-    return text
-
 def send_test_message(chat_id=None, token=None):
     """Envia uma mensagem de teste para o Telegram"""
     if chat_id is None:
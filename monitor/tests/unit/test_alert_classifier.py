@@ -0,0 +1,164 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from app.core.alert_classifier import AlertClassifier, KeywordAutomaton, PatternEngine, alert_type_for, fold, is_risky
+from app.core.email_handler import EmailHandler
+from app.core.uid_checkpoint import CheckpointStore
+
+LEVELS = {
+    'critical': ['urgente', 'crítico', 'emergência'],
+    'important': ['importante', 'atenção', 'alerta'],
+    'low': ['informação', 'atualização', 'concluído'],
+}
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    def test_matching_ignores_case_and_accents(self):
+        automaton = KeywordAutomaton(LEVELS)
+        self.assertEqual(automaton.scan(fold('Backup em estado CRITICO')).severity, 'critical')
+        self.assertEqual(automaton.scan(fold('Atencao: disco em 80%')).keywords, ['atenção'])
+        self.assertIsNone(automaton.scan(fold('Reunião amanhã')).severity)
+
+    def test_most_severe_level_wins(self):
+        automaton = KeywordAutomaton(LEVELS)
+        self.assertEqual(automaton.scan(fold('Atualização concluída com alerta urgente')).severity, 'critical')
+        self.assertEqual(automaton.scan(fold('informação e alerta')).severity, 'important')
+
+    def test_overlapping_keywords_are_found(self):
+        automaton = KeywordAutomaton({'low': ['he', 'she', 'his', 'hers']})
+        self.assertEqual(sorted(automaton.scan('ushers').keywords), ['he', 'she'])
+
+
+class TestPatternEngine(unittest.TestCase):
+    def test_every_matching_rule_is_reported(self):
+        engine = PatternEngine({'critical': [r'disk usage > 9\d%', r'(?P<host>srv-\d+) down'],
+                                'important': ['[inválida'], 'low': [r'backup (ok|conclu)', r'(a)\1']},
+                               isolate=False)
+
+        self.assertEqual([pattern for _, pattern in engine.rules],
+                         [r'disk usage > 9\d%', r'(?P<host>srv-\d+) down', r'backup (ok|conclu)', r'(a)\1'])
+        self.assertEqual(engine.scan('Backup OK\nDisk usage > 97%\nsrv-01 down aa'),
+                         {0: 'Disk usage > 97%', 1: 'srv-01 down', 2: 'Backup OK', 3: 'aa'})
+        self.assertEqual(engine.scan('nada a relatar'), {})
+
+    def test_overlapping_rules_are_all_reported(self):
+        engine = PatternEngine({'critical': [r'disk \w+'], 'warning': ['disk', 'full']}, isolate=False)
+        self.assertEqual(engine.scan('disk full'), {0: 'disk full', 1: 'disk', 2: 'full'})
+
+        engine = PatternEngine({'critical': ['disk usage'], 'low': ['disk', 'job \\w+ finished']}, isolate=False)
+        self.assertEqual(engine.scan('disk usage; job x finished'), {0: 'disk usage', 1: 'disk', 2: 'job x finished'})
+
+    def test_nested_repetitions_are_risky(self):
+        self.assertTrue(is_risky(r'(a+)+$'))
+        self.assertTrue(is_risky(r'(?:\w+\s?)*done'))
+        self.assertFalse(is_risky(r'srv-\d+ (?:down|unreachable)'))
+        self.assertFalse(is_risky(r'(?:ab){2}c+'))
+
+    def test_scanned_text_is_capped(self):
+        engine = PatternEngine({'critical': ['urgente']}, max_chars=10, isolate=False)
+        self.assertEqual(engine.scan('urgente' + ' ' * 20), {0: 'urgente'})
+        self.assertEqual(engine.scan(' ' * 20 + 'urgente'), {})
+
+    def test_pathological_rule_is_disabled_alone(self):
+        engine = PatternEngine({'critical': [r'(a+)+$', 'urgente'], 'low': ['ok']}, timeout=0.3)
+        self.addCleanup(engine.close)
+        self.assertEqual(engine.risky, [0])
+
+        self.assertEqual(engine.scan('urgente'), {1: 'urgente'})
+        self.assertEqual(engine.scan('a' * 40 + '! ok'), {2: 'ok'})
+        self.assertEqual(engine.disabled, {0})
+        self.assertEqual(engine.scan('urgente ok'), {1: 'urgente', 2: 'ok'})
+        self.assertEqual(engine.stats['timeouts'], 1)
+
+
+class TestAlertClassifier(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'config.json')
+
+    def write(self, levels, mtime, patterns=None):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'alerts': {'levels': levels, 'patterns': patterns or {}}}, f)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_automaton_is_cached_until_file_changes(self):
+        self.write(LEVELS, 1000)
+        classifier = AlertClassifier(self.path)
+
+        self.assertEqual(classifier.classify('URGENTE', '').severity, 'critical')
+        self.assertEqual(classifier.classify('Importante', 'corpo').severity, 'important')
+        self.assertEqual(classifier.rebuilds, 1)
+
+        self.write({'low': ['urgente']}, 2000)
+        self.assertEqual(classifier.classify('URGENTE', '').severity, 'low')
+        self.assertEqual(classifier.rebuilds, 2)
+
+    def test_patterns_and_keywords_are_merged(self):
+        self.write(LEVELS, 1000, {'critical': [r'disk usage > 9\d%'], 'low': ['backup ok']})
+        classifier = AlertClassifier(self.path)
+        self.addCleanup(lambda: classifier.compiled()[1].close())
+
+        result = classifier.classify('Alerta', 'Disk usage > 97% em /var')
+        self.assertEqual((result.severity, result.keywords, result.rules), ('critical', [], [r'disk usage > 9\d%']))
+        result = classifier.classify('Alerta', 'backup ok')
+        self.assertEqual((result.severity, result.keywords, result.rules), ('important', ['alerta'], []))
+
+    def test_missing_or_invalid_file_leaves_emails_unclassified(self):
+        classifier = AlertClassifier(self.path)
+        with self.assertLogs('wegnots.alert_classifier', 'WARNING'):
+            self.assertIsNone(classifier.classify('urgente', '').severity)
+        self.assertEqual(classifier.rebuilds, 1)
+
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{inválido')
+        self.assertIsNone(classifier.classify('urgente', '').severity)
+
+    def test_default_path_is_found_from_the_monitor_directory(self):
+        # O serviço roda de monitor/; o config.json fica na raiz do projeto
+        cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), '../..'))
+        self.addCleanup(os.chdir, cwd)
+
+        classifier = AlertClassifier()
+        self.addCleanup(lambda: classifier.compiled()[1].close())
+
+        self.assertTrue(os.path.exists(classifier.path))
+        self.assertEqual(classifier.classify('URGENTE: servidor caiu', '').severity, 'critical')
+
+    def test_labels(self):
+        self.assertEqual(alert_type_for(None), '📨 NOVO EMAIL')
+        self.assertEqual(alert_type_for('critical'), '🚨 ALERTA CRÍTICO')
+
+
+class TestHandlerClassification(unittest.TestCase):
+    def test_new_emails_are_tagged_with_severity(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'config.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'alerts': {'levels': LEVELS}}, f)
+        handler = EmailHandler(MagicMock(), checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')),
+                               classifier=AlertClassifier(path))
+        connection = MagicMock(server='imap.example.com', telegram_chat_id=None, telegram_token=None,
+                               notification_destinations={})
+        connection.fetch_new_uids.return_value = [1, 2]
+        connection.fetch_previews.return_value = {
+            1: {'subject': 'Servidor fora', 'from': 'x', 'body': 'Emergência no datacenter', 'date': '',
+                'message_id': '', 'size': 1},
+            2: {'subject': 'Olá', 'from': 'x', 'body': 'tudo bem', 'date': '', 'message_id': '', 'size': 1},
+        }
+        emails = []
+
+        handler._check_account('a@example.com', connection, emails)
+
+        self.assertEqual([(e['severity'], e['critical']) for e in emails], [('critical', True), (None, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
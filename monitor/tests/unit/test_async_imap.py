@@ -0,0 +1,166 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import asyncio
+import unittest
+from functools import partial
+from unittest.mock import patch
+from app.core.async_imap import AsyncIMAPClient, AsyncIMAPError
+from app.core.imap_protocol import parse_fetch_response, parse_status_response
+
+
+class FakeIMAPServer:
+    """Servidor IMAP em texto puro que responde a um roteiro fixo de comandos"""
+
+    def __init__(self):
+        self.commands = []
+        self.server = None
+        # Conexões de clientes ainda abertas
+        self.open_connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.open_connections += 1
+        try:
+            await self._serve(reader, writer)
+        finally:
+            self.open_connections -= 1
+
+    async def _serve(self, reader, writer):
+        writer.write(b'* OK fake ready\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            tag, _, command = line.strip().partition(b' ')
+            self.commands.append(command)
+            verb = command.split(b' ')[0].upper()
+            if verb == b'CAPABILITY':
+                writer.write(b'* CAPABILITY IMAP4rev1 IDLE\r\n')
+            elif verb == b'LOGIN' and b'wrong' in command:
+                writer.write(tag + b' NO [AUTHENTICATIONFAILED] invalid\r\n')
+                continue
+            elif verb == b'STATUS' and b'SLOW' in command:
+                # Resposta parcial, sem a linha marcada
+                writer.write(b'* STATUS "SLOW" (UIDNEXT 12\r\n')
+                await writer.drain()
+                continue
+            elif verb == b'SELECT':
+                writer.write(b'* 3 EXISTS\r\n* OK [UIDVALIDITY 77] ok\r\n* OK [UIDNEXT 12] ok\r\n')
+            elif verb == b'STATUS':
+                writer.write(b'* STATUS "INBOX" (UIDNEXT 12 MESSAGES 3 UNSEEN 1)\r\n')
+            elif command.upper().startswith(b'UID SEARCH'):
+                writer.write(b'* SEARCH 10 11\r\n')
+            elif command.upper().startswith(b'UID FETCH'):
+                writer.write(b'* 2 FETCH (UID 10 RFC822 {5}\r\nhello)\r\n')
+                writer.write(b'* 3 FETCH (UID 11 RFC822 {5}\r\nworld FLAGS ())\r\n')
+            elif verb == b'IDLE':
+                writer.write(b'+ idling\r\n')
+                await writer.drain()
+                await asyncio.sleep(0.05)
+                writer.write(b'* 4 EXISTS\r\n')
+                await writer.drain()
+                await reader.readline()  # DONE
+            elif verb == b'LOGOUT':
+                writer.write(b'* BYE\r\n' + tag + b' OK bye\r\n')
+                await writer.drain()
+                break
+            writer.write(tag + b' OK done\r\n')
+            await writer.drain()
+        writer.close()
+
+
+class TestAsyncIMAPClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake = FakeIMAPServer()
+        port = await self.fake.start()
+        self.client = AsyncIMAPClient('127.0.0.1', port, use_ssl=False, timeout=5)
+        await self.client.connect()
+
+    async def asyncTearDown(self):
+        await self.client.logout()
+        await self.fake.stop()
+
+    async def test_login_select_and_capabilities(self):
+        await self.client.login('user', 'secret')
+        status, data = await self.client.select('INBOX')
+
+        self.assertEqual(status, 'OK')
+        self.assertEqual(data, [b'3'])
+        self.assertIn('IDLE', self.client.capabilities)
+        self.assertEqual(self.client.untagged_responses['UIDVALIDITY'], [b'77'])
+        self.assertIn(b'LOGIN "user" "secret"', self.fake.commands)
+
+    async def test_login_failure_raises(self):
+        with self.assertRaises(AsyncIMAPError):
+            await self.client.login('user', 'wrong')
+
+    async def test_uid_search_and_fetch_literals(self):
+        await self.client.select('INBOX')
+        _, data = await self.client.uid('SEARCH', 'UNSEEN')
+        self.assertEqual(data, [b'10 11'])
+
+        _, data = await self.client.uid('FETCH', '10:11', '(UID RFC822)')
+        records = {record['UID']: record['RFC822'] for record in parse_fetch_response(data)}
+        self.assertEqual(records, {10: b'hello', 11: b'world'})
+
+    async def test_status(self):
+        _, data = await self.client.status('INBOX', '(UIDNEXT MESSAGES UNSEEN)')
+        self.assertEqual(parse_status_response(data), {'UIDNEXT': 12, 'MESSAGES': 3, 'UNSEEN': 1})
+        self.assertIn(b'STATUS "INBOX" (UIDNEXT MESSAGES UNSEEN)', self.fake.commands)
+
+    async def test_timeout_closes_the_connection(self):
+        self.client.timeout = 0.2
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.client.status('SLOW', '(UIDNEXT)')
+
+        self.assertIsNone(self.client.writer)
+        with self.assertRaises(AsyncIMAPError):
+            await self.client.status('INBOX', '(UIDNEXT)')
+
+    async def test_idle_reports_exists(self):
+        events = await self.client.idle(timeout=2)
+        self.assertEqual(events, [b'4 EXISTS'])
+
+    async def test_concurrent_clients(self):
+        other = AsyncIMAPClient('127.0.0.1', self.client.port, use_ssl=False, timeout=5)
+        await other.connect()
+        try:
+            results = await asyncio.gather(self.client.select('INBOX'), other.select('INBOX'))
+            self.assertEqual([status for status, _ in results], ['OK', 'OK'])
+        finally:
+            await other.logout()
+
+
+class TestIMAPMonitorConnect(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with patch('signal.signal'):
+            import simple_monitor
+        self.fake = FakeIMAPServer()
+        port = await self.fake.start()
+        self.monitor = simple_monitor.IMAPMonitor(simple_monitor.IMAPConfig('127.0.0.1', port, 'user', 'wrong', True))
+        self.addAsyncCleanup(self.fake.stop)
+
+    async def test_rejected_login_does_not_leak_connections(self):
+        with patch('simple_monitor.AsyncIMAPClient', partial(AsyncIMAPClient, use_ssl=False, timeout=5)):
+            for _ in range(3):
+                self.assertFalse(await self.monitor.connect())
+
+        self.assertIsNone(self.monitor.imap.writer)
+        for _ in range(50):
+            if not self.fake.open_connections:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.fake.open_connections, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
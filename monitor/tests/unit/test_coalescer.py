@@ -0,0 +1,95 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import threading
+import unittest
+from unittest.mock import ANY, MagicMock
+from app.core.coalescer import AlertCoalescer
+from app.core.email_handler import EmailHandler
+from app.core.telegram_client import TELEGRAM_MESSAGE_LIMIT, TelegramClient
+
+
+def alert(n, **extra):
+    return dict({'email_key': f"s:a:{n}", 'username': 'a@example.com', 'subject': f"Assunto {n}",
+                 'from': 'lista@example.com', 'body': 'corpo', 'telegram_token': None, 'telegram_chat_id': None},
+                **extra)
+
+
+class TestAlertCoalescer(unittest.TestCase):
+    def test_groups_alerts_per_destination_until_window_closes(self):
+        emitted = []
+        done = threading.Event()
+
+        def emit(destination, alerts):
+            emitted.append((destination, [a['email_key'] for a in alerts]))
+            if len(emitted) == 2:
+                done.set()
+
+        coalescer = AlertCoalescer(emit, window=0.1, threshold=2)
+        self.addCleanup(coalescer.close)
+        for n in range(3):
+            coalescer.add(('T', '1'), alert(n))
+        coalescer.add(('T', '2'), alert(9))
+        self.assertEqual(emitted, [])
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(sorted(emitted), [(('T', '1'), ['s:a:0', 's:a:1', 's:a:2']), (('T', '2'), ['s:a:9'])])
+        self.assertEqual(coalescer.metrics()['digests'], 1)
+
+    def test_close_flushes_held_alerts(self):
+        emitted = []
+        coalescer = AlertCoalescer(lambda destination, alerts: emitted.extend(alerts), window=60)
+        coalescer.add(('T', '1'), alert(1))
+        coalescer.close()
+        self.assertEqual([a['email_key'] for a in emitted], ['s:a:1'])
+
+
+class TestDigestFormatting(unittest.TestCase):
+    def test_digest_is_split_at_message_limit(self):
+        client = TelegramClient.__new__(TelegramClient)
+        alerts = [alert(n, subject='x' * 140) for n in range(60)]
+
+        parts = client.format_digest(alerts)
+
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(len(message) <= TELEGRAM_MESSAGE_LIMIT for message, _ in parts))
+        self.assertEqual([a['email_key'] for _, part in parts for a in part], [a['email_key'] for a in alerts])
+        self.assertIn('60 NOVOS EMAILS', parts[0][0])
+        self.assertIn(f"\\(1/{len(parts)}\\)", parts[0][0])
+
+
+class TestHandlerCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.telegram = MagicMock()
+        self.telegram.resolve_destination.side_effect = lambda token, chat_id: (token or 'TOKEN', chat_id or '42')
+        self.telegram.format_digest.side_effect = lambda alerts: [('resumo', alerts)]
+        self.handler = EmailHandler(self.telegram, coalesce_window=60, digest_threshold=3)
+        self.addCleanup(self.handler.coalescer.close)
+
+    def test_burst_becomes_single_digest(self):
+        for n in range(4):
+            self.handler._dispatch(alert(n))
+        self.handler.coalescer.flush()
+
+        self.telegram.send_alert.assert_not_called()
+        self.telegram.send_text_message.assert_called_once_with(message='resumo', parse_mode='MarkdownV2',
+                                                                token='TOKEN', chat_id='42', deadline=ANY)
+
+    def test_small_group_is_sent_individually(self):
+        self.handler._dispatch(alert(1))
+        self.handler._dispatch(alert(2))
+        self.handler.coalescer.flush()
+
+        self.assertEqual(self.telegram.send_alert.call_count, 2)
+        self.telegram.send_text_message.assert_not_called()
+
+    def test_critical_alert_bypasses_window(self):
+        self.handler._dispatch(alert(1, critical=True))
+
+        self.telegram.send_alert.assert_called_once()
+        self.assertEqual(self.handler.coalescer.metrics()['held'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
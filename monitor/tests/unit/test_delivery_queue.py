@@ -0,0 +1,153 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import itertools
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from app.core.delivery_queue import DeliveryJob, DeliveryQueue, Retry
+from app.core.email_handler import EmailHandler
+from app.core.rate_limiter import RateLimiter
+from app.core.telegram_client import SendResult
+
+
+class TestDeliveryQueue(unittest.TestCase):
+    def test_jobs_are_delivered_by_workers(self):
+        delivered = []
+        delivery = DeliveryQueue(lambda job: delivered.append(job.key) or True, workers=2, maxsize=10)
+        delivery.start()
+        self.addCleanup(delivery.stop)
+
+        for i in range(5):
+            self.assertTrue(delivery.put(DeliveryJob({'n': i}, key=str(i))))
+        self.assertTrue(delivery.drain(5))
+
+        self.assertEqual(sorted(delivered), ['0', '1', '2', '3', '4'])
+        metrics = delivery.metrics()
+        self.assertEqual((metrics['enqueued'], metrics['delivered'], metrics['failed']), (5, 5, 0))
+        self.assertEqual(metrics['depth'], 0)
+
+    def test_failures_are_counted(self):
+        def handler(job):
+            if job.key == 'boom':
+                raise RuntimeError('telegram fora do ar')
+            return False
+
+        delivery = DeliveryQueue(handler, workers=1)
+        delivery.start()
+        self.addCleanup(delivery.stop)
+        delivery.put(DeliveryJob({}, key='boom'))
+        delivery.put(DeliveryJob({}, key='nok'))
+        delivery.drain(5)
+
+        self.assertEqual(delivery.metrics()['failed'], 2)
+
+    def test_full_queue_applies_backpressure_and_reports_age(self):
+        release = threading.Event()
+        delivery = DeliveryQueue(lambda job: release.wait(5), workers=1, maxsize=1)
+        delivery.start()
+        self.addCleanup(delivery.stop)
+        self.addCleanup(release.set)
+
+        delivery.put(DeliveryJob({}, key='em-envio'))
+        while delivery.metrics()['depth']:
+            time.sleep(0.01)
+        delivery.put(DeliveryJob({}, key='na-fila'))
+
+        started = time.monotonic()
+        self.assertFalse(delivery.put(DeliveryJob({}, key='excedente'), timeout=0.2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+        metrics = delivery.metrics()
+        self.assertEqual(metrics['depth'], 1)
+        self.assertGreater(metrics['oldest_age'], 0)
+
+        release.set()
+        self.assertTrue(delivery.drain(5))
+
+    def test_retry_reschedules_without_holding_worker(self):
+        calls = []
+
+        def handler(job):
+            calls.append((job.key, time.monotonic()))
+            if job.key == 'limitado' and job.attempts == 1:
+                return Retry(0.3, '429')
+            return True
+
+        delivery = DeliveryQueue(handler, workers=1)
+        delivery.start()
+        self.addCleanup(delivery.stop)
+        delivery.put(DeliveryJob({}, key='limitado'))
+        delivery.put(DeliveryJob({}, key='livre'))
+        self.assertTrue(delivery.drain(5))
+
+        # O único worker entrega o outro job enquanto o primeiro aguarda o reagendamento
+        self.assertEqual([key for key, _ in calls], ['limitado', 'livre', 'limitado'])
+        self.assertGreaterEqual(calls[2][1] - calls[0][1], 0.3)
+        metrics = delivery.metrics()
+        self.assertEqual((metrics['delivered'], metrics['rescheduled'], metrics['delayed']), (2, 1, 0))
+
+
+class TestHandlerDelivery(unittest.TestCase):
+    def setUp(self):
+        self.telegram = MagicMock()
+        self.telegram.resolve_destination.side_effect = lambda token, chat_id: (token or 'TOKEN', chat_id or '42')
+        self.telegram.format_alert_parts.return_value = (['mensagem'], 'MarkdownV2')
+        self.email_data = {'username': 'a@example.com', 'subject': 'Oi', 'from': 'x@example.com', 'body': 'corpo',
+                           'telegram_token': None, 'telegram_chat_id': None, 'email_key': 's:a:1'}
+
+    def test_process_emails_enqueues_instead_of_sending_inline(self):
+        self.telegram.send_message_once.return_value = SendResult(True, 200)
+        handler = EmailHandler(self.telegram, delivery_workers=2)
+        self.addCleanup(handler.delivery_queue.stop)
+        handler.check_new_emails = MagicMock(return_value=[self.email_data])
+
+        handler.process_emails()
+        self.assertTrue(handler.delivery_queue.drain(5))
+
+        self.telegram.format_alert_parts.assert_called_once_with(subject='Oi', from_addr='x@example.com', body='corpo',
+                                                                 alert_type='📨 NOVO EMAIL')
+        self.telegram.send_message_once.assert_called_once_with('mensagem', 'MarkdownV2', 'TOKEN', '42')
+        self.assertEqual(handler.get_delivery_metrics()['delivered'], 1)
+
+    def test_long_alert_resumes_at_unsent_part(self):
+        # Relógio que avança um segundo por consulta: o limitador nunca segura as partes
+        handler = EmailHandler(self.telegram, rate_limiter=RateLimiter(clock=itertools.count().__next__))
+        self.telegram.format_alert_parts.return_value = (['parte 1', 'parte 2', 'parte 3'], 'MarkdownV2')
+        self.telegram.send_message_once.side_effect = [SendResult(True, 200), SendResult(False, 500),
+                                                       SendResult(True, 200), SendResult(True, 200)]
+        job = DeliveryJob(self.email_data, attempts=1)
+
+        self.assertEqual(handler._deliver_job(job).reason, 'HTTP 500')
+        self.assertIs(handler._deliver_job(job), True)
+
+        self.assertEqual([c.args[0] for c in self.telegram.send_message_once.call_args_list],
+                         ['parte 1', 'parte 2', 'parte 2', 'parte 3'])
+        self.telegram.format_alert_parts.assert_called_once()
+
+    def test_429_blocks_chat_and_reschedules(self):
+        handler = EmailHandler(self.telegram)
+        self.telegram.send_message_once.return_value = SendResult(False, 429, retry_after=7)
+        job = DeliveryJob(self.email_data, attempts=1)
+
+        result = handler._deliver_job(job)
+
+        self.assertEqual(result, Retry(7, '429'))
+        self.assertGreater(handler.rate_limiter.blocked_for('TOKEN', '42'), 6)
+        # Enquanto o bloqueio durar, novos envios para o chat são reagendados sem chamar a API
+        self.telegram.send_message_once.reset_mock()
+        self.assertIsInstance(handler._deliver_job(DeliveryJob(self.email_data, attempts=1)), Retry)
+        self.telegram.send_message_once.assert_not_called()
+
+    def test_non_429_failures_give_up_after_max_attempts(self):
+        handler = EmailHandler(self.telegram)
+        self.telegram.send_message_once.return_value = SendResult(False, 500)
+
+        self.assertIsInstance(handler._deliver_job(DeliveryJob(self.email_data, attempts=1)), Retry)
+        self.assertFalse(handler._deliver_job(DeliveryJob(dict(self.email_data, telegram_chat_id='7'), attempts=5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
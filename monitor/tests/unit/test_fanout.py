@@ -0,0 +1,136 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from app.core.email_handler import EmailHandler
+from app.core.outbox import Outbox
+from app.core.uid_checkpoint import CheckpointStore
+
+
+def alert(destinations):
+    return {'email_key': 's:a:1', 'username': 'a@example.com', 'subject': 'Oi', 'from': 'x@example.com',
+            'body': 'corpo', 'telegram_token': 'LEGADO', 'telegram_chat_id': '1', 'destinations': destinations}
+
+
+class TestFanOut(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.outbox = Outbox(os.path.join(tmpdir.name, 'outbox.jsonl'))
+        self.addCleanup(self.outbox.close)
+        self.telegram = MagicMock()
+        self.telegram.resolve_destination.side_effect = lambda token, chat_id: (token, chat_id)
+        self.handler = EmailHandler(self.telegram, checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')),
+                                    outbox=self.outbox)
+
+    def test_identical_destinations_are_deduplicated(self):
+        copies = self.handler._fan_out(alert({
+            'Secbot': {'token': 'T1', 'chat_id': '10'},
+            '@Monitorsecbot': {'token': 'T1', 'chat_id': '10'},
+            'Grupo': {'token': '', 'chat_id': '-20'},
+        }))
+
+        self.assertEqual([(c['destination'], c['telegram_token'], c['telegram_chat_id']) for c in copies],
+                         [('Secbot', 'T1', '10'), ('Grupo', 'LEGADO', '-20')])
+
+    def test_without_destinations_uses_account_fields(self):
+        copies = self.handler._fan_out(alert({}))
+        self.assertEqual([(c['telegram_token'], c['telegram_chat_id']) for c in copies], [('LEGADO', '1')])
+
+    def test_destinations_are_delivered_concurrently_with_report(self):
+        def send_alert(**kwargs):
+            time.sleep(0.2)
+            return kwargs['chat_id'] != '30'
+
+        self.telegram.send_alert.side_effect = send_alert
+        self.outbox.add_many([alert({})])
+
+        started = time.monotonic()
+        self.handler._dispatch(alert({name: {'token': 'T', 'chat_id': chat}
+                                      for name, chat in (('A', '10'), ('B', '20'), ('C', '30'))}))
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        metrics = self.handler.get_destination_metrics()
+        self.assertEqual(metrics['A (10)']['sent'], 1)
+        self.assertEqual(metrics['C (30)']['failed'], 1)
+        self.assertGreaterEqual(metrics['A (10)']['avg_latency'], 0.2)
+        # Um destino falhou: o alerta continua no outbox para ser reenviado
+        self.assertEqual(len(self.outbox.pending()), 1)
+
+    def test_outbox_is_acked_after_all_destinations(self):
+        self.telegram.send_alert.return_value = True
+        self.outbox.add_many([alert({})])
+
+        self.handler._dispatch(alert({'A': {'token': 'T', 'chat_id': '10'}, 'B': {'token': 'T', 'chat_id': '20'}}))
+
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertEqual(self.handler._fanout_pending, {})
+
+    def test_setup_connections_reads_destinations(self):
+        self.handler.setup_connections({
+            'IMAP_a': {'server': 's', 'port': '993', 'username': 'a@example.com', 'password': 'x',
+                       'is_active': 'True', 'notification_destinations': '{"Secbot": {"chat_id": "1", "token": "T"}}'},
+            'IMAP_b': {'server': 's', 'port': '993', 'username': 'b@example.com', 'password': 'x',
+                       'is_active': 'True', 'notification_destinations': '{inválido'},
+        })
+
+        self.assertEqual(self.handler.connections['a@example.com'].notification_destinations,
+                         {'Secbot': {'chat_id': '1', 'token': 'T'}})
+        self.assertEqual(self.handler.connections['b@example.com'].notification_destinations, {})
+
+
+CONFIG_INI = """
+[TELEGRAM]
+token = PADRAO
+chat_id = 1
+
+[IMAP_a@example.com]
+server = imap.example.com
+port = 993
+username = a@example.com
+password = x
+is_active = True
+telegram_token = LEGADO
+telegram_chat_id = 1
+notification_destinations = {"Secbot": {"chat_id": "10", "token": "T1"}, "Grupo": {"chat_id": "-20", "token": "T2"}}
+"""
+
+
+class TestConfigToFanOut(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        with open(os.path.join(tmpdir.name, 'config.ini'), 'w', encoding='utf-8') as f:
+            f.write(CONFIG_INI)
+        cwd = os.getcwd()
+        os.chdir(tmpdir.name)
+        self.addCleanup(os.chdir, cwd)
+        self.telegram = MagicMock(default_token='PADRAO')
+        self.telegram.resolve_destination.side_effect = lambda token, chat_id: (token, chat_id)
+        self.handler = EmailHandler(self.telegram, checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')))
+
+    def test_destinations_from_config_ini_reach_fan_out(self):
+        import main
+        imap_configs, _, _ = main.load_config()
+        self.handler.setup_connections(imap_configs)
+        connection = self.handler.connections['a@example.com']
+        preview = {'subject': 'Oi', 'from': 'x', 'body': 'corpo', 'date': '', 'message_id': '', 'size': 1}
+        emails = []
+
+        with patch.object(connection, 'fetch_new_uids', return_value=[1]), \
+                patch.object(connection, 'fetch_previews', return_value={1: preview}), \
+                patch.object(connection, 'mark_seen'):
+            self.handler._check_account('a@example.com', connection, emails)
+
+        copies = self.handler._fan_out(emails[0])
+        self.assertEqual([(c['destination'], c['telegram_token'], c['telegram_chat_id']) for c in copies],
+                         [('Secbot', 'T1', '10'), ('Grupo', 'T2', '-20')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import unittest
+from datetime import datetime
+from app.core.formatting import (STARTUP_BANNER, TELEGRAM_MESSAGE_LIMIT, MessageTemplate, escape_code, escape_markdown,
+                                 escape_prefix, escape_truncated, monitored_accounts, render_alert, split_escaped,
+                                 stopped_accounts, timestamp)
+
+
+class TestEscaping(unittest.TestCase):
+    def test_all_special_characters_are_escaped(self):
+        self.assertEqual(escape_markdown('a_b*c[d](e)~`>#+-=|{}.!'),
+                         'a\\_b\\*c\\[d\\]\\(e\\)\\~\\`\\>\\#\\+\\-\\=\\|\\{\\}\\.\\!')
+
+    def test_backslash_is_escaped_once(self):
+        self.assertEqual(escape_markdown('C:\\temp.'), 'C:\\\\temp\\.')
+
+    def test_empty_and_non_string_values(self):
+        self.assertEqual(escape_markdown(None), '')
+        self.assertEqual(escape_markdown(''), '')
+        self.assertEqual(escape_markdown(0), '0')
+        self.assertEqual(escape_markdown(3.5), '3\\.5')
+
+    def test_code_escaping_only_touches_backtick_and_backslash(self):
+        self.assertEqual(escape_code('x = `a` \\ b.c!'), 'x = \\`a\\` \\\\ b.c!')
+
+
+class TestMessageTemplate(unittest.TestCase):
+    def test_fields_are_escaped_and_static_parts_kept(self):
+        template = MessageTemplate("*{title}*\\.\n```\n{body}```\n{raw}", code=('body',), raw=('raw',))
+        self.assertEqual(template.fields, ['title', 'body', 'raw'])
+        self.assertEqual(template.render(title='v1.2', body='a.b`c', raw='*já formatado*'),
+                         "*v1\\.2*\\.\n```\na.b\\`c```\n*já formatado*")
+
+    def test_format_specs_are_rejected(self):
+        with self.assertRaises(ValueError):
+            MessageTemplate("{valor:>10}")
+
+    def test_alert_template_matches_previous_layout(self):
+        [message] = render_alert(alert_type='📨 NOVO EMAIL', from_addr='a.b@example.com',
+                                 subject='Oi!', date='14/03/2025 10:00:00', body='linha 1.')
+        self.assertEqual(message, "*📨 NOVO EMAIL*\n\n📧 *De:* a\\.b@example\\.com\n📝 *Assunto:* Oi\\!\n"
+                                  "⏰ *Data:* 14/03/2025 10:00:00\n\n💬 *Conteúdo:*\n```\nlinha 1.```")
+
+    def test_banners_and_account_lists(self):
+        now = timestamp(datetime(2025, 3, 14, 10, 0, 0))
+        self.assertEqual(STARTUP_BANNER.render(time=now) + monitored_accounts(['a@b.com']),
+                         "🟢 *WegNots Monitor Iniciado*\n\n⏰ 14/03/2025 10:00:00\n"
+                         "✅ Sistema de monitoramento iniciado com sucesso\\.\n✉️ Monitorando e\\-mails\\.\\.\\."
+                         "\n\n📨 Contas monitoradas: 1\n   1\\. a@b\\.com")
+        self.assertEqual(stopped_accounts(['a@b.com']), "\n\n📨 O monitoramento da conta a@b\\.com foi encerrado\\.")
+        self.assertIn("\n   2\\. c@d\\.com", stopped_accounts(['a@b.com', 'c@d.com']))
+
+
+class TestLengthAwareFormatting(unittest.TestCase):
+    def test_prefix_never_splits_an_escape(self):
+        escaped, consumed = escape_prefix('ab.', 3)
+        self.assertEqual((escaped, consumed), ('ab', 2))
+        self.assertEqual(escape_prefix('a.b.', 4), ('a\\.b', 3))
+
+    def test_truncated_text_ends_with_ellipsis(self):
+        self.assertEqual(escape_truncated('curto.', 20), 'curto\\.')
+        self.assertEqual(escape_truncated('x' * 50, 10), 'x' * 9 + '…')
+
+    def test_split_prefers_line_boundaries(self):
+        parts, truncated = split_escaped('linha 1\nlinha 2\nlinha 3', [12, 12, 12])
+        self.assertEqual(parts, ['linha 1\n', 'linha 2\n', 'linha 3'])
+        self.assertFalse(truncated)
+
+    def test_huge_body_is_split_within_limit(self):
+        body = '`\\.' * 1_000_000
+        messages = render_alert('📨 NOVO EMAIL', 'a@b.com', 'Oi', '14/03/2025 10:00:00', body, max_parts=3)
+
+        self.assertEqual(len(messages), 3)
+        for message in messages:
+            self.assertLessEqual(len(message), TELEGRAM_MESSAGE_LIMIT)
+            self.assertTrue(message.endswith('```'))
+            # Nenhum escape cortado ao meio antes do fechamento do bloco
+            content = message[message.index('```\n') + 4:-3].rstrip('…')
+            self.assertEqual((len(content) - len(content.rstrip('\\'))) % 2, 0)
+        self.assertIn('\\(2/3\\)', messages[1])
+        self.assertTrue(messages[-1].endswith('…```'))
+
+    def test_single_message_keeps_body_limit(self):
+        [message] = render_alert('📨 NOVO EMAIL', 'a@b.com', 'Oi', '14/03/2025 10:00:00', 'x' * 5000)
+        self.assertIn('x' * 999 + '…```', message)
+        self.assertNotIn('x' * 1000, message)
+
+
+if __name__ == '__main__':
+    unittest.main()
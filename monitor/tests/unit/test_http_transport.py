@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import http.server
+import threading
+import unittest
+from app.core.http_transport import HTTPTransport, configure_transport, get_transport
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/botTOKEN/sendMessage"
+        self.transport = HTTPTransport(pool_connections=1, pool_maxsize=2)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused_across_messages(self):
+        for _ in range(3):
+            response = self.transport.post(self.url, key='token-a', json={'text': 'oi'}, timeout=5)
+            self.assertEqual(response.json(), {'ok': True})
+
+        self.assertEqual(self.transport.stats(), {'sessions': 1, 'requests': 3, 'handshakes': 1, 'reused': 2})
+
+    def test_sessions_are_separate_per_token(self):
+        self.transport.post(self.url, key='token-a', json={}, timeout=5)
+        self.transport.post(self.url, key='token-b', json={}, timeout=5)
+
+        self.assertIsNot(self.transport.session('token-a'), self.transport.session('token-b'))
+        self.assertEqual(self.transport.stats()['handshakes'], 2)
+
+    def test_counters_survive_pool_eviction_and_close(self):
+        # pool_connections=1: o pool de 127.0.0.1 é despejado ao abrir o de localhost
+        self.transport.post(self.url, key='token-a', json={}, timeout=5)
+        self.transport.post(self.url.replace('127.0.0.1', 'localhost'), key='token-a', json={}, timeout=5)
+        self.assertEqual(self.transport.stats(), {'sessions': 1, 'requests': 2, 'handshakes': 2, 'reused': 0})
+
+        self.transport.close()
+        self.assertEqual(self.transport.stats(), {'sessions': 0, 'requests': 2, 'handshakes': 2, 'reused': 0})
+
+    def test_default_key_is_host(self):
+        self.transport.post(self.url, json={}, timeout=5)
+        self.assertEqual(list(self.transport._sessions), [f"127.0.0.1:{self.server.server_address[1]}"])
+
+    def test_configure_replaces_shared_transport(self):
+        transport = configure_transport(pool_connections=1, pool_maxsize=4)
+        self.addCleanup(transport.close)
+        self.assertIs(get_transport(), transport)
+        self.assertEqual(transport.pool_maxsize, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
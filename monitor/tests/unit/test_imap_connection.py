@@ -0,0 +1,371 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import socket
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.email_handler import IMAPConnection, IMAPCommandTimeout, EmailHandler
+from app.core.uid_checkpoint import CheckpointStore
+
+
+class FakeSocket:
+    """Socket falso que entrega blocos pré-definidos e simula timeout quando vazio"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        if not self.chunks:
+            raise socket.timeout()
+        return self.chunks.pop(0)
+
+
+def make_idle_imap(chunks):
+    imap = MagicMock()
+    imap._new_tag.return_value = b'A001'
+    imap.sock = FakeSocket(chunks)
+    return imap
+
+
+class TestIMAPIdle(unittest.TestCase):
+    def setUp(self):
+        self.connection = IMAPConnection('imap.example.com', 993, 'user@example.com', 'secret')
+
+    def test_supports_idle_uses_capabilities(self):
+        self.assertFalse(self.connection.supports_idle())
+        self.connection.capabilities = {'IMAP4REV1', 'IDLE'}
+        self.assertTrue(self.connection.supports_idle())
+
+    def test_start_idle_without_capability_falls_back(self):
+        self.connection.capabilities = {'IMAP4REV1'}
+        self.assertFalse(self.connection.start_idle(lambda *args: None))
+        self.assertFalse(self.connection.is_idling())
+
+    def test_idle_cycle_reports_exists(self):
+        imap = make_idle_imap([
+            b'+ idling\r\n',
+            b'* 4 EXISTS\r\n* 1 RECENT\r\n',
+            b'A001 OK IDLE terminated\r\n',
+        ])
+        events = []
+
+        def on_exists(username, total):
+            events.append((username, total))
+
+        # Duração zero: o DONE é enviado logo após a continuação
+        self.connection._idle_cycle(imap, 0, on_exists)
+
+        self.assertEqual(events, [('user@example.com', 4)])
+        imap.send.assert_any_call(b'A001 IDLE\r\n')
+        imap.send.assert_any_call(b'DONE\r\n')
+
+    def test_idle_cycle_rejected(self):
+        imap = make_idle_imap([b'A001 BAD unknown command\r\n'])
+        with self.assertRaises(Exception):
+            self.connection._idle_cycle(imap, 0, lambda *args: None)
+
+
+class TestUIDCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'checkpoints.json')
+        self.store = CheckpointStore(self.path)
+        self.connection = IMAPConnection('imap.example.com', 993, 'user@example.com', 'secret',
+                                         checkpoint_store=self.store)
+        self.connection.imap = MagicMock()
+        self.connection.imap.select.return_value = ('OK', [b'10'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _selected(self, uidvalidity, uidnext):
+        responses = {'UIDVALIDITY': [str(uidvalidity).encode()], 'UIDNEXT': [str(uidnext).encode()]}
+        self.connection.imap.response.side_effect = lambda code: (code, responses.get(code, [None]))
+
+    def test_first_run_starts_at_uidnext(self):
+        self._selected(7, 120)
+        self.assertEqual(self.connection.fetch_new_uids(), [])
+        self.assertEqual(self.store.get(self.connection.checkpoint_key()), {'uidvalidity': 7, 'last_uid': 119})
+        self.connection.imap.uid.assert_not_called()
+
+    def test_fetches_only_uids_after_checkpoint(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self._selected(7, 123)
+        self.connection.imap.uid.return_value = ('OK', [b'8 (UID 120)', b'9 (UID 122)'])
+
+        self.assertEqual(self.connection.fetch_new_uids(), [120, 122])
+        self.connection.imap.uid.assert_called_once_with('FETCH', '120:*', '(UID)')
+
+    def test_no_fetch_when_uidnext_unchanged(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self._selected(7, 120)
+        self.assertEqual(self.connection.fetch_new_uids(), [])
+        self.connection.imap.uid.assert_not_called()
+
+    def test_star_range_returns_old_message_only(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self._selected(7, None)
+        self.connection.imap.uid.return_value = ('OK', [b'8 (UID 119)'])
+        self.assertEqual(self.connection.fetch_new_uids(), [])
+
+    def test_uidvalidity_change_resets_checkpoint(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self._selected(8, 5)
+        self.assertEqual(self.connection.fetch_new_uids(), [])
+        self.assertEqual(self.store.get(self.connection.checkpoint_key())['last_uid'], 4)
+
+    def test_status_fast_path_skips_select(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self.connection.capabilities = {'IMAP4REV1', 'UNSELECT'}
+        self.connection.imap.status.return_value = ('OK', [b'"INBOX" (UIDNEXT 120 MESSAGES 10 UNSEEN 0 UIDVALIDITY 7)'])
+
+        self.assertEqual(self.connection.fetch_new_uids(), [])
+        self.connection.imap.select.assert_not_called()
+        self.connection.imap.status.assert_called_once_with('INBOX', '(UIDNEXT MESSAGES UNSEEN UIDVALIDITY)')
+        self.assertEqual(self.connection.mailbox_status['INBOX']['MESSAGES'], 10)
+
+    def test_status_change_unselects_then_selects(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self.connection.capabilities = {'IMAP4REV1', 'UNSELECT', 'CONDSTORE'}
+        self.connection.selected_mailbox = 'INBOX'
+        self.connection.imap.status.return_value = ('OK', [b'INBOX (UIDNEXT 121 UIDVALIDITY 7)'])
+        self._selected(7, 121)
+        self.connection.imap.uid.return_value = ('OK', [b'11 (UID 120)'])
+
+        self.assertEqual(self.connection.fetch_new_uids(), [120])
+        self.connection.imap.unselect.assert_called_once()
+        self.assertIn('HIGHESTMODSEQ', self.connection.imap.status.call_args.args[1])
+        self.connection.imap.select.assert_called_once_with('INBOX')
+        self.assertEqual(self.connection.selected_mailbox, 'INBOX')
+
+    def test_qresync_select_returns_new_uids_in_one_round_trip(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119, highestmodseq=500)
+        self.connection.qresync_enabled = True
+        self.connection.capabilities = {'IMAP4REV1', 'QRESYNC', 'CONDSTORE'}
+        responses = {'UIDVALIDITY': [b'7'], 'UIDNEXT': [b'122'], 'HIGHESTMODSEQ': [b'520'],
+                     'VANISHED': [b'(EARLIER) 100:105'],
+                     'FETCH': [b'9 (UID 90 FLAGS (\\Seen) MODSEQ (510))', b'11 (UID 120 MODSEQ (515))',
+                               b'12 (UID 121 MODSEQ (520))']}
+        self.connection.imap.response.side_effect = lambda code: (code, responses.get(code, [None]))
+
+        self.assertEqual(self.connection.fetch_new_uids(), [120, 121])
+        self.connection.imap.select.assert_called_once_with('INBOX (QRESYNC (7 500))')
+        self.connection.imap.uid.assert_not_called()
+
+        # O HIGHESTMODSEQ só avança após o processamento do ciclo
+        self.assertEqual(self.store.get(self.connection.checkpoint_key())['highestmodseq'], 500)
+        self.connection.commit_sync_state()
+        self.assertEqual(self.store.get(self.connection.checkpoint_key())['highestmodseq'], 520)
+
+    def test_condstore_listing_uses_changedsince(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119, highestmodseq=500)
+        self.connection.capabilities = {'IMAP4REV1', 'CONDSTORE'}
+        self._selected(7, 121)
+        self.connection.imap.uid.return_value = ('OK', [b'11 (UID 120 MODSEQ (515))'])
+
+        self.assertEqual(self.connection.fetch_new_uids(), [120])
+        self.connection.imap.select.assert_called_once_with('INBOX')
+        self.connection.imap.uid.assert_called_once_with('FETCH', '120:*', '(UID)', '(CHANGEDSINCE 500)')
+
+    def test_checkpoint_survives_restart(self):
+        self.store.update(self.connection.checkpoint_key(), uidvalidity=7, last_uid=119)
+        self.connection.commit_uid(125)
+        reloaded = CheckpointStore(self.path)
+        self.assertEqual(reloaded.get(self.connection.checkpoint_key()), {'uidvalidity': 7, 'last_uid': 125})
+
+
+class TestEmailHandlerIdle(unittest.TestCase):
+    def test_pending_accounts_are_drained(self):
+        handler = EmailHandler(MagicMock())
+        handler._on_mailbox_event('a@example.com', 3)
+        handler._on_mailbox_event('b@example.com', None)
+
+        self.assertEqual(handler.wait_for_new_mail(0), {'a@example.com', 'b@example.com'})
+        self.assertEqual(handler.wait_for_new_mail(0), set())
+
+    def test_polling_accounts_exclude_idle(self):
+        handler = EmailHandler(MagicMock())
+        idle = IMAPConnection('s', 993, 'idle@example.com', 'x')
+        idle.is_idling = lambda: True
+        polling = IMAPConnection('s', 993, 'poll@example.com', 'x')
+        handler.connections = {'idle@example.com': idle, 'poll@example.com': polling}
+
+        self.assertEqual(handler.get_polling_accounts(), ['poll@example.com'])
+
+
+class TestBatchedFetch(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.handler = EmailHandler(MagicMock(), checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')))
+        self.connection = IMAPConnection('imap.example.com', 993, 'user@example.com', 'x',
+                                         checkpoint_store=self.handler.checkpoint_store)
+        self.connection.imap = MagicMock()
+        self.handler.connections = {'user@example.com': self.connection}
+
+    def test_two_phase_fetch_and_single_store_per_chunk(self):
+        self.connection.fetch_new_uids = lambda **kwargs: [101, 102, 105]
+        headers = b'From: a@example.com\r\nSubject: Oi\r\n\r\n'
+        structure = (b'BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 5 1)'
+                     b'("APPLICATION" "PDF" ("NAME" "r.pdf") NIL NIL "BASE64" 4000000) "MIXED")')
+        phase1 = []
+        for seq, uid in ((1, 101), (2, 105)):
+            phase1.append((b'%d (UID %d RFC822.SIZE 4000500 ' % (seq, uid) + structure +
+                           b' BODY[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID)] {%d}' % len(headers), headers))
+            phase1.append(b')')
+        self.connection.imap.uid.side_effect = [
+            ('OK', phase1),
+            ('OK', [(b'1 (UID 101 BODY[1]<0> {5}', b'corpo'), b')',
+                    (b'2 (UID 105 BODY[1]<0> {5}', b'outro'), b')']),
+            ('OK', [b'1 (FLAGS (\\Seen))']),
+        ]
+
+        emails = self.handler.check_new_emails()
+
+        self.assertEqual([e['uid'] for e in emails], [101, 105])
+        self.assertEqual(emails[0]['subject'], 'Oi')
+        self.assertEqual(emails[0]['body'], 'corpo')
+        self.assertEqual(emails[1]['body'], 'outro')
+        calls = self.connection.imap.uid.call_args_list
+        self.assertEqual(calls[0].args[:2], ('FETCH', '101:102,105'))
+        self.assertIn('BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID)]', calls[0].args[2])
+        self.assertEqual(calls[1].args, ('FETCH', '101,105', '(UID BODY.PEEK[1]<0.8192>)'))
+        self.assertEqual(calls[2].args, ('STORE', '101,105', '+FLAGS', '(\\Seen)'))
+        self.assertEqual(self.handler.checkpoint_store.get(self.connection.checkpoint_key())['last_uid'], 105)
+
+
+class TestConcurrentPolling(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = CheckpointStore(os.path.join(tmpdir.name, 'c.json'))
+        self.handler = EmailHandler(MagicMock(), checkpoint_store=self.store, max_workers=4, poll_timeout=0.2)
+        self.addCleanup(self.handler._executor.shutdown)
+
+    def _account(self, username):
+        connection = IMAPConnection('s', 993, username, 'x', checkpoint_store=self.store)
+        connection.imap = MagicMock()
+        self.handler.connections[username] = connection
+        return connection
+
+    def test_slow_account_does_not_block_others(self):
+        release = threading.Event()
+        self._account('fast@example.com')
+        self._account('slow@example.com')
+
+        def check(username, connection, new_emails, deadline=None):
+            if username == 'slow@example.com':
+                release.wait(5)
+            new_emails.append({'username': username})
+
+        self.handler._check_account = check
+        emails = self.handler.check_new_emails()
+
+        self.assertEqual(emails, [{'username': 'fast@example.com'}])
+        metrics = self.handler.get_poll_metrics()
+        self.assertEqual(metrics['slow@example.com']['last_status'], 'timeout')
+        self.assertEqual(metrics['slow@example.com']['timeouts'], 1)
+        self.assertEqual(metrics['fast@example.com']['last_status'], 'ok')
+
+        # O resultado atrasado é aproveitado no ciclo seguinte
+        release.set()
+        self.handler._inflight['slow@example.com'].result(timeout=5)
+        emails = self.handler.check_new_emails(usernames={'slow@example.com'})
+        self.assertEqual(emails, [{'username': 'slow@example.com'}, {'username': 'slow@example.com'}])
+
+    def test_error_triggers_reconnect_of_that_account(self):
+        connection = self._account('broken@example.com')
+        connection.connect = MagicMock(return_value=True)
+
+        def check(username, connection, new_emails, deadline=None):
+            new_emails.append({'username': username})
+            raise OSError('connection reset')
+
+        self.handler._check_account = check
+        emails = self.handler.check_new_emails()
+
+        # Alertas obtidos antes da falha não são perdidos
+        self.assertEqual(emails, [{'username': 'broken@example.com'}])
+        connection.connect.assert_called_once()
+        self.assertEqual(self.handler.get_poll_metrics()['broken@example.com']['errors'], 1)
+
+
+class TestCommandTimeouts(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = CheckpointStore(os.path.join(tmpdir.name, 'c.json'))
+        self.connection = IMAPConnection('imap.example.com', 993, 'user@example.com', 'x',
+                                         checkpoint_store=self.store, command_timeouts={'select': 3.0})
+        self.connection.imap = MagicMock()
+
+    def test_command_timeout_is_capped_by_deadline(self):
+        self.connection.imap.select.return_value = ('NO', [])
+        with self.assertRaises(Exception):
+            self.connection.fetch_new_uids()
+        self.connection.imap.sock.settimeout.assert_called_with(3.0)
+
+        deadline = Deadline(1.0)
+        with self.assertRaises(Exception):
+            self.connection.fetch_new_uids(deadline=deadline)
+        applied = self.connection.imap.sock.settimeout.call_args.args[0]
+        self.assertLessEqual(applied, 1.0)
+
+    def test_socket_timeout_marks_session_and_counts(self):
+        self.connection.imap.select.side_effect = socket.timeout('timed out')
+        with self.assertRaises(IMAPCommandTimeout):
+            self.connection.fetch_new_uids()
+        self.assertEqual(self.connection.connection_status, 'timeout')
+        self.assertEqual(self.connection.timeout_counts, {'select': 1})
+
+    def test_expired_deadline_skips_command(self):
+        deadline = Deadline(0)
+        with self.assertRaises(DeadlineExceeded):
+            self.connection.fetch_new_uids(deadline=deadline)
+        self.connection.imap.select.assert_not_called()
+
+    def test_timeout_reconnects_account_without_logout(self):
+        handler = EmailHandler(MagicMock(), checkpoint_store=self.store)
+        handler.connections = {'user@example.com': self.connection}
+        stale = self.connection.imap
+        stale.select.side_effect = socket.timeout('timed out')
+        fresh = MagicMock()
+        self.connection._open_imap = MagicMock(return_value=fresh)
+
+        self.assertEqual(handler.check_new_emails(), [])
+
+        stale.shutdown.assert_called_once()
+        stale.logout.assert_not_called()
+        self.assertIs(self.connection.imap, fresh)
+        self.assertEqual(self.connection.connection_status, 'connected')
+        metrics = handler.get_poll_metrics()['user@example.com']
+        self.assertEqual(metrics['last_status'], 'timeout')
+        self.assertEqual(metrics['timeouts'], 1)
+        self.assertEqual(metrics['command_timeouts'], {'select': 1})
+
+    def test_deferred_reconnect_does_not_reuse_desynchronised_session(self):
+        handler = EmailHandler(MagicMock(), checkpoint_store=self.store)
+        handler.connections = {'user@example.com': self.connection}
+        stale = self.connection.imap
+        stale.select.side_effect = socket.timeout('timed out')
+        self.connection.reconnect_state.next_attempt_at = float('inf')
+        self.connection._open_imap = MagicMock()
+
+        handler.check_new_emails()
+        handler.check_new_emails()
+
+        stale.shutdown.assert_called_once()
+        self.assertIsNone(self.connection.imap)
+        self.assertEqual(stale.select.call_count, 1)
+        self.connection._open_imap.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
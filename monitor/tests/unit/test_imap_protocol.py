@@ -0,0 +1,114 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import unittest
+from app.core.imap_protocol import (
+    build_message_set, chunked, decode_partial_body, find_text_part, parse_fetch_response, parse_status_response
+)
+
+
+class TestMessageSet(unittest.TestCase):
+    def test_compacts_ranges(self):
+        self.assertEqual(build_message_set([9, 1, 5, 7, 8]), '1,5,7:9')
+        self.assertEqual(build_message_set([3]), '3')
+        self.assertEqual(build_message_set([10, 11, 12, 12]), '10:12')
+
+    def test_empty_set_is_rejected(self):
+        with self.assertRaises(ValueError):
+            build_message_set([])
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked([1, 2, 3, 4, 5], 2)), [[1, 2], [3, 4], [5]])
+
+
+class TestParseFetchResponse(unittest.TestCase):
+    def test_splits_interleaved_literals(self):
+        data = [
+            (b'1 (UID 101 RFC822 {5}', b'hello'),
+            b')',
+            (b'2 (UID 105 RFC822 {5}', b'world'),
+            b' FLAGS (\\Seen))',
+        ]
+        records = parse_fetch_response(data)
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['UID'], 101)
+        self.assertEqual(records[0]['RFC822'], b'hello')
+        self.assertEqual(records[1]['UID'], 105)
+        self.assertEqual(records[1]['RFC822'], b'world')
+        self.assertEqual(records[1]['FLAGS'], ['\\Seen'])
+
+    def test_multiple_literals_per_message(self):
+        data = [
+            (b'3 (UID 7 RFC822.SIZE 2048 BODY[HEADER.FIELDS (FROM SUBJECT)] {12}', b'Subject: x\r\n'),
+            (b' BODY[1]<0> {4}', b'text'),
+            b')',
+        ]
+        record = parse_fetch_response(data)[0]
+
+        self.assertEqual(record['RFC822.SIZE'], 2048)
+        self.assertEqual(record['BODY[HEADER.FIELDS (FROM SUBJECT)]'], b'Subject: x\r\n')
+        self.assertEqual(record['BODY[1]<0>'], b'text')
+
+    def test_uid_only_response(self):
+        records = parse_fetch_response([b'8 (UID 120)', b'9 (UID 122 FLAGS ())'])
+        self.assertEqual([r['UID'] for r in records], [120, 122])
+
+    def test_quoted_strings_and_nil(self):
+        record = parse_fetch_response([b'1 (UID 4 ENVELOPE ("a \\"b\\"" NIL))'])[0]
+        self.assertEqual(record['ENVELOPE'], [b'a "b"', None])
+
+    def test_empty_response(self):
+        self.assertEqual(parse_fetch_response([None]), [])
+
+
+
+class TestParseStatusResponse(unittest.TestCase):
+    def test_quoted_and_atom_mailbox_names(self):
+        self.assertEqual(parse_status_response([b'"INBOX" (MESSAGES 3 UIDNEXT 9 UNSEEN 0)']),
+                         {'MESSAGES': 3, 'UIDNEXT': 9, 'UNSEEN': 0})
+        self.assertEqual(parse_status_response([b'INBOX (UIDVALIDITY 7 HIGHESTMODSEQ 9001)']),
+                         {'UIDVALIDITY': 7, 'HIGHESTMODSEQ': 9001})
+
+
+class TestBodyStructure(unittest.TestCase):
+    def _structure(self, raw):
+        return parse_fetch_response([b'1 (UID 1 BODYSTRUCTURE ' + raw + b')'])[0]['BODYSTRUCTURE']
+
+    def test_single_part(self):
+        structure = self._structure(b'("TEXT" "PLAIN" ("CHARSET" "ISO-8859-1") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL)')
+        self.assertEqual(find_text_part(structure), {
+            'part': '1', 'subtype': 'plain', 'encoding': 'quoted-printable', 'charset': 'iso-8859-1'
+        })
+
+    def test_nested_alternative_prefers_plain(self):
+        structure = self._structure(
+            b'((("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "BASE64" 100 2)'
+            b'("TEXT" "HTML" ("CHARSET" "UTF-8") NIL NIL "BASE64" 300 5) "ALTERNATIVE")'
+            b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 5000000 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL) "MIXED")'
+        )
+        self.assertEqual(find_text_part(structure)['part'], '1.1')
+
+    def test_html_fallback_and_attachments_skipped(self):
+        structure = self._structure(
+            b'(("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 10 1 NIL ("ATTACHMENT" ("FILENAME" "log.txt")) NIL)'
+            b'("TEXT" "HTML" ("CHARSET" "UTF-8") NIL NIL "7BIT" 30 1) "MIXED")'
+        )
+        self.assertEqual(find_text_part(structure)['part'], '2')
+        self.assertIsNone(find_text_part(self._structure(b'("IMAGE" "PNG" NIL NIL NIL "BASE64" 10)')))
+
+
+class TestDecodePartialBody(unittest.TestCase):
+    def test_truncated_base64(self):
+        self.assertEqual(decode_partial_body(b'T2zDoSBtdW5k\r\nbw', 'base64', 'utf-8'), 'Olá mund')
+
+    def test_truncated_quoted_printable(self):
+        self.assertEqual(decode_partial_body(b'Ol=E1 mundo=0', 'quoted-printable', 'iso-8859-1'), 'Olá mundo')
+
+    def test_unknown_charset(self):
+        self.assertEqual(decode_partial_body(b'abc', '7bit', 'x-unknown'), 'abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import unittest
+from unittest.mock import MagicMock
+from pymongo.errors import OperationFailure
+from app.core.mongo_indexes import reconcile_indexes
+from app.core.user_model import USER_INDEXES, UserModel
+
+ID_INDEX = {'_id_': {'key': [('_id', 1)], 'v': 2}}
+# Índices como o MongoDB os descreve depois de criados a partir de USER_INDEXES
+CURRENT = dict(ID_INDEX, **{
+    'email_1': {'key': [('email', 1)], 'unique': True, 'v': 2},
+    'chat_id_1': {'key': [('chat_id', 1.0)], 'unique': True, 'v': 2},
+    'notification_rules.sender_1': {'key': [('notification_rules.sender', 1)], 'v': 2},
+    'active_chat_ids': {'key': [('is_active', 1), ('chat_id', 1)], 'partialFilterExpression': {'is_active': True}},
+    'central_server': {'key': [('is_central_server', 1)], 'partialFilterExpression': {'is_central_server': True}},
+})
+
+
+def created_names(collection):
+    return [model.document['name'] for call in collection.create_indexes.call_args_list for model in call.args[0]]
+
+
+class TestReconcileIndexes(unittest.TestCase):
+    def setUp(self):
+        self.collection = MagicMock()
+        self.collection.name = 'users'
+
+    def test_up_to_date_collection_is_left_alone(self):
+        self.collection.index_information.return_value = CURRENT
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.assertEqual(len(result['unchanged']), 5)
+        self.collection.create_indexes.assert_not_called()
+        self.collection.drop_index.assert_not_called()
+        self.collection.drop_indexes.assert_not_called()
+
+    def test_missing_indexes_are_created_in_one_command(self):
+        self.collection.index_information.return_value = ID_INDEX
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.assertEqual(self.collection.create_indexes.call_count, 1)
+        self.assertEqual(created_names(self.collection), [spec.name for spec in USER_INDEXES])
+        self.assertFalse(any('background' in model.document for model in self.collection.create_indexes.call_args.args[0]))
+        self.assertEqual(result['created'], [spec.name for spec in USER_INDEXES])
+
+    def test_divergent_index_is_rebuilt_and_unknown_ones_are_kept(self):
+        existing = dict(CURRENT, legacy={'key': [('name', 1)]})
+        existing['email_1'] = {'key': [('email', 1)]}
+        del existing['central_server']
+        self.collection.index_information.return_value = existing
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.collection.drop_index.assert_called_once_with('email_1')
+        self.assertEqual(created_names(self.collection), ['email_1', 'central_server'])
+        self.assertEqual((result['rebuilt'], result['created']), (['email_1'], ['central_server']))
+
+        reconcile_indexes(self.collection, USER_INDEXES, drop_unknown=True)
+        self.collection.drop_index.assert_called_with('legacy')
+
+    def test_unique_index_with_duplicates_is_kept(self):
+        existing = dict(CURRENT)
+        existing['email_1'] = {'key': [('email', 1)]}
+        self.collection.index_information.return_value = existing
+        self.collection.aggregate.return_value = iter([{'_id': {'email': 'a@weg.net'}, 'count': 2}])
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.collection.drop_index.assert_not_called()
+        self.collection.create_indexes.assert_not_called()
+        self.assertEqual(result['failed'], ['email_1'])
+
+    def test_failed_rebuild_restores_the_previous_index(self):
+        existing = dict(CURRENT)
+        partial = {'chat_id': {'$exists': True}}
+        existing['chat_id_1'] = {'key': [('chat_id', 1)], 'unique': True, 'partialFilterExpression': partial, 'v': 2}
+        self.collection.index_information.return_value = existing
+        self.collection.aggregate.return_value = iter([])
+        self.collection.create_indexes.side_effect = [OperationFailure('E11000 duplicate key error', code=11000), None]
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.collection.drop_index.assert_called_once_with('chat_id_1')
+        restored = self.collection.create_indexes.call_args.args[0][0].document
+        self.assertEqual(restored, {'key': {'chat_id': 1}, 'name': 'chat_id_1', 'unique': True,
+                                    'partialFilterExpression': partial})
+        self.assertEqual((result['failed'], result['rebuilt']), (['chat_id_1'], []))
+
+    def test_failed_index_does_not_block_the_others(self):
+        self.collection.index_information.return_value = ID_INDEX
+        duplicate = OperationFailure('E11000 duplicate key error', code=11000)
+        self.collection.create_indexes.side_effect = [duplicate, None, duplicate] + [None] * 3
+
+        result = reconcile_indexes(self.collection, USER_INDEXES)
+
+        self.assertEqual(result['failed'], ['chat_id_1'])
+        self.assertEqual(len(result['created']), 4)
+
+
+class TestUserModelIndexes(unittest.TestCase):
+    def test_startup_does_not_drop_indexes(self):
+        client = MagicMock()
+        collection = client.wegnots['users']
+        collection.index_information.return_value = CURRENT
+        collection.watch.side_effect = OperationFailure('not supported', code=40573)
+        collection.find.return_value = []
+
+        model = UserModel(client)
+        self.addCleanup(model.close)
+
+        collection.drop_indexes.assert_not_called()
+        collection.create_indexes.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
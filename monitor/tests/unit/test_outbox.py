@@ -0,0 +1,112 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from app.core.email_handler import EmailHandler
+from app.core.outbox import Outbox
+from app.core.uid_checkpoint import CheckpointStore
+
+
+def alert(key):
+    return {'email_key': key, 'username': 'a@example.com', 'subject': 'Oi', 'from': 'x@example.com', 'body': 'corpo'}
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'outbox.jsonl')
+
+    def open_outbox(self, **kwargs):
+        outbox = Outbox(self.path, **kwargs)
+        self.addCleanup(outbox.close)
+        return outbox
+
+    def test_undelivered_alerts_survive_restart(self):
+        outbox = self.open_outbox()
+        outbox.add_many([alert('s:a:1'), alert('s:a:2')])
+        outbox.ack('s:a:1')
+        outbox.close()
+
+        reloaded = self.open_outbox()
+        self.assertEqual([a['email_key'] for a in reloaded.pending()], ['s:a:2'])
+
+    def test_add_is_durable_before_returning(self):
+        outbox = self.open_outbox()
+        outbox.add_many([alert('s:a:1')])
+        # Sem close: o registro já precisa estar no arquivo
+        with open(self.path, encoding='utf-8') as f:
+            self.assertIn('s:a:1', f.read())
+
+    def test_truncated_last_record_is_ignored(self):
+        outbox = self.open_outbox()
+        outbox.add_many([alert('s:a:1')])
+        outbox.close()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"op": "add", "key": "s:a:2", "ale')
+
+        self.assertEqual([a['email_key'] for a in self.open_outbox().pending()], ['s:a:1'])
+
+    def test_concurrent_producers_share_commits(self):
+        outbox = self.open_outbox(commit_interval=0.02)
+        threads = [threading.Thread(target=outbox.add_many, args=([alert(f"s:a:{i}")],)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        metrics = outbox.metrics()
+        self.assertEqual((metrics['added'], metrics['pending']), (20, 20))
+        self.assertLess(metrics['commits'], 20)
+
+    def test_compaction_drops_delivered_records(self):
+        outbox = self.open_outbox(commit_interval=0, compact_threshold=2)
+        outbox.add_many([alert('s:a:1'), alert('s:a:2'), alert('s:a:3')])
+        outbox.ack('s:a:1')
+        outbox.ack('s:a:2')
+        outbox.add_many([alert('s:a:4')])
+
+        with open(self.path, encoding='utf-8') as f:
+            content = f.read()
+        self.assertNotIn('s:a:1', content)
+        self.assertNotIn('"done"', content)
+
+
+class TestHandlerOutbox(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.outbox = Outbox(os.path.join(tmpdir.name, 'outbox.jsonl'))
+        self.addCleanup(self.outbox.close)
+        self.telegram = MagicMock()
+        self.handler = EmailHandler(self.telegram, checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')),
+                                    outbox=self.outbox)
+
+    def test_alert_is_in_outbox_before_store(self):
+        connection = MagicMock(server='imap.example.com', telegram_chat_id=None, telegram_token=None,
+                               notification_destinations={})
+        connection.fetch_new_uids.return_value = [7]
+        connection.fetch_previews.return_value = {7: {'subject': 'Oi', 'from': 'x@example.com', 'body': 'corpo',
+                                                      'date': '', 'message_id': '', 'size': 10}}
+        seen_pending = []
+        connection.mark_seen.side_effect = lambda uids, deadline: seen_pending.extend(self.outbox.pending())
+
+        self.handler._check_account('a@example.com', connection, [])
+
+        self.assertEqual([a['uid'] for a in seen_pending], [7])
+
+    def test_replay_delivers_and_acks_pending(self):
+        self.outbox.add_many([alert('s:a:1'), alert('s:a:2')])
+        self.telegram.send_alert.side_effect = [True, False]
+
+        self.assertEqual(self.handler.replay_outbox(), 2)
+
+        self.assertEqual([a['email_key'] for a in self.outbox.pending()], ['s:a:2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import unittest
+from app.core.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(clock=self.clock)
+
+    def test_private_chat_is_limited_to_one_per_second(self):
+        waits = [self.limiter.reserve('T', '42') for _ in range(3)]
+        self.assertEqual(waits, [0.0, 1.0, 2.0])
+
+    def test_distinct_chats_share_token_budget(self):
+        waits = [self.limiter.reserve('T', str(chat)) for chat in range(31)]
+        self.assertEqual(waits[:30], [0.0] * 30)
+        self.assertAlmostEqual(waits[30], 1 / 30)
+
+    def test_group_is_limited_per_minute_after_burst(self):
+        waits = []
+        for _ in range(30):
+            waits.append(self.limiter.reserve('T', '-100'))
+            self.clock.now += 1
+        # Rajada de 20 mais a reposição de 20/min durante os envios a 1 msg/s
+        self.assertEqual(waits[:29], [0.0] * 29)
+        self.assertGreater(waits[29], 0.0)
+
+    def test_tokens_are_independent(self):
+        self.limiter.reserve('A', '42')
+        self.assertEqual(self.limiter.reserve('B', '42'), 0.0)
+
+    def test_retry_after_blocks_chat(self):
+        self.limiter.block('T', '42', 10)
+        self.assertEqual(self.limiter.blocked_for('T', '42'), 10)
+        self.assertEqual(self.limiter.reserve('T', '42'), 10)
+        self.assertEqual(self.limiter.reserve('T', '7'), 0.0)
+
+        self.clock.now += 12
+        self.assertEqual(self.limiter.blocked_for('T', '42'), 0.0)
+        self.assertEqual(self.limiter.metrics()['retry_after'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
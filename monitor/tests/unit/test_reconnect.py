@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import imaplib
+import socket
+import unittest
+from unittest.mock import MagicMock, patch
+from app.core.email_handler import IMAPConnection, IMAPAuthError
+from app.core.reconnect import ReconnectPolicy, ReconnectState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReconnectState(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = ReconnectPolicy(attempts=4, delay=10, backoff_factor=2, max_delay=25, jitter=0,
+                                      breaker_cooldown=300, auth_failure_threshold=2)
+        self.state = ReconnectState(self.policy, name='conta', clock=self.clock)
+
+    def test_exponential_backoff_is_capped(self):
+        self.assertTrue(self.state.can_attempt())
+        self.assertEqual([self.state.record_failure() for _ in range(3)], [10, 20, 25])
+        self.assertEqual(self.state.state, ReconnectState.BACKOFF)
+        self.assertFalse(self.state.can_attempt())
+
+        self.clock.now += 25
+        self.assertTrue(self.state.can_attempt())
+
+    def test_jitter_stays_within_bounds(self):
+        policy = ReconnectPolicy(delay=10, backoff_factor=1, jitter=0.2)
+        delays = [policy.delay_for(1) for _ in range(50)]
+        self.assertTrue(all(8 <= delay <= 12 for delay in delays))
+
+    def test_breaker_opens_after_repeated_failures(self):
+        for _ in range(3):
+            self.state.record_failure()
+        self.assertEqual(self.state.record_failure(), 300)
+        self.assertEqual(self.state.state, ReconnectState.OPEN)
+        self.assertEqual(self.state.trips, 1)
+
+        # Tentativa após o cooldown que falha mantém o circuito aberto
+        self.clock.now += 300
+        self.assertEqual(self.state.record_failure(), 300)
+        self.assertEqual(self.state.trips, 1)
+
+    def test_login_rejections_open_breaker_early(self):
+        self.state.record_failure(auth_error=True)
+        self.assertEqual(self.state.state, ReconnectState.BACKOFF)
+        self.state.record_failure(auth_error=True)
+        self.assertEqual(self.state.state, ReconnectState.OPEN)
+
+    def test_success_resets_state(self):
+        for _ in range(4):
+            self.state.record_failure()
+        self.state.record_success()
+        self.assertEqual(self.state.snapshot(), {'state': 'closed', 'failures': 0, 'auth_failures': 0,
+                                                 'trips': 1, 'retry_in': 0.0})
+        self.assertTrue(self.state.can_attempt())
+
+
+class TestConnectionReconnect(unittest.TestCase):
+    def setUp(self):
+        policy = ReconnectPolicy(attempts=5, delay=30, jitter=0, auth_failure_threshold=2)
+        self.connection = IMAPConnection('imap.example.com', 993, 'user@example.com', 'wrong',
+                                         reconnect_policy=policy)
+
+    @patch('app.core.email_handler.imaplib.IMAP4_SSL')
+    def test_rejected_login_is_not_retried_immediately(self, imap_ssl):
+        imap_ssl.return_value.login.side_effect = imaplib.IMAP4.error('AUTHENTICATIONFAILED')
+
+        self.assertFalse(self.connection.connect())
+        self.assertFalse(self.connection.reconnect())
+        self.assertEqual(imap_ssl.call_count, 1)
+        self.assertEqual(self.connection.reconnect_state.auth_failures, 1)
+
+    def test_open_imap_wraps_login_rejection(self):
+        with patch('app.core.email_handler.imaplib.IMAP4_SSL') as imap_ssl:
+            imap_ssl.return_value.login.side_effect = imaplib.IMAP4.error('invalid credentials')
+            with self.assertRaises(IMAPAuthError):
+                self.connection._open_imap()
+            imap_ssl.return_value.shutdown.assert_called_once()
+
+    def test_open_imap_closes_socket_when_login_fails(self):
+        for error in (socket.timeout('timed out'), imaplib.IMAP4.abort('connection reset')):
+            with patch('app.core.email_handler.imaplib.IMAP4_SSL') as imap_ssl:
+                imap_ssl.return_value.login.side_effect = error
+                with self.assertRaises(Exception) as raised:
+                    self.connection._open_imap()
+                self.assertNotIsInstance(raised.exception, IMAPAuthError)
+                imap_ssl.return_value.shutdown.assert_called_once()
+
+    def test_reconnect_after_backoff(self):
+        self.connection._open_imap = MagicMock(side_effect=[OSError('unreachable'), MagicMock()])
+        self.assertFalse(self.connection.connect())
+
+        self.connection.reconnect_state.next_attempt_at = 0.0
+        self.assertTrue(self.connection.reconnect())
+        self.assertEqual(self.connection.reconnect_state.state, ReconnectState.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import itertools
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from app.core.deadline import Deadline
+from app.core.delivery_queue import DeliveryJob, Retry
+from app.core.email_handler import EmailHandler
+from app.core.formatting import to_plain_text
+from app.core.outbox import Outbox
+from app.core.rate_limiter import RateLimiter
+from app.core.retry_policy import MARKUP, NETWORK, PERMANENT, RETRY_AFTER, TRANSIENT, RetryPolicy
+from app.core.telegram_client import SendResult, TelegramClient
+from app.core.uid_checkpoint import CheckpointStore
+
+PARSE_ERROR = "Bad Request: can't parse entities: Character '.' is reserved and must be escaped"
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_classification(self):
+        classify = RetryPolicy.classify
+        self.assertEqual(classify(429, 'Too Many Requests', 3), RETRY_AFTER)
+        self.assertEqual(classify(502, 'Bad Gateway'), TRANSIENT)
+        self.assertEqual(classify(None, 'timeout'), NETWORK)
+        self.assertEqual(classify(400, PARSE_ERROR), MARKUP)
+        self.assertEqual(classify(403, 'Forbidden: bot was blocked by the user'), PERMANENT)
+        self.assertEqual(classify(400, 'Bad Request: chat not found'), PERMANENT)
+
+    def test_backoff_grows_with_jitter_and_cap(self):
+        policy = RetryPolicy(base_delay=1, backoff_factor=2, max_delay=10, jitter=0.2)
+        self.assertTrue(0.8 <= policy.backoff(1) <= 1.2)
+        self.assertTrue(3.2 <= policy.backoff(3) <= 4.8)
+        self.assertTrue(8 <= policy.backoff(10) <= 12)
+
+    def test_decisions_and_counters(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertEqual(policy.decide(SendResult(False, 429, retry_after=7), 9).delay, 7)
+        self.assertTrue(policy.decide(SendResult(False, 500), 2).retry)
+        self.assertFalse(policy.decide(SendResult(False, 500), 3).retry)
+        self.assertFalse(policy.decide(SendResult(False, 403, description='Forbidden'), 1).retry)
+        self.assertTrue(policy.decide(SendResult(False, 400, description=PARSE_ERROR), 1).plain_text)
+        self.assertFalse(policy.decide(SendResult(False, 400, description=PARSE_ERROR), 2, plain_text=True).retry)
+
+        metrics = policy.metrics()
+        self.assertEqual((metrics[RETRY_AFTER], metrics[TRANSIENT], metrics[PERMANENT], metrics[MARKUP]), (1, 2, 1, 2))
+        self.assertEqual((metrics['retried'], metrics['gave_up']), (3, 3))
+
+    def test_plain_text_removes_markup(self):
+        self.assertEqual(to_plain_text("*Assunto:* a\\.b\n```\nc:\\\\x```"), "Assunto: a.b\n\nc:\\x")
+
+
+class TestSendTextMessage(unittest.TestCase):
+    def setUp(self):
+        self.client = TelegramClient.__new__(TelegramClient)
+        self.client.retry_policy = RetryPolicy()
+        self.client.resolve_destination = lambda token, chat_id: ('T', '1')
+        self.client.send_message_once = MagicMock()
+
+    @patch('app.core.telegram_client.time.sleep')
+    def test_permanent_failure_is_not_retried(self, sleep):
+        self.client.send_message_once.return_value = SendResult(False, 403, description='Forbidden: bot was blocked')
+
+        self.assertFalse(self.client.send_text_message('oi'))
+
+        self.assertEqual(self.client.send_message_once.call_count, 1)
+        sleep.assert_not_called()
+
+    @patch('app.core.telegram_client.time.sleep')
+    def test_markup_error_falls_back_to_plain_text(self, sleep):
+        self.client.send_message_once.side_effect = [SendResult(False, 400, description=PARSE_ERROR),
+                                                     SendResult(True, 200)]
+
+        self.assertTrue(self.client.send_text_message('*Oi* a\\.b', parse_mode='MarkdownV2'))
+
+        self.client.send_message_once.assert_called_with('Oi a.b', None, 'T', '1')
+        sleep.assert_not_called()
+
+
+    @patch('app.core.telegram_client.time.sleep')
+    def test_plain_text_fallback_on_last_attempt_is_sent(self, sleep):
+        self.client.retry_policy = RetryPolicy(max_attempts=2, jitter=0)
+        self.client.send_message_once.side_effect = [SendResult(False, 502), SendResult(False, 400, description=PARSE_ERROR),
+                                                     SendResult(True, 200)]
+
+        self.assertTrue(self.client.send_text_message('*Oi*', parse_mode='MarkdownV2'))
+
+        self.assertEqual(self.client.send_message_once.call_count, 3)
+        self.client.send_message_once.assert_called_with('Oi', None, 'T', '1')
+
+    @patch('app.core.telegram_client.time.sleep')
+    def test_wait_beyond_deadline_gives_up(self, sleep):
+        self.client.send_message_once.return_value = SendResult(False, 429, retry_after=30)
+
+        self.assertFalse(self.client.send_text_message('oi', deadline=Deadline(5)))
+
+        self.assertEqual(self.client.send_message_once.call_count, 1)
+        sleep.assert_not_called()
+
+
+class TestQueuedRetries(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.outbox = Outbox(os.path.join(tmpdir.name, 'outbox.jsonl'))
+        self.addCleanup(self.outbox.close)
+        self.telegram = MagicMock()
+        self.telegram.resolve_destination.side_effect = lambda token, chat_id: ('T', '1')
+        self.telegram.format_alert_parts.return_value = (['*Oi*'], 'MarkdownV2')
+        self.handler = EmailHandler(self.telegram, checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')),
+                                    outbox=self.outbox, rate_limiter=RateLimiter(clock=itertools.count().__next__))
+        self.email_data = {'email_key': 's:a:1', 'username': 'a@example.com', 'subject': 'Oi', 'from': 'x@example.com',
+                           'body': 'corpo', 'telegram_token': None, 'telegram_chat_id': None}
+        self.outbox.add_many([self.email_data])
+
+    def test_permanent_failure_releases_outbox(self):
+        self.telegram.send_message_once.return_value = SendResult(False, 403, description='Forbidden')
+
+        self.assertFalse(self.handler._deliver_job(DeliveryJob(self.email_data, attempts=1)))
+
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertEqual(self.handler.retry_policy.metrics()[PERMANENT], 1)
+
+    def test_markup_error_is_rescheduled_as_plain_text(self):
+        self.telegram.send_message_once.return_value = SendResult(False, 400, description=PARSE_ERROR)
+        job = DeliveryJob(self.email_data, attempts=1)
+
+        self.assertEqual(self.handler._deliver_job(job), Retry(0.0, 'MarkdownV2 inválido'))
+
+        self.assertEqual((job.context['messages'], job.context['parse_mode']), (['Oi'], None))
+
+    def test_transient_failure_keeps_alert_in_outbox(self):
+        self.telegram.send_message_once.return_value = SendResult(False, 503)
+
+        retry = self.handler._deliver_job(DeliveryJob(self.email_data, attempts=1))
+        self.assertTrue(1.5 <= retry.delay <= 2.5)
+        self.assertFalse(self.handler._deliver_job(DeliveryJob(self.email_data, attempts=5)))
+
+        self.assertEqual(len(self.outbox.pending()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import time
+import unittest
+from unittest.mock import MagicMock
+from pymongo.errors import OperationFailure
+from app.core.routing_index import RoutingIndex
+from app.core.user_model import UserModel
+
+CENTRAL = {'_id': 1, 'email': 'central@megasec.com.br', 'is_central_server': True, 'notification_rules': []}
+ANA = {'_id': 2, 'email': 'ana@cliente.com', 'notification_rules': [{'sender': 'zabbix@cliente.com'}]}
+BRUNO = {'_id': 3, 'email': 'bruno@cliente.com', 'notification_rules': [{'sender': '*@cliente.com'}]}
+NOT_SUPPORTED = OperationFailure('The $changeStream stage is only supported on replica sets', code=40573)
+
+
+class FakeStream:
+    """Change stream que entrega os eventos da lista e depois fica ocioso"""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.alive = True
+        self.resume_token = None
+
+    def try_next(self):
+        if self.events:
+            event = self.events.pop(0)
+            self.resume_token = {'_data': str(len(self.events))}
+            return event
+        time.sleep(0.01)
+        return None
+
+    def close(self):
+        self.alive = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestRoutingIndex(unittest.TestCase):
+    def setUp(self):
+        self.collection = MagicMock()
+        self.collection.find.return_value = [CENTRAL, ANA, BRUNO]
+        self.index = RoutingIndex(self.collection)
+        self.index.rebuild()
+
+    def ids(self, sender):
+        return [user['_id'] for user in self.index.lookup(sender)]
+
+    def test_exact_sender_domain_and_central(self):
+        self.assertEqual(self.ids('zabbix@cliente.com'), [2, 3, 1])
+        self.assertEqual(self.ids('ana@cliente.com'), [2, 3, 1])
+        self.assertEqual(self.ids('outro@cliente.com'), [3, 1])
+        # Mesma comparação exata da consulta ao MongoDB
+        self.assertEqual(self.ids('outro@CLIENTE.com'), [1])
+        self.assertEqual(self.ids('central@megasec.com.br'), [1])
+        self.assertEqual(self.ids('ninguem@example.com'), [1])
+        self.assertEqual(self.index.central_server()['email'], 'central@megasec.com.br')
+
+    def test_change_events_update_the_index(self):
+        carla = {'_id': 4, 'email': 'carla@x.com', 'notification_rules': [{'sender': '*@example.com'}]}
+        self.index.apply({'operationType': 'insert', 'fullDocument': carla, 'documentKey': {'_id': 4}})
+        self.index.apply({'operationType': 'update', 'documentKey': {'_id': 3},
+                          'fullDocument': dict(BRUNO, notification_rules=[])})
+        self.index.apply({'operationType': 'delete', 'documentKey': {'_id': 1}})
+
+        self.assertEqual(self.ids('a@example.com'), [4])
+        self.assertEqual(self.ids('outro@cliente.com'), [])
+        self.assertIsNone(self.index.central_server())
+
+        self.index.apply({'operationType': 'drop'})
+        self.assertEqual(self.ids('outro@cliente.com'), [3, 1])
+
+    def test_change_stream_keeps_index_fresh(self):
+        stream = FakeStream([{'operationType': 'delete', 'documentKey': {'_id': 2}}])
+        self.collection.watch.return_value = stream
+        self.index.start()
+        self.addCleanup(self.index.stop)
+
+        self.assertEqual(self.index.mode, 'change_stream')
+        self.assertTrue(wait_for(lambda: self.ids('zabbix@cliente.com') == [3, 1]))
+        self.assertEqual(self.index.stats['rebuilds'], 2)
+
+    def test_polling_fallback_without_change_streams(self):
+        self.collection.watch.side_effect = NOT_SUPPORTED
+        self.index.poll_interval = 0.01
+        self.index.start()
+        self.addCleanup(self.index.stop)
+        self.collection.find.return_value = [CENTRAL]
+
+        self.assertEqual(self.index.mode, 'polling')
+        self.assertTrue(wait_for(lambda: self.ids('zabbix@cliente.com') == [1]))
+
+
+class TestUserModelRouting(unittest.TestCase):
+    def setUp(self):
+        client = MagicMock()
+        self.collection = client.wegnots['users']
+        self.collection.watch.side_effect = NOT_SUPPORTED
+        self.collection.find.return_value = [CENTRAL, ANA]
+        self.model = UserModel(client, routing_poll_interval=60)
+        self.addCleanup(self.model.close)
+
+    def test_routing_is_answered_from_memory(self):
+        for _ in range(3):
+            self.assertEqual([user['_id'] for user in self.model.get_users_by_email('zabbix@cliente.com')], [2, 1])
+        self.assertEqual(self.model.get_central_server()['_id'], 1)
+
+        self.assertEqual(self.collection.find.call_count, 1)
+        self.collection.find_one.reset_mock()
+        self.model.get_central_server()
+        self.collection.find_one.assert_not_called()
+
+    def test_local_writes_refresh_the_index(self):
+        self.collection.find.return_value = [dict(ANA, notification_rules=[])]
+
+        self.model.update_notification_rules('chat-ana', [])
+
+        self.collection.find.assert_called_with({'chat_id': 'chat-ana'})
+        self.assertEqual([user['_id'] for user in self.model.get_users_by_email('zabbix@cliente.com')], [1])
+
+    def test_with_block_stops_the_index_thread(self):
+        client = MagicMock()
+        client.wegnots['users'].watch.side_effect = NOT_SUPPORTED
+        with UserModel(client, routing_poll_interval=60) as model:
+            thread = model.routing._thread
+            self.assertTrue(thread.is_alive())
+
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from app.core.email_handler import EmailHandler
+from app.core.uid_checkpoint import CheckpointStore
+from app.core.update_poller import UpdatePollError, UpdatePoller
+
+
+def response(updates, status_code=200):
+    return MagicMock(status_code=status_code, text='', json=MagicMock(return_value={'ok': True, 'result': updates}))
+
+
+def update(update_id, text='/status'):
+    return {'update_id': update_id, 'message': {'text': text, 'chat': {'id': 42}}}
+
+
+class TestUpdatePoller(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'offsets.json')
+        self.transport = MagicMock()
+        self.commands = {}
+
+    def make_poller(self, tokens=('111:SEGREDO',)):
+        def factory(token):
+            self.commands[token] = MagicMock()
+            return self.commands[token]
+
+        poller = UpdatePoller(tokens, offsets_path=self.path, commands_factory=factory, transport=self.transport)
+        self.addCleanup(poller.stop)
+        return poller
+
+    def test_long_poll_processes_batch_and_persists_offset(self):
+        self.transport.get.return_value = response([update(7), update(8, '/help')])
+        poller = self.make_poller()
+
+        self.assertEqual(poller.poll_once('111:SEGREDO'), 2)
+
+        _, kwargs = self.transport.get.call_args
+        self.assertEqual(kwargs['params']['timeout'], 50)
+        self.assertNotIn('offset', kwargs['params'])
+        self.assertGreater(kwargs['timeout'], 50)
+        self.assertEqual(self.commands['111:SEGREDO'].process_update.call_count, 2)
+        # O segredo do token não vai para o arquivo de offsets
+        with open(self.path, encoding='utf-8') as f:
+            self.assertNotIn('SEGREDO', f.read())
+
+        # Após reiniciar, o próximo getUpdates confirma o lote anterior pelo offset
+        self.transport.get.return_value = response([])
+        self.make_poller().poll_once('111:SEGREDO')
+        self.assertEqual(self.transport.get.call_args[1]['params']['offset'], 9)
+
+    def test_updates_are_processed_concurrently(self):
+        barrier = threading.Barrier(2, timeout=2)
+        self.transport.get.return_value = response([update(1), update(2)])
+        poller = self.make_poller()
+        self.commands['111:SEGREDO'].process_update.side_effect = lambda u: barrier.wait()
+
+        poller.poll_once('111:SEGREDO')
+
+        self.assertEqual(poller.metrics()['commands_failed'], 0)
+
+    def test_failed_command_does_not_block_offset(self):
+        self.transport.get.return_value = response([update(5)])
+        poller = self.make_poller()
+        self.commands['111:SEGREDO'].process_update.side_effect = RuntimeError('falhou')
+
+        poller.poll_once('111:SEGREDO')
+
+        self.assertEqual(poller.offsets.get('bot111'), {'offset': 6})
+        self.assertEqual(poller.metrics()['commands_failed'], 1)
+
+    def test_http_error_raises(self):
+        self.transport.get.return_value = response([], status_code=409)
+        with self.assertRaises(UpdatePollError):
+            self.make_poller().poll_once('111:SEGREDO')
+
+    def test_conflict_deletes_webhook_once(self):
+        self.transport.get.return_value = response([], status_code=409)
+        poller = self.make_poller()
+
+        for _ in range(3):
+            with self.assertRaises(UpdatePollError):
+                poller.poll_once('111:SEGREDO')
+
+        self.assertEqual(self.commands['111:SEGREDO'].delete_webhook.call_count, 1)
+        self.transport.get.return_value = response([update(3)])
+        self.assertEqual(poller.poll_once('111:SEGREDO'), 1)
+
+    def test_offsets_log_their_own_label(self):
+        self.transport.get.return_value = response([update(1)])
+        self.make_poller().poll_once('111:SEGREDO')
+        with self.assertLogs('wegnots.uid_checkpoint', 'INFO') as logs:
+            self.make_poller()
+        self.assertIn('offsets do Telegram', logs.output[0])
+        self.assertNotIn('IMAP', logs.output[0])
+
+    def test_each_token_is_polled(self):
+        polled = set()
+        done = threading.Event()
+
+        def get(url, **kwargs):
+            polled.add(url.split('/bot')[1].split('/')[0])
+            if len(polled) == 2:
+                done.set()
+            return response([])
+
+        self.transport.get.side_effect = get
+        poller = self.make_poller(['111:A', '222:B', '111:A', None])
+        poller.start()
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(polled, {'111:A', '222:B'})
+
+
+
+class TestDestinationTokens(unittest.TestCase):
+    def test_destination_only_bot_is_polled(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        with open(os.path.join(tmpdir.name, 'config.ini'), 'w', encoding='utf-8') as f:
+            f.write("[TELEGRAM]\ntoken = 111:PADRAO\nchat_id = 1\n\n"
+                    "[IMAP_a@example.com]\nserver = imap.example.com\nport = 993\nusername = a@example.com\n"
+                    "password = x\nis_active = True\n"
+                    'notification_destinations = {"Secbot": {"chat_id": "10", "token": "333:DESTINO"}}\n')
+        cwd = os.getcwd()
+        os.chdir(tmpdir.name)
+        self.addCleanup(os.chdir, cwd)
+        import main
+        imap_configs, _, _ = main.load_config()
+        handler = EmailHandler(MagicMock(default_token='111:PADRAO'),
+                               checkpoint_store=CheckpointStore(os.path.join(tmpdir.name, 'c.json')))
+        handler.setup_connections(imap_configs)
+        transport = MagicMock()
+        transport.get.return_value = response([update(1)])
+        commands = {}
+
+        def factory(token):
+            commands[token] = MagicMock()
+            return commands[token]
+
+        poller = UpdatePoller(handler.get_bot_tokens(), offsets_path=os.path.join(tmpdir.name, 'o.json'),
+                              commands_factory=factory, transport=transport)
+        self.addCleanup(poller.stop)
+
+        self.assertEqual(poller.tokens, ['111:PADRAO', '333:DESTINO'])
+        poller.poll_once('333:DESTINO')
+        self.assertIn('/bot333:DESTINO/', transport.get.call_args[0][0])
+        self.assertEqual(commands['333:DESTINO'].process_update.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import http.client
+import threading
+import unittest
+from unittest.mock import MagicMock
+import requests
+from app.core.webhook_server import MAX_UPDATE_SIZE, SECRET_TOKEN_HEADER, WebhookServer, webhook_path
+
+
+class TestWebhookServer(unittest.TestCase):
+    def setUp(self):
+        self.commands = {}
+        self.processed = threading.Event()
+
+        def factory(token):
+            self.commands[token] = MagicMock()
+            self.commands[token].process_update.side_effect = lambda update: self.processed.set()
+            return self.commands[token]
+
+        self.server = WebhookServer(['111:A', '222:B'], secret='segredo', host='127.0.0.1', port=0,
+                                    commands_factory=factory)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.base = f"http://127.0.0.1:{self.server.port}"
+
+    def post(self, token, update, secret='segredo', path=None):
+        return requests.post(self.base + (path or webhook_path(token)), json=update,
+                             headers={SECRET_TOKEN_HEADER: secret}, timeout=5)
+
+    def test_update_is_routed_to_its_bot(self):
+        update = {'update_id': 1, 'message': {'text': '/status', 'chat': {'id': 42}}}
+
+        self.assertEqual(self.post('222:B', update).status_code, 200)
+
+        self.assertTrue(self.processed.wait(2))
+        self.commands['222:B'].process_update.assert_called_once_with(update)
+        self.commands['111:A'].process_update.assert_not_called()
+        self.assertNotIn('222:B', webhook_path('222:B'))
+
+    def test_ack_does_not_wait_for_processing(self):
+        release = threading.Event()
+        self.commands['111:A'].process_update.side_effect = lambda update: release.wait(5)
+        self.addCleanup(release.set)
+
+        response = self.post('111:A', {'update_id': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(response.elapsed.total_seconds(), 1)
+
+    def test_wrong_secret_and_unknown_path_are_rejected(self):
+        self.assertEqual(self.post('111:A', {'update_id': 1}, secret='errado').status_code, 403)
+        self.assertEqual(self.post('111:A', {'update_id': 1}, path='/telegram/outro').status_code, 404)
+        self.assertEqual(self.server.metrics()['rejected'], 1)
+        self.commands['111:A'].process_update.assert_not_called()
+
+    def test_invalid_content_length_is_rejected(self):
+        for length in ('abc', '-5', str(MAX_UPDATE_SIZE + 1)):
+            connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=5)
+            self.addCleanup(connection.close)
+            connection.putrequest('POST', webhook_path('111:A'))
+            connection.putheader(SECRET_TOKEN_HEADER, 'segredo')
+            connection.putheader('Content-Length', length)
+            connection.endheaders(b'{"update_id": 1}')
+            status = connection.getresponse().status
+            self.assertEqual(status, 413 if length.isdigit() else 400, length)
+
+        self.assertEqual(self.server.metrics()['rejected'], 3)
+        self.commands['111:A'].process_update.assert_not_called()
+
+    def test_redelivered_update_is_processed_once(self):
+        self.post('111:A', {'update_id': 5})
+        self.post('111:A', {'update_id': 5})
+
+        self.assertTrue(self.processed.wait(2))
+        self.assertEqual(self.server.metrics()['duplicates'], 1)
+
+    def test_register_sets_webhook_with_secret(self):
+        self.commands['111:A'].set_webhook.return_value = True
+        self.commands['222:B'].set_webhook.return_value = False
+
+        self.assertEqual(self.server.register('https://monitor.example.com/'), 1)
+
+        self.commands['111:A'].set_webhook.assert_called_once_with(
+            'https://monitor.example.com' + webhook_path('111:A'), secret_token='segredo')
+
+
+if __name__ == '__main__':
+    unittest.main()